@@ -10,6 +10,10 @@ const SUPABASE_KEY = "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJpc3MiOiJzdXBhYmFzZ
 // ★重要: あなたの最新のCloud Run URLに更新済み
 const CALC_API_URL = "https://rakushift-calc-874112922898.asia-northeast1.run.app/generate";
 const CHECK_API_URL = "https://rakushift-calc-874112922898.asia-northeast1.run.app/check";
+const AUDIT_API_URL = "https://rakushift-calc-874112922898.asia-northeast1.run.app/audit";
+const COLUMNAR_MEDIA_TYPE = "application/vnd.rakushift.columnar+json";
+// 生成リクエストの待ち時間上限。サーバーにも少し短い期限を渡し、諦めた計算を止めさせる
+const GENERATE_TIMEOUT_MS = 180000;
 
 // Gemini API Endpoint
 const GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models";
@@ -255,25 +259,55 @@ const API = {
             console.log("Step 1: Requesting Python Optimization Engine...");
             let pythonResult = null;
             
+            const controller = new AbortController();
+            const timer = setTimeout(() => controller.abort(), GENERATE_TIMEOUT_MS);
             try {
                 // FastAPIとの通信のため、Content-Typeは application/json が必須
                 const res = await fetch(CALC_API_URL, {
                     method: 'POST',
                     credentials: 'omit', 
-                    headers: { 'Content-Type': 'application/json' }, // ★ここを修正しました
-                    body: JSON.stringify(payload)
+                    headers: {
+                        'Content-Type': 'application/json', // ★ここを修正しました
+                        // 列指向で受け取る (gzip/brotli の展開はブラウザが行う)
+                        'Accept': COLUMNAR_MEDIA_TYPE
+                    },
+                    body: JSON.stringify({ deadline_seconds: GENERATE_TIMEOUT_MS / 1000 - 5, ...payload }),
+                    signal: controller.signal
                 });
                 
+                if (res.status === 429 || res.status === 503) {
+                    // 受付制御で断られた場合は Retry-After を案内する
+                    const retry = res.headers.get('Retry-After') || '30';
+                    return { status: "error", message: `計算サーバーが混雑しています。${retry}秒後に再度お試しください。` };
+                }
                 if (!res.ok) {
                     throw new Error(`Python Server Error: ${res.statusText}`);
                 }
                 
                 pythonResult = await res.json();
+                if (pythonResult.shifts && !Array.isArray(pythonResult.shifts)) {
+                    pythonResult.shifts = this.decodeShiftBlock(pythonResult.shifts);
+                }
+                // 別解 (payload.alternatives を指定した場合) も列指向で届く
+                (pythonResult.alternatives || []).forEach(alt => {
+                    if (alt.shifts && !Array.isArray(alt.shifts)) {
+                        alt.shifts = this.decodeShiftBlock(alt.shifts);
+                    }
+                });
+                result.alternatives = pythonResult.alternatives || [];
                 console.log("Python Engine Result:", pythonResult);
                 
-                if (pythonResult.status === 'success' && Array.isArray(pythonResult.shifts)) {
+                if (pythonResult.status === 'success' && pythonResult.persisted) {
+                    // エンジンが DB に保存済み。件数などの要約だけが返る
+                    result.persisted = pythonResult.persisted;
+                    result.audit = pythonResult.audit || null;
+                    result.mode = "python_optimized";
+                    return result;
+                } else if (pythonResult.status === 'success' && Array.isArray(pythonResult.shifts)) {
                     result.shifts = pythonResult.shifts;
                     result.mode = "python_optimized";
+                    // 人数・週上限・休憩などのルール監査はサーバー側で済んでいる
+                    result.audit = pythonResult.audit || null;
                 } else {
                     // 解なしの場合でもエラーにせず空リストを許容
                     if(pythonResult.status === 'success' && pythonResult.mode === 'math_failed'){
@@ -286,29 +320,42 @@ const API = {
 
             } catch (pythonError) {
                 console.error("Step 1 Failed:", pythonError);
+                if (pythonError.name === 'AbortError') {
+                    return { status: "error", message: "計算がタイムアウトしました。期間を短くして再度お試しください。" };
+                }
                 return { status: "error", message: "Python計算サーバーへの接続に失敗しました。" };
+            } finally {
+                clearTimeout(timer);
             }
 
             // =========================================================
-            // STEP 2: Gemini APIによる監査と修正 (Gemini 2.5 Flash Preview相当)
+            // STEP 2: 店舗ルール(自由記述)だけ Gemini で確認する
             // =========================================================
-            // APIキー設定がある場合のみ実行
-            const geminiKey = payload.config.gemini_api_key || payload.config.openai_api_key;
+            // 数値で表せるルールはサーバーの監査で確認済みなので、
+            // APIキーと shop_rules_text がある場合のみ実行する
+            // contract_id だけの軽量リクエスト (エンジンが DB から読む) では
+            // スタッフ情報を持っていないので行わない
+            const config = payload.config || {};
+            const geminiKey = config.gemini_api_key || config.openai_api_key;
+            const shopRules = (config.shop_rules_text || "").trim();
             
-            if (geminiKey) {
-                console.log("Step 2: Requesting Gemini AI Audit & Fix...");
+            if (geminiKey && shopRules && payload.staff_list && result.shifts.length > 0) {
+                console.log("Step 2: Requesting Gemini shop-rules check...");
                 
-                const auditResult = await this.checkShiftsWithGemini(geminiKey, payload, result.shifts);
+                const aiShifts = await this.checkShiftsWithGemini(geminiKey, payload, result.shifts);
+                // Gemini の修正で人数や週上限が崩れていないか、サーバーで再監査する
+                const audited = aiShifts ? await this.auditShifts(payload, aiShifts) : null;
                 
-                if (auditResult && Array.isArray(auditResult)) {
-                    console.log("Gemini Audit Completed. Fixed Shifts:", auditResult.length);
-                    result.shifts = auditResult;
-                    result.mode = "python_optimized_plus_gemini_audit";
+                if (audited && Array.isArray(audited.shifts)) {
+                    console.log("Gemini Check Completed. Shifts:", audited.shifts.length);
+                    result.shifts = audited.shifts;
+                    result.audit = audited.audit;
+                    result.mode = "python_optimized_plus_gemini_rules";
                 } else {
-                    console.warn("Gemini Audit failed or returned invalid format. Using Python result.");
+                    console.warn("Gemini check failed or returned invalid format. Using Python result.");
                 }
             } else {
-                console.log("Skipping Step 2 (No API Key provided)");
+                console.log("Skipping Step 2 (No API Key or shop rules)");
             }
 
             return result;
@@ -319,24 +366,68 @@ const API = {
         }
     },
 
-    // Gemini API 呼び出し (監査・修正用)
+    // 列指向のシフトブロック (辞書 + 整数インデックス配列) を従来のオブジェクト配列に戻す
+    decodeShiftBlock(block) {
+        const pad = (n) => String(n).padStart(2, '0');
+        const toTime = (m) => `${pad(Math.floor(m / 60))}:${pad(m % 60)}`;
+        const shifts = new Array(block.staff.length);
+        for (let i = 0; i < block.staff.length; i++) {
+            const s = {
+                staff_id: block.staff_ids[block.staff[i]],
+                date: block.dates[block.date[i]],
+                start_time: toTime(block.start[i]),
+                end_time: toTime(block.end[i]),
+                break_minutes: block.break[i]
+            };
+            if (block.overtime_hours && block.overtime_hours[i]) {
+                s.overtime = true;
+                s.overtime_hours = block.overtime_hours[i];
+            }
+            shifts[i] = s;
+        }
+        return shifts;
+    },
+
+    // サーバー側のルール監査・修復 (/audit)
+    async auditShifts(payload, shifts) {
+        try {
+            const res = await fetch(AUDIT_API_URL, {
+                method: 'POST',
+                credentials: 'omit',
+                headers: { 'Content-Type': 'application/json', 'Accept': COLUMNAR_MEDIA_TYPE },
+                body: JSON.stringify({ ...payload, shifts })
+            });
+            if (!res.ok) return null;
+            const data = await res.json();
+            if (data.status !== 'success') return null;
+            if (data.shifts && !Array.isArray(data.shifts)) {
+                data.shifts = this.decodeShiftBlock(data.shifts);
+            }
+            return data;
+        } catch (e) {
+            console.error("Audit failed:", e);
+            return null;
+        }
+    },
+
+    // Gemini API 呼び出し (店舗ルールの確認用)
     async checkShiftsWithGemini(apiKey, payload, originalShifts) {
         const modelName = payload.config.gemini_model || "gemini-1.5-flash"; 
         const url = `${GEMINI_API_URL}/${modelName}:generateContent?key=${apiKey}`;
         
         const prompt = `
 あなたは熟練したシフト管理者AIです。
-以下の条件（スタッフ情報、店舗設定、希望休）に基づき、
-Pythonシステムによって生成された「一次シフト案」を監査し、
-条件違反や不合理な点があれば修正して、最終的な「完全なシフト表」を出力してください。
+Pythonシステムによって生成された「一次シフト案」を、下記の【店舗ルール】に照らして確認し、
+店舗ルールに反する点だけを最小限修正して、最終的な「完全なシフト表」を出力してください。
 
 ### 制約条件
-1. スタッフの希望休 (unavailable_dates) には絶対に入れてはいけない。
-2. 契約上の週最大日数 (max_days_week) を超えてはいけない。
-3. 1日の最大時間 (max_hours_day) を超えてはいけない。
-4. 店舗の必要人数 (staff_req) を可能な限り満たすこと。
-5. 固定給（月給）スタッフは優先的に週5日程度配置すること。
-6. **重要**: 出力は純粋なJSON配列形式のみ。マークダウン記法や解説は不要。
+1. 必要人数・希望休・週最大日数・1日の最大時間・休憩は、システム側で確認済み。
+   店舗ルールに必要な場合を除き、シフトを追加・削除しないこと。
+2. スタッフの希望休 (unavailable_dates) には絶対に入れてはいけない。
+3. **重要**: 出力は純粋なJSON配列形式のみ。マークダウン記法や解説は不要。
+
+【店舗ルール】
+${payload.config.shop_rules_text}
 
 ### 入力データ
 【スタッフリスト】
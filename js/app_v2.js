@@ -3390,13 +3390,49 @@ const app = {
                 this.state.config.organization_id = this.state.organization_id;
             }
 
-            const payload = {
-                staff_list: this.state.staff,
-                config: this.state.config,
-                dates: dates,
-                requests: this.state.requests || [],
-                mode: 'auto'
+            // 確定済みシフト(過去分・開始日前6日分・空き枠のみモードでの既存分)はエンジン側で固定扱いにする
+            const toKey = function(d) {
+                return d.getFullYear() + '-' + String(d.getMonth() + 1).padStart(2, '0') + '-' + String(d.getDate()).padStart(2, '0');
             };
+            const todayKey = toKey(today);
+            let payload;
+            if (this.state.config.engine_load) {
+                // 計算エンジンが DB から staff / config / 承認済み申請 / 確定済みシフトを読む
+                // (読み込みには contract_id と店舗パスワードの組が要る)
+                payload = {
+                    contract_id: this.state.config.contract_id,
+                    shop_password: this.state.config.shop_password,
+                    start_date: dates[0],
+                    end_date: dates[dates.length - 1],
+                    keep_existing: targetType === 'empty_only',
+                    mode: 'auto'
+                };
+            } else {
+                payload = {
+                    staff_list: this.state.staff,
+                    config: this.state.config,
+                    // エンジンが DB へ保存するときはテナントの確認に使う
+                    contract_id: this.state.config.contract_id,
+                    shop_password: this.state.config.shop_password,
+                    dates: dates,
+                    requests: this.state.requests || [],
+                    mode: 'auto'
+                };
+                const contextStart = new Date(startDate);
+                contextStart.setDate(contextStart.getDate() - 6);
+                const contextKey = toKey(contextStart);
+                payload.fixed_shifts = this.state.shifts.filter(function(s) {
+                    if (s.date < contextKey) return false;
+                    if (!dates.includes(s.date)) return s.date < dates[0];
+                    return s.date < todayKey || targetType === 'empty_only';
+                }).map(function(s) {
+                    return { staff_id: s.staff_id, date: s.date, start_time: s.start_time, end_time: s.end_time, break_minutes: s.break_minutes || 0 };
+                });
+            }
+            payload.freeze_before = todayKey;
+            // 計算エンジンが DB に直接書き込む設定なら、保存(削除→登録)はエンジン側で1トランザクションで行う
+            payload.persist = !!this.state.config.engine_persist;
+            payload.organization_id = this.state.organization_id;
 
             // === STEP 2: 事前チェック ===
             if (stepEl) stepEl.textContent = 'ステップ 2/4: 人員充足チェック中...';
@@ -3443,10 +3479,7 @@ const app = {
             }
 
             // === STEP 3: 削除処理 ===
-            if (targetType === 'reset_all') {
-                if (stepEl) stepEl.textContent = 'ステップ 3/4: 既存シフト削除中...';
-                if (barEl) barEl.style.width = '30%';
-
+            const deleteExisting = async () => {
                 const uuidRegex = /^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$/i;
                 const shiftsToDelete = this.state.shifts.filter(function(s) {
                     return dates.includes(s.date) && new Date(s.date) >= today && s.id && uuidRegex.test(s.id);
@@ -3457,6 +3490,11 @@ const app = {
                 this.state.shifts = this.state.shifts.filter(function(s) {
                     return !(dates.includes(s.date) && new Date(s.date) >= today);
                 });
+            };
+            if (targetType === 'reset_all' && !payload.persist) {
+                if (stepEl) stepEl.textContent = 'ステップ 3/4: 既存シフト削除中...';
+                if (barEl) barEl.style.width = '30%';
+                await deleteExisting();
             }
 
             // === STEP 4: シフト生成 ===
@@ -3474,8 +3512,25 @@ const app = {
             console.log("Server Response:", result);
             if (barEl) barEl.style.width = '80%';
 
-            if (result.status === 'success' && result.shifts) {
+            if (result.status === 'success' && result.persisted) {
+                // エンジンが保存済みなので、対象期間のシフトだけ読み直す
+                const saved = await API.list('shifts', {
+                    organization_id: 'eq.' + this.state.organization_id,
+                    and: '(date.gte.' + dates[0] + ',date.lte.' + dates[dates.length - 1] + ')'
+                });
+                this.state.shifts = this.state.shifts.filter(function(s) { return !dates.includes(s.date); })
+                    .concat(saved.data || []);
+                if (barEl) barEl.style.width = '100%';
+                this.renderCurrentView();
+                this.calculateMonthlyStats();
+                this.showToast(result.persisted.inserted + '件のシフトを生成・保存しました (Mode: ' + result.mode + ')', 'success');
+            } else if (result.status === 'success' && result.shifts) {
                 const newShifts = result.shifts;
+                if (result.persist_error) {
+                    // エンジンでの保存に失敗したので、通常どおり削除してから保存する
+                    console.warn('Engine persist failed:', result.persist_error);
+                    if (targetType === 'reset_all') await deleteExisting();
+                }
                 this.showToast(newShifts.length + '件のシフト生成完了。保存中...', 'info');
 
                 const existing = this.state.shifts.filter(function(s) { return dates.includes(s.date); });
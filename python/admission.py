@@ -0,0 +1,266 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from cancel import Cancelled
+
+# ソルバー実行枠の受付制御
+#   - 全体の同時ソルブ数は CPU コア数とメモリから決める
+#   - テナント(contract_id)ごとに同時実行+待ちの上限を設ける
+#   - 待ち行列はテナント単位のラウンドロビンで、大口テナントが枠を独占しない
+#   - /check は別枠で、長いソルブの待ちに巻き込まれない
+#   - シナリオ・複数店舗のプロセスプールは、リクエストの1枠に加えて空き枠だけを借りる
+#   - 受け付けられない場合は即座に Rejected(429/503, Retry-After) を返す
+#   - 待ち中にキャンセル(切断・期限切れ)されたら列から外して Cancelled を送出する
+
+
+class Rejected(Exception):
+    def __init__(self, status, message, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.retry_after = retry_after
+
+
+def _available_memory():
+    for path in ("/sys/fs/cgroup/memory.max",
+                 "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                raw = f.read().strip()
+            if raw.isdigit() and int(raw) < (1 << 60):
+                return int(raw)
+        except OSError:
+            pass
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def default_max_solvers():
+    env = os.environ.get("RAKUSHIFT_MAX_SOLVERS")
+    if env:
+        return max(1, int(env))
+    cores = os.cpu_count() or 1
+    per_solve = int(os.environ.get("RAKUSHIFT_SOLVE_MEMORY_MB", "512")) << 20
+    mem = _available_memory()
+    by_mem = max(1, mem // per_solve) if mem else cores
+    return max(1, min(cores, by_mem))
+
+
+class AdmissionController:
+
+    def __init__(self, max_solvers=None, per_tenant=None, max_queue=None,
+                 max_checks=None):
+        self.max_solvers = max_solvers or default_max_solvers()
+        self.per_tenant = per_tenant or int(
+            os.environ.get("RAKUSHIFT_TENANT_SOLVES", "2"))
+        self.max_queue = max_queue or int(
+            os.environ.get("RAKUSHIFT_MAX_QUEUE", "32"))
+        self.max_checks = max_checks or int(os.environ.get(
+            "RAKUSHIFT_MAX_CHECKS", str(4 * (os.cpu_count() or 1))))
+
+        self.running = 0
+        self.running_by_tenant = {}
+        self.waiting = {}          # tenant -> deque of futures
+        self.rotation = deque()    # 待ちのあるテナントの順番
+        self.checks_running = 0
+        self._check_sem = None
+
+        self.avg_solve_seconds = 10.0
+        self.counters = {
+            "admitted": 0,
+            "completed": 0,
+            "rejected_tenant_quota": 0,
+            "rejected_queue_full": 0,
+            "checks": 0,
+            "wait_seconds_total": 0.0,
+            # キャンセルされた処理 (理由別) と、それまでに使っていた秒数
+            "cancelled_disconnect": 0,
+            "cancelled_deadline": 0,
+            "cancelled_in_queue": 0,
+            "cancelled_seconds_total": 0.0,
+            # シナリオ・複数店舗のワーカーが空き枠を借りた回数
+            "borrowed": 0,
+        }
+
+    # ---------- 指標 ----------
+
+    def queue_depth(self):
+        return sum(len(q) for q in self.waiting.values())
+
+    def retry_after(self, ahead=None):
+        if ahead is None:
+            ahead = self.queue_depth()
+        waves = (ahead + 1) / float(self.max_solvers)
+        return max(1, int(math.ceil(self.avg_solve_seconds * waves)))
+
+    def metrics(self):
+        return {
+            "max_solvers": self.max_solvers,
+            "per_tenant": self.per_tenant,
+            "max_queue": self.max_queue,
+            "running": self.running,
+            "queue_depth": self.queue_depth(),
+            "queued_by_tenant": {t: len(q) for t, q in self.waiting.items()},
+            "running_by_tenant": dict(self.running_by_tenant),
+            "checks_running": self.checks_running,
+            "avg_solve_seconds": round(self.avg_solve_seconds, 2),
+            "counters": dict(self.counters),
+        }
+
+    # ---------- ソルブ枠 ----------
+
+    def _tenant_load(self, tenant):
+        return (self.running_by_tenant.get(tenant, 0)
+                + len(self.waiting.get(tenant, ())))
+
+    @asynccontextmanager
+    async def solve_slot(self, tenant, token=None):
+        if self._tenant_load(tenant) >= self.per_tenant:
+            self.counters["rejected_tenant_quota"] += 1
+            raise Rejected(429, "同時に実行できる生成数の上限に達しています",
+                           self.retry_after(self._tenant_load(tenant)))
+
+        queued_at = time.perf_counter()
+        if self.running >= self.max_solvers or self.queue_depth():
+            if self.queue_depth() >= self.max_queue:
+                self.counters["rejected_queue_full"] += 1
+                raise Rejected(503, "計算サーバーが混雑しています",
+                               self.retry_after())
+            fut = asyncio.get_running_loop().create_future()
+            q = self.waiting.setdefault(tenant, deque())
+            if not q:
+                self.rotation.append(tenant)
+            q.append(fut)
+            if token is not None:
+                loop = asyncio.get_running_loop()
+                token.on_cancel(
+                    lambda: loop.call_soon_threadsafe(_cancel_waiter, fut))
+            try:
+                await fut
+            except BaseException:
+                if not fut.done() or fut.cancelled():
+                    self._drop_waiter(tenant, fut)
+                else:
+                    # 枠を受け取った直後にキャンセルされたので次へ渡す
+                    self._release(tenant)
+                if token is not None and token.reason is not None:
+                    self.counters["cancelled_in_queue"] += 1
+                    raise Cancelled(token.reason)
+                raise
+        else:
+            self._take(tenant)
+
+        self.counters["wait_seconds_total"] += time.perf_counter() - queued_at
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            # 打ち切られた処理は所要時間の見積もりに混ぜない
+            if token is None or token.reason is None:
+                self.avg_solve_seconds = (0.8 * self.avg_solve_seconds
+                                          + 0.2 * elapsed)
+            self.counters["completed"] += 1
+            self._release(tenant)
+
+    def borrow(self, tenant):
+        # 1件のリクエストがプロセスプールで並べる2件目以降のワーカーの枠
+        return Borrowed(self, tenant)
+
+    def record_cancel(self, reason, seconds):
+        key = "cancelled_{}".format(reason)
+        if key in self.counters:
+            self.counters[key] += 1
+        self.counters["cancelled_seconds_total"] += seconds
+
+    def _take(self, tenant):
+        self.running += 1
+        self.running_by_tenant[tenant] = self.running_by_tenant.get(tenant, 0) + 1
+        self.counters["admitted"] += 1
+
+    def _release(self, tenant):
+        self.running -= 1
+        left = self.running_by_tenant.get(tenant, 1) - 1
+        if left > 0:
+            self.running_by_tenant[tenant] = left
+        else:
+            self.running_by_tenant.pop(tenant, None)
+        self._dispatch()
+
+    def _dispatch(self):
+        # 空いた枠をテナントのラウンドロビンで渡す
+        while self.running < self.max_solvers and self.rotation:
+            tenant = self.rotation.popleft()
+            q = self.waiting.get(tenant)
+            if not q:
+                self.waiting.pop(tenant, None)
+                continue
+            fut = q.popleft()
+            if q:
+                self.rotation.append(tenant)
+            else:
+                self.waiting.pop(tenant, None)
+            if fut.cancelled():
+                continue
+            self._take(tenant)
+            fut.set_result(True)
+
+    def _drop_waiter(self, tenant, fut):
+        q = self.waiting.get(tenant)
+        if q and fut in q:
+            q.remove(fut)
+            if not q:
+                self.waiting.pop(tenant, None)
+                if tenant in self.rotation:
+                    self.rotation.remove(tenant)
+
+    # ---------- /check 枠 ----------
+
+    @asynccontextmanager
+    async def check_slot(self):
+        if self._check_sem is None:
+            self._check_sem = asyncio.Semaphore(self.max_checks)
+        self.counters["checks"] += 1
+        async with self._check_sem:
+            self.checks_running += 1
+            try:
+                yield
+            finally:
+                self.checks_running -= 1
+
+
+class Borrowed:
+    # シナリオ・複数店舗のワーカー用の追加の枠。リクエスト自身の枠とは別に、
+    # 空きがあって待っているリクエストがないときだけ1つずつ借り、終わったらすぐ返す。
+    # 借りた枠もテナントの実行数に数える (待ちより先に枠を取ることはない)
+
+    def __init__(self, controller, tenant):
+        self.controller = controller
+        self.tenant = tenant
+
+    def try_take(self):
+        c = self.controller
+        if c.running >= c.max_solvers or c.queue_depth():
+            return False
+        c.running += 1
+        c.running_by_tenant[self.tenant] = c.running_by_tenant.get(self.tenant, 0) + 1
+        c.counters["borrowed"] += 1
+        return True
+
+    def release(self):
+        self.controller._release(self.tenant)
+
+
+def _cancel_waiter(fut):
+    if not fut.done():
+        fut.cancel()
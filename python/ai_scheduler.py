@@ -1,52 +1,299 @@
-import google.generativeai as genai
+import asyncio
+import hashlib
 import json
+import os
 import time
+import urllib.request
+from collections import OrderedDict
+from datetime import datetime
+
+from staff_table import ng_dates_by_staff
+
+# google-generativeai はAPIサーバーでは使わないため、利用時にのみ読み込む
+genai = None
+
+# コスト最優先: Gemini 2.0 Flash Lite (Preview/Exp)
+# ※正式名称が決まるまでは 'gemini-2.0-flash-exp' 等を使用
+MODEL_NAME = 'gemini-2.0-flash-exp'
+# SDK を入れていない環境 (計算エンジン) から REST で呼ぶときの接続先
+GEMINI_BASE_URL = 'https://generativelanguage.googleapis.com'
+TEMPERATURE = 0.2  # 創造性より正確性重視
+
+# 応答キャッシュ: プロンプトのハッシュ -> 応答テキスト
+# 同じ入力の再試行・再生成ではモデルを呼ばない
+_CACHE = OrderedDict()
+CACHE_SIZE = 256
+
 
 class AIShiftScheduler:
-    def __init__(self, api_key):
-        genai.configure(api_key=api_key)
-        # コスト最優先: Gemini 2.0 Flash Lite (Preview/Exp)
-        # ※正式名称が決まるまでは 'gemini-2.0-flash-exp' 等を使用
-        self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
+    # base_url を指定すると SDK ではなく generateContent の REST を直接呼ぶ
+    # (ローカルのスタブサーバー ai_stub_server.py で試験するため)
+    def __init__(self, api_key, base_url=None, model_name=MODEL_NAME,
+                 concurrency=4, retries=2, timeout=60, cache_dir=None):
+        self.api_key = api_key
+        self.base_url = (base_url or os.environ.get("RAKUSHIFT_AI_BASE_URL")
+                         or "").rstrip("/")
+        self.model_name = model_name
+        self.concurrency = max(1, int(concurrency))
+        self.retries = int(retries)
+        self.timeout = timeout
+        self.cache_dir = cache_dir or os.environ.get("RAKUSHIFT_AI_CACHE_DIR")
+        self.stats = {"calls": 0, "cache_hits": 0, "retries": 0}
+        self.last_report = {}
+
+        self.model = None
+        if not self.base_url:
+            global genai
+            if genai is None:
+                import google.generativeai as _genai
+                genai = _genai
+            genai.configure(api_key=api_key)
+            self.model = genai.GenerativeModel(model_name)
+
+    def generate(self, staff_list, config, dates, requests, chunked=False):
+        if chunked:
+            return asyncio.run(
+                self.generate_chunked(staff_list, config, dates, requests))
 
-    def generate(self, staff_list, config, dates, requests):
         # プロンプトの構築
         prompt = self._build_prompt(staff_list, config, dates, requests)
-        
+
         try:
             # Geminiに問い合わせ
-            response = self.model.generate_content(
-                prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.2, # 創造性より正確性重視
-                    response_mime_type='application/json'
-                )
-            )
-            
-            # JSONパース
-            result = json.loads(response.text)
-            
-            # 配列またはオブジェクト内のshiftsキーから取り出す
-            shifts = result if isinstance(result, list) else result.get("shifts", [])
-            
-            # データ整形 (念のため)
-            cleaned_shifts = []
-            for s in shifts:
-                if "staff_id" in s and "date" in s and "start_time" in s and "end_time" in s:
-                    cleaned_shifts.append(s)
-                    
-            return cleaned_shifts
-
+            return self._complete(prompt)
         except Exception as e:
             print(f"Gemini API Error: {e}")
             raise e
 
+    async def generate_chunked(self, staff_list, config, dates, requests):
+        # 期間を週ごとに分けて並行に問い合わせ、結果をつなげて検証する
+        weeks = _split_by_week(dates)
+        sem = asyncio.Semaphore(self.concurrency)
+        started = time.perf_counter()
+
+        async def run(week):
+            prompt = self._build_prompt(staff_list, config, week, requests)
+            async with sem:
+                return await self._complete_async(prompt)
+
+        results = await asyncio.gather(*(run(w) for w in weeks),
+                                       return_exceptions=True)
+
+        shifts = []
+        failed = []
+        for week, res in zip(weeks, results):
+            if isinstance(res, Exception):
+                print(f"Gemini API Error ({week[0]}~{week[-1]}): {res}")
+                failed.append(week[0])
+                continue
+            in_week = set(week)
+            shifts.extend(s for s in res if s["date"] in in_week)
+        if failed and len(failed) == len(weeks):
+            raise next(r for r in results if isinstance(r, Exception))
+
+        shifts, dropped = self._validate(
+            shifts, staff_list, config, dates, requests)
+        self.last_report = {
+            "chunks": len(weeks),
+            "failed_weeks": failed,
+            "dropped": dropped,
+            "shifts": len(shifts),
+            "elapsed_sec": round(time.perf_counter() - started, 2),
+            **self.stats,
+        }
+        print(f"[AI] {self.last_report}")
+        return shifts
+
+    # ---------- モデル呼び出し ----------
+
+    def _complete(self, prompt):
+        key = self._cache_key(prompt)
+        text = self._cache_get(key)
+        if text is not None:
+            return self._parse(text)
+        for attempt in range(self.retries + 1):
+            try:
+                self.stats["calls"] += 1
+                text = self._request(prompt)
+                shifts = self._parse(text)
+                self._cache_put(key, text)
+                return shifts
+            except Exception:
+                if attempt >= self.retries:
+                    raise
+                self.stats["retries"] += 1
+                time.sleep(0.5 * 2 ** attempt)
+
+    async def _complete_async(self, prompt):
+        key = self._cache_key(prompt)
+        text = self._cache_get(key)
+        if text is not None:
+            return self._parse(text)
+        for attempt in range(self.retries + 1):
+            try:
+                self.stats["calls"] += 1
+                text = await self._request_async(prompt)
+                shifts = self._parse(text)
+                self._cache_put(key, text)
+                return shifts
+            except Exception:
+                if attempt >= self.retries:
+                    raise
+                self.stats["retries"] += 1
+                await asyncio.sleep(0.5 * 2 ** attempt)
+
+    def _request(self, prompt):
+        if self.base_url:
+            return self._post(prompt)
+        response = self.model.generate_content(
+            prompt, generation_config=self._generation_config())
+        return response.text
+
+    async def _request_async(self, prompt):
+        if self.base_url:
+            return await asyncio.to_thread(self._post, prompt)
+        response = await self.model.generate_content_async(
+            prompt, generation_config=self._generation_config())
+        return response.text
+
+    def _generation_config(self):
+        return genai.types.GenerationConfig(
+            temperature=TEMPERATURE,
+            response_mime_type='application/json'
+        )
+
+    def _post(self, prompt):
+        url = f"{self.base_url}/v1beta/models/{self.model_name}:generateContent"
+        body = json.dumps({
+            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+            "generationConfig": {
+                "temperature": TEMPERATURE,
+                "responseMimeType": "application/json",
+            },
+        }).encode("utf-8")
+        req = urllib.request.Request(url, data=body, headers={
+            "Content-Type": "application/json",
+            "x-goog-api-key": self.api_key or "",
+        })
+        with urllib.request.urlopen(req, timeout=self.timeout) as res:
+            data = json.loads(res.read())
+        return data["candidates"][0]["content"]["parts"][0]["text"]
+
+    def _parse(self, text):
+        # JSONパース
+        result = json.loads(text)
+
+        # 配列またはオブジェクト内のshiftsキーから取り出す
+        shifts = result if isinstance(result, list) else result.get("shifts", [])
+
+        # データ整形 (念のため)
+        cleaned_shifts = []
+        for s in shifts:
+            if "staff_id" in s and "date" in s and "start_time" in s and "end_time" in s:
+                cleaned_shifts.append(s)
+
+        return cleaned_shifts
+
+    # ---------- キャッシュ ----------
+
+    def _cache_key(self, prompt):
+        raw = json.dumps([self.model_name, TEMPERATURE, prompt])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _cache_get(self, key):
+        text = _CACHE.get(key)
+        if text is None and self.cache_dir:
+            try:
+                with open(os.path.join(self.cache_dir, key + ".json"),
+                          encoding="utf-8") as f:
+                    text = f.read()
+            except OSError:
+                text = None
+        if text is not None:
+            _CACHE[key] = text
+            _CACHE.move_to_end(key)
+            self.stats["cache_hits"] += 1
+        return text
+
+    def _cache_put(self, key, text):
+        _CACHE[key] = text
+        _CACHE.move_to_end(key)
+        while len(_CACHE) > CACHE_SIZE:
+            _CACHE.popitem(last=False)
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(os.path.join(self.cache_dir, key + ".json"), "w",
+                      encoding="utf-8") as f:
+                f.write(text)
+
+    # ---------- 検証 ----------
+
+    def _validate(self, shifts, staff_list, config, dates, requests):
+        # 週ごとの応答をつないだ結果を、日付・時間・週上限・連勤で検証する
+        staff = {s["id"]: s for s in staff_list}
+        date_set = set(dates)
+        # NG 日はエンジンと同じ判定 (承認済みの off/holiday + unavailable_dates)
+        ng = ng_dates_by_staff(staff_list, requests)
+        dropped = {"unknown": 0, "bad_time": 0, "duplicate": 0,
+                   "off_request": 0, "weekly_limit": 0, "consecutive": 0}
+
+        kept = {}
+        for s in sorted(shifts, key=lambda s: (str(s["date"]), str(s["staff_id"]))):
+            sid, d = s["staff_id"], str(s["date"])
+            if sid not in staff or d not in date_set:
+                dropped["unknown"] += 1
+                continue
+            st, en = _to_minutes(s["start_time"]), _to_minutes(s["end_time"])
+            max_h = float(staff[sid].get("max_hours_day") or 8)
+            if st is None or en is None or st >= en or (en - st) / 60.0 > max_h:
+                dropped["bad_time"] += 1
+                continue
+            if (sid, d) in kept:
+                dropped["duplicate"] += 1
+                continue
+            if d in ng[sid]:
+                dropped["off_request"] += 1
+                continue
+            kept[(sid, d)] = {
+                "staff_id": sid, "date": d,
+                "start_time": s["start_time"], "end_time": s["end_time"],
+                "break_minutes": int(s.get("break_minutes") or 0),
+            }
+
+        result = []
+        by_staff = {}
+        for (sid, d), s in kept.items():
+            by_staff.setdefault(sid, []).append(s)
+        for sid, items in by_staff.items():
+            max_days = int(staff[sid].get("max_days_week") or 5)
+            per_week = {}
+            run = 0
+            prev = None
+            for s in sorted(items, key=lambda s: s["date"]):
+                dt = datetime.strptime(s["date"], "%Y-%m-%d")
+                wk = dt.isocalendar()[:2]
+                run = run + 1 if prev and (dt - prev).days == 1 else 1
+                if per_week.get(wk, 0) >= max_days:
+                    dropped["weekly_limit"] += 1
+                    continue
+                if run >= 7:
+                    # 週の境目をまたいだ7連勤は後ろの日を落とす
+                    dropped["consecutive"] += 1
+                    run = 0
+                    prev = None
+                    continue
+                per_week[wk] = per_week.get(wk, 0) + 1
+                prev = dt
+                result.append(s)
+        result.sort(key=lambda s: (s["date"], str(s["staff_id"])))
+        return result, dropped
+
     def _build_prompt(self, staff_list, config, dates, requests):
         # データ軽量化（IDと名前、役割、制約のみにする）
         simple_staff = [{
             "id": s["id"], 
-            "name": s["name"], 
-            "role": s["role"],
+            "name": s.get("name"),
+            "role": s.get("role") or "staff",
             "max_hours": s.get("max_hours_day", 8),
             "max_days": s.get("max_days_week", 5)
         } for s in staff_list]
@@ -82,3 +329,20 @@ class AIShiftScheduler:
           {{ "staff_id": "...", "date": "YYYY-MM-DD", "start_time": "HH:MM", "end_time": "HH:MM", "break_minutes": 60 }}
         ]
         """
+
+
+def _split_by_week(dates):
+    # ISO 週 (月曜始まり) ごとに日付を分ける
+    weeks = OrderedDict()
+    for d in sorted(dates):
+        wk = datetime.strptime(d, "%Y-%m-%d").isocalendar()[:2]
+        weeks.setdefault(wk, []).append(d)
+    return list(weeks.values())
+
+
+def _to_minutes(value):
+    try:
+        h, m = str(value).split(":")[:2]
+        return int(h) * 60 + int(m)
+    except (ValueError, TypeError):
+        return None
@@ -0,0 +1,122 @@
+"""
+Gemini generateContent 互換のスタブサーバー (AIShiftScheduler の試験用)
+
+    python ai_stub_server.py --port 8765 --delay 0.5 --fail-rate 0.1
+    AIShiftScheduler("dummy", base_url="http://127.0.0.1:8765")
+
+プロンプトから日付とスタッフを読み取り、決まった並びのシフトを返す。
+GET /stats で受けたリクエスト数と最大同時実行数を返す。
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STATS = {"requests": 0, "failures": 0, "in_flight": 0, "max_in_flight": 0}
+_lock = threading.Lock()
+
+
+def _fake_shifts(prompt):
+    m = re.search(r"following dates: ([0-9,\- ]+)\.", prompt)
+    dates = re.findall(r"\d{4}-\d{2}-\d{2}", m.group(1)) if m else []
+    m = re.search(r"- Staff: (\[.*\])", prompt)
+    staff = json.loads(m.group(1)) if m else []
+    m = re.search(r"Weekend: (\d+)", prompt)
+    per_day = int(m.group(1)) if m else 3
+
+    shifts = []
+    for i, d in enumerate(dates):
+        for k in range(min(per_day, len(staff))):
+            s = staff[(i * per_day + k) % len(staff)]
+            hours = min(8, int(s.get("max_hours") or 8))
+            start = 9 + (k % 2) * 4
+            shifts.append({
+                "staff_id": s["id"], "date": d,
+                "start_time": "{:02d}:00".format(start),
+                "end_time": "{:02d}:00".format(start + hours),
+                "break_minutes": 60 if hours >= 8 else 0,
+            })
+    return shifts
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    delay = 0.0
+    fail_rate = 0.0
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            with _lock:
+                self._send(200, dict(STATS))
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        if not self.path.endswith(":generateContent"):
+            self._send(404, {"error": "not found"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        data = json.loads(self.rfile.read(length) or b"{}")
+        with _lock:
+            STATS["requests"] += 1
+            STATS["in_flight"] += 1
+            STATS["max_in_flight"] = max(STATS["max_in_flight"],
+                                         STATS["in_flight"])
+        try:
+            time.sleep(self.delay)
+            if random.random() < self.fail_rate:
+                with _lock:
+                    STATS["failures"] += 1
+                self._send(500, {"error": {"code": 500,
+                                           "message": "stub failure"}})
+                return
+            prompt = data["contents"][0]["parts"][0]["text"]
+            text = json.dumps(_fake_shifts(prompt), ensure_ascii=False)
+            self._send(200, {"candidates": [{
+                "content": {"role": "model", "parts": [{"text": text}]},
+                "finishReason": "STOP",
+            }]})
+        finally:
+            with _lock:
+                STATS["in_flight"] -= 1
+
+
+def serve(port=0, delay=0.0, fail_rate=0.0):
+    # 別スレッドで起動して (server, base_url) を返す。port=0 なら空きポート
+    handler = type("Handler", (StubHandler,),
+                   {"delay": delay, "fail_rate": fail_rate})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:{}".format(server.server_address[1])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    server, url = serve(args.port, args.delay, args.fail_rate)
+    print("[Stub] listening on {}".format(url))
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import redirect_stdout
+from datetime import datetime
+
+from tenants import date_range
+
+# ダッシュボード用の集計 (人件費・人時・充足率・残業) をサーバー側で行う。
+#   - 賃金と休憩はエンジンと同じ規則 (StaffRecord の時給/給与区分, _get_break_minutes)
+#   - シフトを numpy の配列にして、日・週・月ごとの合計は bincount でまとめて出す
+#   - 祝日割増 (1.25倍) はクライアントと同じく国民の祝日。jpholiday がなければ割増なし
+#   - 結果は (テナント, 期間, 入力の指紋) ごとにキャッシュする
+#   RAKUSHIFT_ANALYTICS_TTL  DB から読んだ結果を使い回す秒数 (既定 60)
+# numpy は集計でだけ使うので、初回利用時に読み込む
+
+np = None
+
+HOLIDAY_PREMIUM = 1.25
+SLOTS_PER_DAY = 96  # 15分 x 96 = 24時間
+CACHE_SIZE = 128
+CACHE_TTL = float(os.environ.get("RAKUSHIFT_ANALYTICS_TTL", "60"))
+
+
+def _load_numpy():
+    global np
+    if np is None:
+        import numpy as _np
+        np = _np
+    return np
+
+
+def _holidays(dates):
+    try:
+        import jpholiday
+    except ImportError:
+        return None
+    return [jpholiday.is_holiday(datetime.strptime(d, "%Y-%m-%d").date())
+            for d in dates]
+
+
+def compute(staff_list, config, shifts, start_date, end_date):
+    from scheduler import ShiftScheduler
+    _load_numpy()
+    started = time.perf_counter()
+    dates = date_range(start_date, end_date)
+    with redirect_stdout(io.StringIO()):
+        sch = ShiftScheduler(staff_list, config, dates)
+    day_index = {d: i for i, d in enumerate(dates)}
+    n_days = len(dates)
+    default_wage = float(config.get("hourly_wage_default") or 1100)
+
+    # ---- シフトを列の配列に ----
+    rows = []
+    for s in shifts:
+        di = day_index.get(str(s.get("date")))
+        st = sch._staff_by_id.get(s.get("staff_id"))
+        if di is None or st is None:
+            continue
+        a = sch._to_minutes(s.get("start_time"))
+        b = sch._to_minutes(s.get("end_time"))
+        if b <= a:
+            b += 24 * 60  # 日またぎ
+        brk = s.get("break_minutes")
+        if brk is None:
+            brk = sch._get_break_minutes((b - a) / 60.0)
+        wage = (st.wage if st.raw.get("hourly_wage") else default_wage) \
+            if st.hourly else 0.0
+        rows.append((di, a, b, brk, wage, st.max_hours))
+
+    table = np.array(rows, dtype=np.float64).reshape(-1, 6)
+    day = table[:, 0].astype(np.int64)
+    start, end, brk = table[:, 1], table[:, 2], table[:, 3]
+    wage, max_hours = table[:, 4], table[:, 5]
+
+    holidays = _holidays(dates)
+    premium = np.ones(n_days)
+    if holidays is not None:
+        premium[np.array(holidays, dtype=bool)] = HOLIDAY_PREMIUM
+
+    span = (end - start) / 60.0
+    hours = np.maximum(span - brk / 60.0, 0.0)
+    cost = hours * wage * premium[day]
+    overtime = np.maximum(span - max_hours, 0.0)
+
+    def per_day(weights):
+        return np.bincount(day, weights=weights, minlength=n_days)
+
+    daily_cost = per_day(cost)
+    daily_hours = per_day(hours)
+    daily_overtime = per_day(overtime)
+    daily_shifts = np.bincount(day, minlength=n_days)
+
+    # ---- 充足率: 15分枠の (必要人数, 実人数) を 日 x 96 の行列で ----
+    # (スロットが15分より長い店は、スロットが掛かる15分枠すべてに同じ人数を入れる)
+    required = np.zeros((n_days, SLOTS_PER_DAY))
+    step = sch.slot_minutes
+    for i, d in enumerate(dates):
+        for t, req in sch._build_slot_requirements(d).items():
+            if t < 24 * 60:
+                required[i, t // 15:max(t // 15 + 1, (t + step) // 15)] = req
+    diff = np.zeros((n_days, SLOTS_PER_DAY + 1))
+    first = np.clip(np.ceil(start / 15.0), 0, SLOTS_PER_DAY).astype(np.int64)
+    last = np.clip(np.ceil(end / 15.0), 0, SLOTS_PER_DAY).astype(np.int64)
+    np.add.at(diff, (day, first), 1)
+    np.add.at(diff, (day, last), -1)
+    cover = np.cumsum(diff, axis=1)[:, :SLOTS_PER_DAY]
+    daily_required = required.sum(axis=1)
+    daily_met = np.minimum(cover, required).sum(axis=1)
+
+    # ---- 週 (ISO) と月でまとめる ----
+    weeks = [sch._iso_week(d) for d in dates]
+    months = [d[:7] for d in dates]
+
+    def group(keys):
+        labels = list(OrderedDict.fromkeys(keys))
+        pos = {k: i for i, k in enumerate(labels)}
+        idx = np.array([pos[k] for k in keys], dtype=np.int64)
+        return labels, idx
+
+    def summarize(labels, idx, label_fmt):
+        n = len(labels)
+        agg = {name: np.bincount(idx, weights=values, minlength=n)
+               for name, values in (("cost", daily_cost), ("hours", daily_hours),
+                                    ("overtime", daily_overtime),
+                                    ("shifts", daily_shifts),
+                                    ("required", daily_required),
+                                    ("met", daily_met))}
+        return [_row(label_fmt(labels[i]), agg, i) for i in range(n)]
+
+    daily = summarize(dates, np.arange(n_days), str)
+    week_labels, week_idx = group(weeks)
+    weekly = summarize(week_labels, week_idx,
+                       lambda k: "{}-W{:02d}".format(k[0], k[1]))
+    month_labels, month_idx = group(months)
+    monthly = summarize(month_labels, month_idx, str)
+    # 月給は月ごとにそのまま足す (クライアントの月次集計と同じ)
+    salaries = sum(float(st.raw.get("monthly_salary") or 0)
+                   for st in sch.staff_table if st.monthly)
+    for row in monthly:
+        row["monthly_salary"] = round(salaries)
+        row["labor_cost"] = row["hourly_cost"] + row["monthly_salary"]
+
+    total = _row("total", {
+        "cost": [daily_cost.sum()], "hours": [daily_hours.sum()],
+        "overtime": [daily_overtime.sum()], "shifts": [daily_shifts.sum()],
+        "required": [daily_required.sum()], "met": [daily_met.sum()]}, 0)
+    total["monthly_salary"] = round(salaries * len(month_labels))
+    total["labor_cost"] = total["hourly_cost"] + total["monthly_salary"]
+
+    return {
+        "range": [start_date, end_date],
+        "daily": daily,
+        "weekly": weekly,
+        "monthly": monthly,
+        "total": total,
+        "holiday_premium": holidays is not None,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def _row(label, agg, i):
+    required = float(agg["required"][i])
+    return {
+        "label": label,
+        "hourly_cost": int(round(float(agg["cost"][i]))),
+        "staff_hours": round(float(agg["hours"][i]), 2),
+        "overtime_hours": round(float(agg["overtime"][i]), 2),
+        "shifts": int(agg["shifts"][i]),
+        "coverage_ratio": (round(float(agg["met"][i]) / required, 4)
+                           if required else None),
+    }
+
+
+def today_status(staff_list, shifts, now):
+    # now = "YYYY-MM-DDTHH:MM" (店舗の現地時刻)。クライアントの「今日のシフト」と同じ判定
+    # (キャッシュせず毎回数える。当日分だけなので軽い)
+    today, clock = now[:10], now[11:16]
+    cur = _minutes(clock)
+    names = {s["id"]: s.get("name") for s in staff_list}
+    items = []
+    counts = {"working": 0, "finished": 0, "upcoming": 0}
+    for s in sorted((s for s in shifts if str(s.get("date")) == today),
+                    key=lambda s: s.get("start_time") or ""):
+        a = _minutes(s.get("start_time"))
+        b = _minutes(s.get("end_time"))
+        if a > b:
+            working = cur >= a or cur <= b
+            finished = not working and b < cur < a
+        else:
+            working = a <= cur <= b
+            finished = cur > b
+        status = "working" if working else ("finished" if finished else "upcoming")
+        counts[status] += 1
+        items.append({"staff_id": s.get("staff_id"),
+                      "name": names.get(s.get("staff_id")),
+                      "start_time": s.get("start_time"),
+                      "end_time": s.get("end_time"), "status": status})
+    return {"date": today, "time": clock, "total": len(items),
+            "shifts": items, **counts}
+
+
+def _minutes(time_str):
+    try:
+        parts = str(time_str).split(":")
+        return int(parts[0]) * 60 + int(parts[1])
+    except Exception:
+        return 0
+
+
+class AnalyticsCache:
+    # (テナント, 開始, 終了, 入力の指紋) -> (作成時刻, 結果)
+    def __init__(self, size=CACHE_SIZE, ttl=CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, key, expires=True):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and expires and time.time() - item[0] > self.ttl:
+                del self._items[key]
+                item = None
+            if item is None:
+                self.stats["misses"] += 1
+                return None
+            self._items.move_to_end(key)
+            self.stats["hits"] += 1
+            return item[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = (time.time(), value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def invalidate(self, tenant):
+        with self._lock:
+            for key in [k for k in self._items if k[0] == tenant]:
+                del self._items[key]
+
+
+cache = AnalyticsCache()
@@ -0,0 +1,529 @@
+import time
+
+# solve() の結果 (またはクライアントから渡された案) を ShiftScheduler の
+# ルールすべてで検査し、局所探索で修復して差分と理由を返す。
+#
+#   絶対ルール (違反したシフトは外す/直す)
+#     期間外・不明スタッフ・休業日・NG日・確定済み枠・同日重複・営業時間外・
+#     週の最大日数・7連勤・休憩時間 (_get_break_minutes)
+#   優先度つきルール (ソルバーと同じ重みで違反量を評価)
+#     coverage > manager > ojt > overtime
+#     店長が誰も入れない時間帯の責任者不足は MILP と同じく数えず、infeasible に返す
+#
+# 局所探索は「追加・時間帯の変更・削除」の1手のうち違反量を最も減らすものを
+# 繰り返す。同じ減り方なら人件費(ソルバーの cost 項)の小さい手を選ぶ。
+# 手数と時間に上限があるので、直しきれない違反は remaining に残る。
+
+PENALTY_RULES = ("coverage", "manager", "ojt", "overtime")
+
+
+def audit_and_repair(sch, shifts, force=False):
+    return Auditor(sch, force=force).run(shifts)
+
+
+def hard_filter(sch, shifts, force=False):
+    # 絶対ルールに反するシフトを外すだけ (追加・時間帯の変更・局所探索はしない)。
+    # AI の案を MILP の初期解に使う前のふるい分け用
+    return Auditor(sch, force=force).filter(shifts)
+
+
+def count_violations(sch, shifts, force=False):
+    # 修復はせず、違反の数だけ数える (エンジンの比較用)
+    return Auditor(sch, force=force).inspect(shifts)[0]
+
+
+class Auditor:
+
+    def __init__(self, sch, force=False):
+        self.sch = sch
+        self.force = force
+        opts = sch.config.get("audit") or {}
+        self.max_moves = int(opts.get("max_moves", 300))
+        self.time_budget = float(opts.get("time_budget", 3))
+        self.w = sch.OBJECTIVE_WEIGHTS
+        self.staff = sch._staff_by_id
+        self.date_set = set(sch.dates)
+        self.per_slot = sch.slot_minutes / 15.0
+
+        self.reqs = {}
+        for d in sch.dates:
+            if sch._get_day_type(d) != "closed":
+                self.reqs[d] = sch._build_slot_requirements(d)
+
+        # 店長が誰も入れないスロットは MILP も責任者の不足に数えないので、
+        # ここでも違反にせず「配置できない」として別に返す (infeasible)
+        self.mgr_slots = {}
+        self.infeasible = []
+        if sch._manager_ids:
+            for d, req in self.reqs.items():
+                can = set()
+                for mid in sch._manager_ids:
+                    if d in self.staff[mid].ng:
+                        continue
+                    for o in sch._build_shift_options(self.staff[mid], d, force=force):
+                        can.update(sch._slot_range(d, o["start_min"], o["end_min"]))
+                self.mgr_slots[d] = can
+                short = {t: sch.min_manager - sch._fixed_cover(d, t, sch._manager_ids)
+                         for t in req if t not in can}
+                short = {t: v for t, v in short.items() if v > 0}
+                for r in sch._compress_ranges(short):
+                    self.infeasible.append(dict(r, rule="manager", date=d))
+
+        self.cover = {d: {t: 0 for t in r} for d, r in self.reqs.items()}
+        self.mgr = {d: {t: 0 for t in r} for d, r in self.reqs.items()}
+        self.mentor = {d: {t: 0 for t in r} for d, r in self.reqs.items()}
+        self.rookie = {d: {t: 0 for t in r} for d, r in self.reqs.items()}
+        for f in sch.fixed_shifts:
+            if f["date"] in self.reqs:
+                self._count(f["date"], f["staff_id"],
+                            f["start_min"], f["end_min"], 1)
+
+        self.shifts = {}     # (sid, d) -> {"start_min", "end_min", "break_minutes"}
+        self.days_by_week = {}
+        self.diff = []
+
+    # ---------- 状態 ----------
+
+    def _count(self, d, sid, a, b, sign):
+        req = self.reqs.get(d)
+        if not req:
+            return
+        sch = self.sch
+        for t in sch._slot_range(d, a, b):
+            if t not in req:
+                continue
+            self.cover[d][t] += sign
+            if sid in sch._manager_ids:
+                self.mgr[d][t] += sign
+            if sid in sch._mentor_ids:
+                self.mentor[d][t] += sign
+            if sid in sch._rookie_ids:
+                self.rookie[d][t] += sign
+
+    def _slot_penalty(self, d, t, cov, mgr, ment, rook):
+        # MILP と同じく 15 分あたりの重み
+        sch = self.sch
+        p = max(0, self.reqs[d][t] - cov) * self.w["coverage"]
+        if t in self.mgr_slots.get(d, ()):
+            p += max(0, sch.min_manager - mgr) * self.w["manager"]
+        if sch._mentor_ids:
+            p += max(0, rook - ment) * self.w["ojt"]
+        return p * self.per_slot
+
+    def _overtime(self, sid, a, b):
+        mh = self.staff[sid].max_hours
+        return max(0.0, (b - a) / 60.0 - mh)
+
+    def _cost(self, sid, a, b):
+        s = self.staff[sid]
+        cost = {"A": 0, "B": 50, "C": 500, "D": 2000}.get(s.rank, 50)
+        if s.hourly:
+            cost += s.wage * (b - a) / 60.0 * 0.01
+        return cost
+
+    def _delta(self, d, sid, a, b, sign):
+        # シフト (a, b) を足す(sign=1)/外す(sign=-1)ときの違反量の変化
+        sch = self.sch
+        req = self.reqs.get(d, {})
+        is_m = 1 if sid in sch._manager_ids else 0
+        is_ment = 1 if sid in sch._mentor_ids else 0
+        is_rook = 1 if sid in sch._rookie_ids else 0
+        cov, mgr = self.cover.get(d), self.mgr.get(d)
+        ment, rook = self.mentor.get(d), self.rookie.get(d)
+        delta = 0.0
+        for t in sch._slot_range(d, a, b):
+            if t not in req:
+                continue
+            before = self._slot_penalty(d, t, cov[t], mgr[t], ment[t], rook[t])
+            after = self._slot_penalty(
+                d, t, cov[t] + sign, mgr[t] + sign * is_m,
+                ment[t] + sign * is_ment, rook[t] + sign * is_rook)
+            delta += after - before
+        delta += sign * self._overtime(sid, a, b) * self.w["overtime"]
+        return delta
+
+    def _week_key(self, d):
+        return self.sch._iso_week(d)
+
+    def _week_days(self, sid, d):
+        key = (sid, self._week_key(d))
+        return self.days_by_week.setdefault(key, set())
+
+    def _put(self, sid, d, a, b, brk):
+        self.shifts[(sid, d)] = {"start_min": a, "end_min": b,
+                                 "break_minutes": brk}
+        self._count(d, sid, a, b, 1)
+        self._week_days(sid, d).add(d)
+
+    def _take(self, sid, d):
+        s = self.shifts.pop((sid, d))
+        self._count(d, sid, s["start_min"], s["end_min"], -1)
+        self._week_days(sid, d).discard(d)
+        return s
+
+    def _works(self, sid, d):
+        return (sid, d) in self.shifts or (sid, d) in self.sch._fixed_keys
+
+    def _weekly_cap(self, sid):
+        max_days = self.staff[sid].max_days
+        if self.force:
+            return max(max_days, 6)
+        return max_days
+
+    def _week_count(self, sid, d):
+        week = [d]
+        return (len(self._week_days(sid, d))
+                + self.sch._fixed_days_in_week(sid, week))
+
+    def _windows_of(self, d):
+        return [w for w in self.windows if d in w]
+
+    def _window_count(self, sid, span):
+        return sum(1 for x in span if self._works(sid, x))
+
+    def _can_add(self, sid, d):
+        if self._works(sid, d) or d not in self.reqs:
+            return False
+        if d in self.ng[sid]:
+            return False
+        if self._week_count(sid, d) >= self._weekly_cap(sid):
+            return False
+        if not self.force:
+            for span in self._windows_of(d):
+                if self._window_count(sid, span) >= 6:
+                    return False
+        return True
+
+    # ---------- 記録 ----------
+
+    def _fmt(self, a, b, brk):
+        return {"start_time": self.sch._from_minutes(a),
+                "end_time": self.sch._from_minutes(b),
+                "break_minutes": brk}
+
+    def _record(self, action, sid, d, before, after, reason):
+        self.diff.append({
+            "action": action, "staff_id": sid, "date": d,
+            "before": self._fmt(**before) if before else None,
+            "after": self._fmt(**after) if after else None,
+            "reason": reason,
+        })
+
+    # ---------- 検査 ----------
+
+    def _scan(self):
+        sch = self.sch
+        counts = {r: 0 for r in PENALTY_RULES}
+        counts.update({"weekly_limit": 0, "seven_day": 0, "break": 0})
+        remaining = []
+        for d, req in self.reqs.items():
+            short = {"coverage": {}, "manager": {}, "ojt": {}}
+            for t in req:
+                short["coverage"][t] = req[t] - self.cover[d][t]
+                if t in self.mgr_slots.get(d, ()):
+                    short["manager"][t] = sch.min_manager - self.mgr[d][t]
+                if sch._mentor_ids:
+                    short["ojt"][t] = self.rookie[d][t] - self.mentor[d][t]
+            for rule, slots in short.items():
+                slots = {t: v for t, v in slots.items() if v > 0}
+                if not slots:
+                    continue
+                counts[rule] += sum(slots.values())
+                # スロット単位だと多すぎるので、同じ不足数の連続区間にまとめる
+                for r in sch._compress_ranges(slots):
+                    remaining.append(dict(r, rule=rule, date=d))
+        for (sid, d), s in self.shifts.items():
+            over = self._overtime(sid, s["start_min"], s["end_min"])
+            if over > 0:
+                counts["overtime"] += 1
+                remaining.append({"rule": "overtime", "date": d,
+                                  "staff_id": sid, "hours": round(over, 2)})
+            hours = (s["end_min"] - s["start_min"]) / 60.0
+            if s["break_minutes"] != sch._get_break_minutes(hours):
+                counts["break"] += 1
+        for sid in self.staff:
+            seen = set()
+            for d in sch.dates:
+                key = self._week_key(d)
+                if key in seen:
+                    continue
+                seen.add(key)
+                excess = self._week_count(sid, d) - self._weekly_cap(sid)
+                if excess > 0 and self._week_days(sid, d):
+                    counts["weekly_limit"] += excess
+            if not self.force:
+                for span in self.windows:
+                    if (self._window_count(sid, span) > 6
+                            and any((sid, x) in self.shifts for x in span)):
+                        counts["seven_day"] += 1
+        return counts, remaining
+
+    # ---------- 実行 ----------
+
+    def inspect(self, shifts):
+        # 案を読み込んで違反を数える。戻り値は (違反数, 営業時間外のシフト)
+        sch = self.sch
+        self.ng = {sid: s.ng for sid, s in self.staff.items()}
+        self.windows = sch._seven_day_windows() if not self.force else []
+
+        hard = {"unknown": 0, "closed": 0, "ng_date": 0, "frozen": 0,
+                "duplicate": 0, "outside_hours": 0}
+        outside = []
+        for s in shifts:
+            sid, d = s.get("staff_id"), str(s.get("date", ""))
+            a = sch._to_minutes(s.get("start_time"))
+            b = sch._to_minutes(s.get("end_time"))
+            brk = int(s.get("break_minutes") or 0)
+            before = {"a": a, "b": b, "brk": brk}
+            if sid not in self.staff or d not in self.date_set or a >= b:
+                hard["unknown"] += 1
+                self._record("remove", sid, d, before, None, "unknown")
+                continue
+            if d not in self.reqs and sch._get_day_type(d) == "closed":
+                hard["closed"] += 1
+                self._record("remove", sid, d, before, None, "closed")
+                continue
+            if d in self.ng[sid]:
+                hard["ng_date"] += 1
+                self._record("remove", sid, d, before, None, "ng_date")
+                continue
+            if sch._is_frozen(sid, d):
+                hard["frozen"] += 1
+                self._record("remove", sid, d, before, None, "frozen")
+                continue
+            if (sid, d) in self.shifts:
+                hard["duplicate"] += 1
+                self._record("remove", sid, d, before, None, "duplicate")
+                continue
+            op, cl = sch._get_opening_hours(d)
+            if a < sch._to_minutes(op) or b > sch._to_minutes(cl):
+                outside.append((sid, d, before))
+                continue
+            self._put(sid, d, a, b, brk)
+
+        counts, _ = self._scan()
+        for sid, d, before in outside:
+            counts["outside_hours"] = counts.get("outside_hours", 0) + 1
+        counts.update({k: v for k, v in hard.items() if v})
+        return {k: v for k, v in counts.items() if v}, outside
+
+    def run(self, shifts):
+        sch = self.sch
+        started = time.perf_counter()
+        violations_before, outside = self.inspect(shifts)
+
+        for sid, d, before in outside:
+            # 営業時間内の選択肢に置き換える(置けなければ外す)
+            best = self._best_option(sid, d)
+            if best is not None:
+                a, b = best
+                brk = sch._get_break_minutes((b - a) / 60.0)
+                self._put(sid, d, a, b, brk)
+                self._record("change", sid, d, before,
+                             {"a": a, "b": b, "brk": brk}, "outside_hours")
+            else:
+                self._record("remove", sid, d, before, None, "outside_hours")
+
+        self._fix_breaks()
+        self._fix_weekly()
+        if not self.force:
+            self._fix_seven_day()
+        moves = self._local_search(started)
+
+        counts, remaining = self._scan()
+        violations_after = {k: v for k, v in counts.items() if v}
+        elapsed = (time.perf_counter() - started) * 1000
+        print("[Audit] before={} after={} changes={} moves={} ({:.1f}ms)".format(
+            violations_before, violations_after, len(self.diff), moves, elapsed))
+        report = {
+            "violations_before": violations_before,
+            "violations_after": violations_after,
+            "diff": self.diff,
+            "remaining": remaining[:100],
+            "infeasible": self.infeasible[:100],
+            "moves": moves,
+            "elapsed_ms": round(elapsed, 1),
+        }
+        return self._result(), report
+
+    def filter(self, shifts):
+        started = time.perf_counter()
+        _, outside = self.inspect(shifts)
+        # 営業時間外は初期解に写すときに近い選択肢へ寄るので、外さずに残す
+        for sid, d, before in outside:
+            if (sid, d) in self.shifts:
+                self._record("remove", sid, d, before, None, "duplicate")
+                continue
+            self._put(sid, d, before["a"], before["b"], before["brk"])
+        self._fix_weekly()
+        if not self.force:
+            self._fix_seven_day()
+        dropped = {}
+        for row in self.diff:
+            dropped[row["reason"]] = dropped.get(row["reason"], 0) + 1
+        report = {
+            "received": len(shifts),
+            "kept": len(self.shifts),
+            "dropped": dropped,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+        return self._result(), report
+
+    def _result(self):
+        sch = self.sch
+        out = []
+        for (sid, d), s in sorted(self.shifts.items(), key=lambda kv: (kv[0][1], str(kv[0][0]))):
+            a, b = s["start_min"], s["end_min"]
+            entry = {
+                "staff_id": sid,
+                "date": d,
+                "start_time": sch._from_minutes(a),
+                "end_time": sch._from_minutes(b),
+                "break_minutes": s["break_minutes"],
+            }
+            over = self._overtime(sid, a, b)
+            if over > 0:
+                entry["overtime"] = True
+                entry["overtime_hours"] = round(over, 1)
+            out.append(entry)
+        return out
+
+    # ---------- 絶対ルールの修復 ----------
+
+    def _fix_breaks(self):
+        for (sid, d), s in sorted(self.shifts.items(), key=lambda kv: (kv[0][1], str(kv[0][0]))):
+            want = self.sch._get_break_minutes(
+                (s["end_min"] - s["start_min"]) / 60.0)
+            if s["break_minutes"] != want:
+                before = {"a": s["start_min"], "b": s["end_min"],
+                          "brk": s["break_minutes"]}
+                s["break_minutes"] = want
+                self._record("change", sid, d, before,
+                             dict(before, brk=want), "break")
+
+    def _drop_cheapest(self, sid, candidates, reason):
+        # 外したときの違反増加が最も小さい日を外す
+        d = min(candidates, key=lambda x: (
+            self._delta(x, sid, self.shifts[(sid, x)]["start_min"],
+                        self.shifts[(sid, x)]["end_min"], -1), x))
+        s = self._take(sid, d)
+        self._record("remove", sid, d,
+                     {"a": s["start_min"], "b": s["end_min"],
+                      "brk": s["break_minutes"]}, None, reason)
+
+    def _fix_weekly(self):
+        for (sid, _), days in list(self.days_by_week.items()):
+            while days:
+                d = next(iter(days))
+                if self._week_count(sid, d) <= self._weekly_cap(sid):
+                    break
+                self._drop_cheapest(sid, sorted(days), "weekly_limit")
+
+    def _fix_seven_day(self):
+        for sid in self.staff:
+            for span in self.windows:
+                while self._window_count(sid, span) > 6:
+                    mine = [x for x in span if (sid, x) in self.shifts]
+                    if not mine:
+                        break
+                    self._drop_cheapest(sid, mine, "seven_day")
+
+    # ---------- 局所探索 ----------
+
+    def _options(self, sid, d):
+        return [(o["start_min"], o["end_min"]) for o in
+                self.sch._build_shift_options(self.staff[sid], d,
+                                              force=self.force)]
+
+    def _best_option(self, sid, d):
+        best = None
+        for a, b in self._options(sid, d):
+            key = (self._delta(d, sid, a, b, 1), self._cost(sid, a, b))
+            if best is None or key < best[0]:
+                best = (key, (a, b))
+        return best[1] if best else None
+
+    def _day_moves(self, d):
+        # (違反量の変化, 人件費の変化, 手)
+        moves = []
+        for sid in self.staff:
+            cur = self.shifts.get((sid, d))
+            if cur is None:
+                if not self._can_add(sid, d):
+                    continue
+                for a, b in self._options(sid, d):
+                    dv = self._delta(d, sid, a, b, 1)
+                    if dv < 0:
+                        moves.append((dv, self._cost(sid, a, b),
+                                      ("add", sid, a, b)))
+                continue
+            ca, cb = cur["start_min"], cur["end_min"]
+            dv_remove = self._delta(d, sid, ca, cb, -1)
+            if dv_remove < 0:
+                moves.append((dv_remove, -self._cost(sid, ca, cb),
+                              ("remove", sid, ca, cb)))
+            self._count(d, sid, ca, cb, -1)
+            for a, b in self._options(sid, d):
+                if (a, b) == (ca, cb):
+                    continue
+                dv = dv_remove + self._delta(d, sid, a, b, 1)
+                if dv < 0:
+                    moves.append((dv, self._cost(sid, a, b)
+                                  - self._cost(sid, ca, cb),
+                                  ("change", sid, a, b)))
+            self._count(d, sid, ca, cb, 1)
+        return moves
+
+    def _day_counts(self, d):
+        sch = self.sch
+        counts = dict.fromkeys(PENALTY_RULES, 0)
+        for t, req in self.reqs.get(d, {}).items():
+            counts["coverage"] += max(0, req - self.cover[d][t])
+            if t in self.mgr_slots.get(d, ()):
+                counts["manager"] += max(0, sch.min_manager - self.mgr[d][t])
+            if sch._mentor_ids:
+                counts["ojt"] += max(0, self.rookie[d][t] - self.mentor[d][t])
+        for (sid, x), sh in self.shifts.items():
+            if x == d:
+                counts["overtime"] += self._overtime(
+                    sid, sh["start_min"], sh["end_min"])
+        return counts
+
+    def _local_search(self, started):
+        moves = 0
+        days = sorted(self.reqs)
+        improved = True
+        while improved and moves < self.max_moves:
+            improved = False
+            for d in days:
+                if moves >= self.max_moves:
+                    break
+                if time.perf_counter() - started > self.time_budget:
+                    print("[Audit] time budget reached")
+                    return moves
+                cands = self._day_moves(d)
+                if not cands:
+                    continue
+                dv, _, (kind, sid, a, b) = min(cands, key=lambda m: (m[0], m[1]))
+                self._apply(kind, sid, d, a, b)
+                moves += 1
+                improved = True
+        return moves
+
+    def _apply(self, kind, sid, d, a, b):
+        # 理由は、この手で減った違反のうち最も優先度の高いもの
+        before_counts = self._day_counts(d)
+        brk = self.sch._get_break_minutes((b - a) / 60.0)
+        old = self._take(sid, d) if kind != "add" else None
+        if kind != "remove":
+            self._put(sid, d, a, b, brk)
+        after_counts = self._day_counts(d)
+        reason = next((r for r in PENALTY_RULES
+                       if after_counts[r] < before_counts[r]), "overtime")
+        before = after = None
+        if old is not None:
+            before = {"a": old["start_min"], "b": old["end_min"],
+                      "brk": old["break_minutes"]}
+        if kind != "remove":
+            after = {"a": a, "b": b, "brk": brk}
+        self._record(kind, sid, d, before, after, reason)
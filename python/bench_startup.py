@@ -0,0 +1,113 @@
+"""
+起動ベンチマーク: uvicorn の起動から最初の /check 成功までの時間を計測する
+
+    python bench_startup.py --runs 5 --budget-ms 3000
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+CHECK_PAYLOAD = {
+    "staff_list": [
+        {"id": "s1", "name": "A", "role": "manager", "max_days_week": 5},
+        {"id": "s2", "name": "B", "role": "staff", "max_days_week": 5},
+    ],
+    "config": {"opening_time": "09:00", "closing_time": "18:00"},
+    "dates": ["2024-01-01", "2024-01-02", "2024-01-03"],
+    "requests": [],
+}
+
+
+def _free_port():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def _post(url, payload, timeout=2.0):
+    data = json.dumps(payload).encode("utf-8")
+    req = urllib.request.Request(
+        url, data=data, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=timeout) as res:
+        return json.loads(res.read().decode("utf-8"))
+
+
+def _get(url, timeout=2.0):
+    with urllib.request.urlopen(url, timeout=timeout) as res:
+        return json.loads(res.read().decode("utf-8"))
+
+
+def measure_once(warmup=True, timeout=60.0):
+    port = _free_port()
+    env = dict(os.environ)
+    env["RAKUSHIFT_WARMUP"] = "1" if warmup else "0"
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=HERE, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = "http://127.0.0.1:{}".format(port)
+    try:
+        while True:
+            if time.perf_counter() - started > timeout:
+                raise RuntimeError("server did not answer /check in time")
+            try:
+                result = _post(base + "/check", CHECK_PAYLOAD)
+                break
+            except OSError:
+                time.sleep(0.02)
+        first_check = time.perf_counter() - started
+        if result.get("status") != "success":
+            raise RuntimeError("/check failed: {}".format(result))
+        # /check 成功直後の /generate で、初回ソルブの遅延も測っておく
+        t = time.perf_counter()
+        _post(base + "/generate", CHECK_PAYLOAD, timeout=timeout)
+        first_generate = time.perf_counter() - t
+        stats = _get(base + "/").get("startup", {})
+    finally:
+        proc.terminate()
+        proc.wait()
+    return {
+        "first_check_ms": round(first_check * 1000, 1),
+        "first_generate_ms": round(first_generate * 1000, 1),
+        "import_ms": stats.get("import_ms"),
+        "warmup_ms": stats.get("warmup_ms"),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=3)
+    ap.add_argument("--no-warmup", action="store_true")
+    ap.add_argument("--budget-ms", type=float, default=None,
+                    help="time-to-first-/check の上限。超えたら終了コード1")
+    args = ap.parse_args()
+
+    runs = [measure_once(warmup=not args.no_warmup) for _ in range(args.runs)]
+    for i, r in enumerate(runs):
+        print("run {}: {}".format(i + 1, r))
+    summary = {k: round(statistics.median(
+                   r[k] for r in runs if r[k] is not None), 1)
+               for k in ("first_check_ms", "first_generate_ms", "import_ms")
+               if any(r[k] is not None for r in runs)}
+    print("median: {}".format(summary))
+
+    if args.budget_ms is not None and summary["first_check_ms"] > args.budget_ms:
+        print("FAIL: time-to-first-/check {:.0f}ms > budget {:.0f}ms".format(
+            summary["first_check_ms"], args.budget_ms))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+チューニング表の作成: 合成インスタンスを大きさ・きつさを変えて解き、
+tuning.py が使う tuning_table.json (設定の区分と予想時間の回帰) を書き出す
+
+    python bench_tuning.py                # 既定のグリッド (数分)
+    python bench_tuning.py --quick        # 小さいグリッドで動作確認
+    python bench_tuning.py --threads 1,2,4 --out tuning_table.json
+    python bench_tuning.py --corpus captures/   # 本番のキャプチャ (capture.py) で作る
+
+スレッド数は実行環境の CPU 数に依存するので、本番と同じ CPU 数の環境で実行すること
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+import tuning  # noqa: E402
+from bounds import coverage_bound  # noqa: E402
+from scheduler import ShiftScheduler, _load_pulp  # noqa: E402
+
+PATTERNS = [("09:00", "17:00"), ("13:00", "22:00"), ("17:00", "22:00"),
+            ("09:00", "13:00"), ("11:00", "20:00"), ("10:00", "15:00")]
+ROLES = ["staff", "staff", "staff", "leader"]
+
+
+def make_instance(n_staff, n_days, n_patterns, rookie_ratio, demand, seed):
+    rnd = random.Random(seed)
+    first = date(2026, 11, 2)
+    dates = [(first + timedelta(days=i)).isoformat() for i in range(n_days)]
+    staff = []
+    for i in range(n_staff):
+        role = "rookie" if rnd.random() < rookie_ratio else rnd.choice(ROLES)
+        if i < max(1, n_staff // 8):
+            role = "manager"
+        staff.append({
+            "id": "s{:03d}".format(i), "name": "S{}".format(i), "role": role,
+            "evaluation": rnd.choice("ABC"),
+            "salary_type": "monthly" if rnd.random() < 0.15 else "hourly",
+            "hourly_wage": 1100 + rnd.randrange(0, 400, 50),
+            "max_days_week": rnd.choice([3, 4, 5, 5]),
+            "max_hours_day": rnd.choice([6, 8, 8]),
+            "unavailable_dates": [rnd.choice(dates) for _ in range(n_days // 10)],
+        })
+    # 必要人数はスタッフ数に比例させ、demand で需要/供給の比を変える
+    base = max(1, int(round(n_staff * 0.25 * demand)))
+    config = {
+        "opening_time": "09:00", "closing_time": "22:00",
+        "custom_shifts": [{"start": a, "end": b} for a, b in PATTERNS[:n_patterns]],
+        "staff_req": {"min_weekday": base, "min_weekend": base + 1,
+                      "min_holiday": base + 1, "min_manager": 1},
+        "time_staff_req": [{"days": [1, 2, 3, 4, 5], "start": "11:00",
+                            "end": "14:00", "count": base + 1}],
+        "auto_tune": False,
+    }
+    return staff, config, dates
+
+
+def grid(quick):
+    if quick:
+        return [(s, d, 3, r, m) for s in (6, 12) for d in (7, 14)
+                for r in (0.0, 0.3) for m in (0.6, 1.0)]
+    return [(s, d, p, r, m)
+            for s in (8, 20, 40, 80) for d in (7, 14, 28)
+            for p in (3, 6) for r in (0.1, 0.3) for m in (0.6, 1.0)]
+
+
+def run_one(staff, config, dates, threads, time_limit, requests=None,
+            fixed_shifts=None, freeze_before=None):
+    with contextlib.redirect_stdout(io.StringIO()):
+        # キャプチャの設定は auto_tune のままなので、計測では切る
+        sch = ShiftScheduler(staff, dict(config, solver_time_limit=time_limit,
+                                         auto_tune=False),
+                             dates, requests, fixed_shifts=fixed_shifts,
+                             freeze_before=freeze_before)
+        feats = tuning.features(sch, coverage_bound(sch))
+        sch.solver_threads = threads
+        started = time.perf_counter()
+        sch.solve()
+        elapsed = time.perf_counter() - started
+    return feats, elapsed, sch.solved_with
+
+
+def fit(rows):
+    # log(秒) を特徴量の線形和で最小二乗
+    import numpy as np
+    X = np.array([[1.0] + [r["features"][k] for k in tuning.FEATURES]
+                  for r in rows])
+    y = np.array([math.log(max(r["seconds"], 0.01)) for r in rows])
+    coef, _, _, _ = np.linalg.lstsq(X, y, rcond=None)
+    residual = y - X.dot(coef)
+    return {
+        "intercept": round(float(coef[0]), 4),
+        "coef": {k: round(float(c), 4) for k, c in zip(tuning.FEATURES, coef[1:])},
+        "residual_std": round(float(residual.std()), 4),
+    }
+
+
+def buckets(rows, threads_list):
+    # 変数の数の3分位で区分し、区分ごとに中央値が最短のスレッド数と時間上限を決める
+    sizes = sorted(r["features"]["options"] for r in rows)
+    edges = [sizes[len(sizes) // 3], sizes[2 * len(sizes) // 3], None]
+    out = []
+    low = -1
+    for edge in edges:
+        inside = [r for r in rows if r["features"]["options"] > low
+                  and (edge is None or r["features"]["options"] <= edge)]
+        best = threads_list[0]
+        if inside:
+            medians = {t: statistics.median(r["times"][str(t)] for r in inside)
+                       for t in threads_list}
+            best = min(threads_list, key=lambda t: (medians[t], t))
+            worst = max(r["times"][str(best)] for r in inside)
+        else:
+            worst = 0.0
+        # 一番遅かったインスタンスの4倍を10秒単位で (20〜120秒)
+        limit = min(120, max(20, int(math.ceil(worst * 4 / 10.0)) * 10))
+        out.append({"max_options": edge, "threads": best,
+                    "time_limit": limit, "gap": None})
+        low = edge if edge is not None else low
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--quick", action="store_true")
+    ap.add_argument("--threads", default="1",
+                    help="比べるスレッド数 (カンマ区切り)")
+    ap.add_argument("--time-limit", type=float, default=60)
+    ap.add_argument("--corpus", help="合成グリッドの代わりに使うキャプチャのディレクトリ")
+    ap.add_argument("--out", default=os.path.join(HERE, "tuning_table.json"))
+    args = ap.parse_args()
+    threads_list = [int(t) for t in args.threads.split(",")]
+
+    _load_pulp()
+    if args.corpus:
+        from compare_engines import load_corpus
+        instances = [(inst["name"], inst["inputs"]) for inst in load_corpus(args.corpus)]
+    else:
+        instances = []
+        for i, (n_staff, n_days, n_pat, rookie, demand) in enumerate(grid(args.quick)):
+            staff, config, dates = make_instance(n_staff, n_days, n_pat, rookie,
+                                                 demand, seed=i)
+            instances.append(([n_staff, n_days, n_pat, rookie, demand],
+                              {"staff_list": staff, "config": config, "dates": dates}))
+    rows = []
+    for i, (name, inputs) in enumerate(instances):
+        times = {}
+        feats = None
+        for t in threads_list:
+            feats, elapsed, solved = run_one(
+                inputs["staff_list"], inputs["config"], inputs["dates"], t,
+                args.time_limit, inputs.get("requests"), inputs.get("fixed_shifts"),
+                inputs.get("freeze_before"))
+            times[str(t)] = round(elapsed, 3)
+        row = {"instance": name, "features": feats, "times": times,
+               "seconds": times[str(threads_list[0])], "solved_with": solved}
+        rows.append(row)
+        print("{:3d} staff={:3d} days={:2d} patterns={} options={:6d}"
+              " tightness={:.2f} -> {}".format(
+                  i, feats["staff"], feats["days"], feats["patterns"],
+                  feats["options"], feats["tightness"], times))
+
+    table = {
+        "buckets": buckets(rows, threads_list),
+        "model": fit(rows),
+        "instances": len(rows),
+        "cpu_count": os.cpu_count(),
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(table, f, ensure_ascii=False, indent=2)
+    print(json.dumps({k: table[k] for k in ("buckets", "model")},
+                     ensure_ascii=False, indent=2))
+    print("wrote {}".format(args.out))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+import time
+
+# MILP を組む前に、人員不足の下界をミリ秒単位で求める。
+#
+# 日 d に p_d 人が出勤するとき、スロット t の充足数は
+# min(必要数, そのスロットを担当できる人数, p_d) を超えない。
+# さらに1人が1日に担当できるのは最長のシフト1本分なので、p_d 人で埋められる
+# スロット数は F(p) = min(層の上位 p 本の合計, p × 最長シフトのスロット数) 以下。
+# F は凹なので「k人目の増分」は k について単調減少になり、週ごとの
+# 「スタッフ × 日」二部グラフ上のフロー(各人の週上限・7連勤制限つき)に
+# 増分の大きい順に増加路で割り当てる貪欲法が最適になる(gammoid)。
+# よって得られる不足量は正しい下界(人時)になる。
+
+
+def coverage_bound(sch, force=False):
+    started = time.perf_counter()
+
+    day_info = {}
+    eligible = {}
+    for d in sch.dates:
+        if sch._get_day_type(d) == "closed":
+            continue
+        reqs = sch._open_slot_requirements(d)
+        if not reqs:
+            continue
+        people = []
+        longest = 0
+        cover = {t: 0 for t in reqs}
+        # 同じ日のスタッフはほぼ同じ選択肢を持つので、区間集合ごとに使い回す
+        shapes = {}
+        for st in sch.staff_table:
+            if not force and st.max_days <= 0:
+                continue
+            if d in st.ng:
+                continue
+            opts = _options_for_bound(sch, st, d, force)
+            if not opts:
+                continue
+            people.append(st.id)
+            key = tuple((o["start_min"], o["end_min"]) for o in opts)
+            shape = shapes.get(key)
+            if shape is None:
+                covered = [t for t in reqs
+                           if any(a <= t < b for a, b in key)]
+                most = max(sum(1 for t in reqs if a <= t < b) for a, b in key)
+                shape = shapes[key] = (covered, most)
+            longest = max(longest, shape[1])
+            for t in shape[0]:
+                cover[t] += 1
+        eligible[d] = people
+
+        shortage_slots = {}
+        capped = []
+        for t, req in reqs.items():
+            if req > cover[t]:
+                shortage_slots[t] = req - cover[t]
+            capped.append(min(req, cover[t]))
+        layers = []
+        for k in range(1, max(capped or [0]) + 1):
+            layers.append(sum(1 for c in capped if c >= k))
+        # gains[k] = k+1人目が増やせる充足スロット数 (F の増分)
+        gains = []
+        prev = 0
+        for p in range(1, len(people) + 1):
+            f = min(sum(layers[:p]), p * longest)
+            if f <= prev:
+                break
+            gains.append(f - prev)
+            prev = f
+        day_info[d] = {"shortage_slots": shortage_slots, "gains": gains,
+                       "required": len(layers)}
+
+    staffed = {d: 0 for d in day_info}
+    for week in sch._group_dates_by_week():
+        days = [d for d in week if d in day_info]
+        if not days:
+            continue
+        cap = {}
+        for st in sch.staff_table:
+            max_days = st.max_days
+            if force:
+                effective = max(max_days, 6)
+            else:
+                effective = max_days
+                if len(week) >= 7:
+                    effective = min(effective, 6)
+            effective -= sch._fixed_days_in_week(st.id, week)
+            cap[st.id] = max(effective, 0)
+        _assign_week(days, day_info, eligible, cap, staffed)
+
+    daily = {}
+    slot_total = 0.0
+    staffing_total = 0.0
+    for d, info in day_info.items():
+        slot_hrs = sum(info["shortage_slots"].values()) * sch.slot_hours
+        missing = sum(info["gains"][staffed[d]:]) * sch.slot_hours
+        slot_total += slot_hrs
+        staffing_total += missing
+        if slot_hrs > 0 or missing > 0:
+            daily[d] = {
+                "shortage_slots": info["shortage_slots"],
+                "slot_shortage_hours": round(slot_hrs, 2),
+                "staffing_shortage_hours": round(missing, 2),
+                "required_staff": info["required"],
+                "assignable_staff": staffed[d],
+            }
+
+    elapsed = (time.perf_counter() - started) * 1000
+    result = {
+        "lower_bound_hours": round(slot_total + staffing_total, 2),
+        "slot_shortage_hours": round(slot_total, 2),
+        "staffing_shortage_hours": round(staffing_total, 2),
+        "assignable_staff_days": sum(staffed.values()),
+        # 確定済みシフトを除いてもまだ必要人数が残っている日数
+        "open_days": len(day_info),
+        "daily": daily,
+        "force": force,
+        "elapsed_ms": round(elapsed, 1),
+    }
+    print("[Bound] shortage>={:.1f}h (slot {:.1f}h + weekly {:.1f}h) "
+          "staff-days={} ({:.1f}ms)".format(
+              result["lower_bound_hours"], slot_total, staffing_total,
+              result["assignable_staff_days"], elapsed))
+    return result
+
+
+def _assign_week(days, day_info, eligible, cap, staffed):
+    used = {sid: 0 for sid in cap}
+    works = {}
+    on_day = {d: set() for d in days}
+
+    units = []
+    for d in days:
+        for k, w in enumerate(day_info[d]["gains"]):
+            units.append((-w, k, d))
+    units.sort()
+
+    blocked = set()
+    for _, _, d in units:
+        if d in blocked:
+            continue
+        if _augment(d, eligible, cap, used, works, on_day):
+            staffed[d] += 1
+        else:
+            # 同じ日の次の層も同じ増加路を探すことになるので打ち切る
+            blocked.add(d)
+
+
+def _augment(root, eligible, cap, used, works, on_day):
+    # 日 -> (未出勤の)スタッフ -> (そのスタッフが出勤中の)別の日 ... と辿り、
+    # 週上限に余裕のあるスタッフに着いたら経路を反転させる
+    parent = {("d", root): None}
+    queue = [("d", root)]
+    while queue:
+        node = queue.pop(0)
+        kind, key = node
+        if kind == "d":
+            for sid in eligible[key]:
+                if sid in on_day[key] or ("s", sid) in parent:
+                    continue
+                parent[("s", sid)] = node
+                if used[sid] < cap.get(sid, 0):
+                    _flip(("s", sid), parent, used, works, on_day)
+                    return True
+                queue.append(("s", sid))
+        else:
+            for d in works.get(key, ()):
+                if ("d", d) not in parent:
+                    parent[("d", d)] = node
+                    queue.append(("d", d))
+    return False
+
+
+def _flip(end, parent, used, works, on_day):
+    used[end[1]] += 1
+    node = end
+    while parent[node] is not None:
+        day = parent[node]
+        sid = node[1]
+        works.setdefault(sid, set()).add(day[1])
+        on_day[day[1]].add(sid)
+        prev = parent[day]
+        if prev is None:
+            break
+        # prev のスタッフはこの日から外れて、元の日(day)に振り替わる
+        works[prev[1]].discard(day[1])
+        on_day[day[1]].discard(prev[1])
+        node = prev
+
+
+def _options_for_bound(sch, staff, date_str, force):
+    if sch.flex.get("enabled") and sch._flex_pool is None:
+        # 列生成前は営業時間内の任意の時間帯を担当できるとみなす(下界として安全側)
+        op, cl = sch._day_window(date_str)
+        if op >= cl or (staff.max_hours <= 0 and not force):
+            return []
+        return [{"start_min": op, "end_min": cl}]
+    return sch._build_shift_options(staff, date_str, force=force)
@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+
+# 生成処理の協調キャンセル
+#   - CancelToken を ShiftScheduler に渡し、段(Tier)や列生成の反復の間で確認する
+#   - 実行中の CBC サブプロセスはトークンに登録しておき、キャンセル時に kill する
+#   - 期限(deadline)を過ぎたトークンもキャンセル扱いになる
+# CBC の起動は pulp の coin_api 内の subprocess.Popen なので、そこだけ差し替えて
+# 「いまこのスレッドで動いているトークン」にプロセスを登録する。
+
+DEFAULT_DEADLINE = float(os.environ.get("RAKUSHIFT_REQUEST_DEADLINE", "300"))
+
+_local = threading.local()
+_installed = False
+
+
+class Cancelled(Exception):
+    def __init__(self, reason):
+        super().__init__("cancelled: {}".format(reason))
+        self.reason = reason
+
+
+class CancelToken:
+
+    def __init__(self, deadline_seconds=None):
+        self.started = time.perf_counter()
+        self.deadline = (self.started + float(deadline_seconds)
+                         if deadline_seconds else None)
+        self.reason = None
+        self._lock = threading.Lock()
+        self._procs = set()
+        self._callbacks = []
+
+    @property
+    def cancelled(self):
+        if self.reason is None and self.expired():
+            self.cancel("deadline")
+        return self.reason is not None
+
+    def expired(self):
+        return self.deadline is not None and time.perf_counter() >= self.deadline
+
+    def remaining(self):
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.perf_counter())
+
+    def time_limit(self, limit):
+        # ソルバーの timeLimit を期限までの残り時間で頭打ちにする
+        rest = self.remaining()
+        if rest is None:
+            return limit
+        return max(1.0, min(limit, rest))
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def cancel(self, reason="cancelled"):
+        with self._lock:
+            if self.reason is not None:
+                return
+            self.reason = reason
+            procs = list(self._procs)
+            callbacks = list(self._callbacks)
+        print("[Cancel] {} after {:.1f}s, killing {} solver process(es)".format(
+            reason, self.elapsed(), len(procs)))
+        for p in procs:
+            _kill(p)
+        for cb in callbacks:
+            cb()
+
+    def on_cancel(self, callback):
+        with self._lock:
+            if self.reason is None:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def check(self):
+        if self.cancelled:
+            raise Cancelled(self.reason)
+
+    def solve(self, prob, solver):
+        # prob.solve をこのトークンの下で実行する。kill されたら Cancelled にする
+        self.check()
+        previous = getattr(_local, "token", None)
+        _local.token = self
+        try:
+            prob.solve(solver)
+        except Exception:
+            self.check()
+            raise
+        finally:
+            _local.token = previous
+        self.check()
+
+    def _register(self, proc):
+        with self._lock:
+            if self.reason is None:
+                self._procs.add(proc)
+                return
+        _kill(proc)
+
+    def _unregister(self, proc):
+        with self._lock:
+            self._procs.discard(proc)
+
+
+def _kill(proc):
+    try:
+        if proc.poll() is None:
+            proc.kill()
+    except OSError:
+        pass
+
+
+class _TrackedPopen:
+    # subprocess.Popen の代わり。生成したプロセスを現在のトークンに登録する
+    def __init__(self, real):
+        self._real = real
+
+    def __call__(self, *args, **kwargs):
+        proc = self._real.Popen(*args, **kwargs)
+        token = getattr(_local, "token", None)
+        if token is not None:
+            token._register(proc)
+            wait = proc.wait
+
+            def tracked_wait(*a, **kw):
+                try:
+                    return wait(*a, **kw)
+                finally:
+                    token._unregister(proc)
+            proc.wait = tracked_wait
+        return proc
+
+
+class _SubprocessProxy:
+    def __init__(self, real):
+        self._real = real
+        self.Popen = _TrackedPopen(real)
+
+    def __getattr__(self, name):
+        return getattr(self._real, name)
+
+
+def install(pulp):
+    global _installed
+    if _installed:
+        return
+    coin_api = pulp.apis.coin_api
+    coin_api.subprocess = _SubprocessProxy(coin_api.subprocess)
+    _installed = True
@@ -0,0 +1,220 @@
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import queue
+import random
+import threading
+import time
+
+# 本番の /generate リクエストを匿名化して手元のコーパスに残す (オプトイン)。
+# 遅い・失敗した生成を後から replay.py で再現し、チューニング (bench_tuning.py) や
+# エンジンの比較 (compare_engines.py) に実際のテナントの形を使うため。
+#   RAKUSHIFT_CAPTURE_DIR           保存先。未設定なら何もしない
+#   RAKUSHIFT_CAPTURE               all (既定) / slow (遅い or 失敗) / failed
+#   RAKUSHIFT_CAPTURE_SLOW_SECONDS  slow の閾値 (既定 10 秒)
+#   RAKUSHIFT_CAPTURE_SAMPLE        all のときの抽出率 (0〜1, 既定 1)
+#   RAKUSHIFT_CAPTURE_MAX_FILES     これ以上は保存しない (既定 5000)
+#   RAKUSHIFT_CAPTURE_SALT          id のハッシュの鍵。未設定ならプロセスごとに乱数
+# 匿名化: スタッフ・テナントの id は鍵付きハッシュ (同じリクエスト内では対応が保たれる)、
+# 名前・メールなど知らない列・申請の理由などの自由記述は落とす。
+# 設定も CONFIG_KEYS 以外 (パスワード・API キーなど) は落とす。
+# 保存は1リクエスト1ファイル (gzip した JSON)。書き込みは別スレッドで行い、
+# キューが詰まっていれば捨てる (本番の応答を待たせない)
+
+CAPTURE_DIR = os.environ.get("RAKUSHIFT_CAPTURE_DIR")
+MODE = os.environ.get("RAKUSHIFT_CAPTURE", "all")
+SLOW_SECONDS = float(os.environ.get("RAKUSHIFT_CAPTURE_SLOW_SECONDS", "10"))
+SAMPLE = float(os.environ.get("RAKUSHIFT_CAPTURE_SAMPLE", "1"))
+MAX_FILES = int(os.environ.get("RAKUSHIFT_CAPTURE_MAX_FILES", "5000"))
+_SALT = (os.environ.get("RAKUSHIFT_CAPTURE_SALT")
+         or "{:032x}".format(random.SystemRandom().getrandbits(128))).encode("utf-8")
+
+VERSION = 1
+
+# エンジンが読む列だけ残す
+STAFF_KEYS = ("role", "evaluation", "salary_type", "hourly_wage", "monthly_salary",
+              "max_days_week", "max_hours_day", "unavailable_dates", "stores",
+              "home_store")
+LEAVE_KEYS = ("type", "status", "dates", "start_time", "end_time")
+SHIFT_KEYS = ("date", "start_time", "end_time", "break_minutes")
+# 設定はエンジンが読む列だけ残す (パスワード・API キー・店名などは入れない)
+CONFIG_KEYS = ("opening_time", "closing_time", "opening_times", "staff_req",
+               "time_staff_req", "break_rules", "closed_days", "special_holidays",
+               "special_days", "custom_shifts", "hourly_wage_default",
+               "min_work_hours", "flex_shifts", "slot_minutes",
+               "coarse_slot_minutes", "solver_time_limit", "solver_threads",
+               "auto_tune", "presolve", "audit", "alternative_time_limit")
+
+_queue = queue.Queue(maxsize=32)
+_thread = None
+_lock = threading.Lock()
+_count = None
+stats = {"captured": 0, "skipped": 0, "dropped": 0, "errors": 0}
+
+
+def enabled():
+    return bool(CAPTURE_DIR)
+
+
+def hash_id(value):
+    if value is None or value == "":
+        return value
+    digest = hmac.new(_SALT, str(value).encode("utf-8"), hashlib.sha1)
+    return "h" + digest.hexdigest()[:12]
+
+
+def anonymize(body):
+    # body はリクエストの dict (ShiftRequest.model_dump()) 。元の dict は書き換えない
+    def shifts(rows):
+        return [dict({k: r[k] for k in SHIFT_KEYS if k in r},
+                     staff_id=hash_id(r.get("staff_id"))) for r in rows or ()]
+
+    staff = []
+    for st in body.get("staff_list") or ():
+        row = {k: st[k] for k in STAFF_KEYS if k in st}
+        row["id"] = hash_id(st.get("id"))
+        staff.append(row)
+    requests = [dict({k: r[k] for k in LEAVE_KEYS if k in r},
+                     staff_id=hash_id(r.get("staff_id")))
+                for r in body.get("requests") or ()]
+    config = {k: v for k, v in (body.get("config") or {}).items()
+              if k in CONFIG_KEYS}
+    out = dict(body, staff_list=staff, requests=requests, config=config,
+               fixed_shifts=shifts(body.get("fixed_shifts")),
+               hint_shifts=shifts(body.get("hint_shifts")),
+               shifts=shifts(body.get("shifts")),
+               contract_id=hash_id(body.get("contract_id")),
+               organization_id=hash_id(body.get("organization_id")),
+               # 再生で DB や AI を呼ばないように
+               persist=False, ai_hint=False)
+    out.pop("shop_password", None)
+    return out
+
+
+def outcome(response=None, error=None, reason=None):
+    # 応答から、再生で比べる結果の要約を作る
+    if reason is not None:
+        return {"status": "timeout" if reason == "deadline" else "cancelled",
+                "reason": reason}
+    if error is not None:
+        return {"status": "error", "message": str(error)[:200]}
+    response = response or {}
+    shifts = response.get("shifts") or []
+    status = "ok" if shifts else "failed"
+    meta = {"status": status, "mode": response.get("mode"),
+            "engine": response.get("engine"), "shift_count": len(shifts),
+            "shortage_lower_bound_hours": response.get("shortage_lower_bound_hours")}
+    summary = response.get("summary") or {}
+    for k in ("coverage_shortage_hours", "labor_cost", "objective"):
+        if k in summary:
+            meta[k] = summary[k]
+    predicted = (response.get("tuning") or {}).get("predicted") or {}
+    if "seconds" in predicted:
+        meta["predicted_seconds"] = predicted["seconds"]
+    if "audit" in response:
+        meta["violations_after"] = response["audit"].get("violations_after")
+    return meta
+
+
+def _wanted(meta):
+    if MODE == "failed":
+        return meta["status"] != "ok"
+    if MODE == "slow":
+        return meta["status"] != "ok" or meta["elapsed_sec"] >= SLOW_SECONDS
+    return SAMPLE >= 1 or random.random() < SAMPLE
+
+
+def submit(req, meta, elapsed, endpoint="/generate"):
+    # ハンドラーから呼ぶ。匿名化・書き込みは別スレッド
+    if not enabled():
+        return
+    meta = dict(meta, elapsed_sec=round(elapsed, 3), endpoint=endpoint,
+                captured_at=time.strftime("%Y-%m-%dT%H:%M:%S"))
+    if not _wanted(meta):
+        stats["skipped"] += 1
+        return
+    _start()
+    try:
+        _queue.put_nowait((req, meta))
+    except queue.Full:
+        stats["dropped"] += 1
+
+
+def _start():
+    global _thread
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_writer, name="capture", daemon=True)
+            _thread.start()
+
+
+def _writer():
+    while True:
+        req, meta = _queue.get()
+        try:
+            path = write(req.model_dump(), meta)
+            if path:
+                print("[Capture] {} ({}, {:.1f}s)".format(
+                    os.path.basename(path), meta["status"], meta["elapsed_sec"]))
+        except Exception as e:
+            stats["errors"] += 1
+            print("[Capture] failed: {}".format(e))
+
+
+def write(body, meta, directory=None):
+    global _count
+    directory = directory or CAPTURE_DIR
+    if _count is None:
+        _count = sum(1 for _ in _files(directory))
+    if _count >= MAX_FILES:
+        stats["skipped"] += 1
+        return None
+    request = anonymize(body)
+    raw = json.dumps(request, sort_keys=True, ensure_ascii=False,
+                     separators=(",", ":"), default=str)
+    digest = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+    day = time.strftime("%Y%m%d")
+    os.makedirs(os.path.join(directory, day), exist_ok=True)
+    path = os.path.join(directory, day, "{}-{}.json.gz".format(
+        time.strftime("%H%M%S"), digest))
+    record = {"version": VERSION, "fingerprint": digest, "meta": meta,
+              "request": request}
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump(record, f, ensure_ascii=False, separators=(",", ":"), default=str)
+    _count += 1
+    stats["captured"] += 1
+    return path
+
+
+def _files(directory):
+    for root, _, names in os.walk(directory):
+        for name in sorted(names):
+            if name.endswith(".json.gz") or name.endswith(".json"):
+                yield os.path.join(root, name)
+
+
+def load(directory):
+    # コーパスを読む。キャプチャ (*.json.gz) と /generate の本文そのまま (*.json) の両方。
+    # 同じ入力 (fingerprint) は最初の1件だけ
+    records = []
+    seen = set()
+    for path in sorted(_files(directory)):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        if "request" in data and "meta" in data:
+            fp = data.get("fingerprint")
+            if fp and fp in seen:
+                continue
+            seen.add(fp)
+            request, meta = data["request"], data["meta"]
+        else:
+            request, meta = data, {}
+        name = os.path.relpath(path, directory)
+        for ext in (".gz", ".json"):
+            if name.endswith(ext):
+                name = name[:-len(ext)]
+        records.append({"name": name, "request": request, "meta": meta})
+    return records
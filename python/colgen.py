@@ -0,0 +1,279 @@
+import time
+from bisect import bisect_left, bisect_right
+
+from scheduler import _load_pulp
+
+# 自由な開始・終了時刻(15/30分グリッド)のシフトを、列生成で必要な分だけ作る。
+# 制限主問題(RMP)の LP 緩和を解き、カバレッジ等の双対価格から
+# 被約費用が負になるシフト(列)だけを追加していく。
+# 生成された列のプールは ShiftScheduler._build_shift_options から使われ、
+# 本番の MILP はパターン方式と同程度の規模で済む。
+
+RANK_COST = {"A": 0, "B": 50, "C": 500, "D": 2000}
+
+
+class ColumnGenerator:
+
+    def __init__(self, scheduler, force=False):
+        self.sch = scheduler
+        self.force = force
+        flex = scheduler.flex
+        self.grid = int(flex.get("grid_minutes", 30))
+        self.default_min_hours = float(
+            flex.get("min_hours", scheduler.config.get("min_work_hours", 4)))
+        self.max_iterations = int(flex.get("max_iterations", 10))
+        # 1反復で1日あたりに追加する列数の上限(双対の退化で列が膨らむのを防ぐ)
+        self.columns_per_day = int(flex.get("columns_per_day", 4))
+        self.time_budget = float(flex.get("time_budget", 10))
+        # 目的関数の改善がこの値未満の反復が2回続いたら打ち切る(tailing-off 対策)
+        self.min_improvement = float(flex.get("min_improvement", 100))
+
+    def _hour_range(self, staff):
+        max_h = staff.max_hours
+        if max_h <= 0:
+            max_h = 8 if self.force else 0
+        min_h = float(staff.raw.get("min_hours_day") or self.default_min_hours)
+        return min(min_h, max_h), max_h
+
+    def _column_cost(self, staff, hours):
+        cost = RANK_COST.get(staff.rank, 50)
+        if staff.monthly:
+            cost -= self.sch.OBJECTIVE_WEIGHTS["monthly"]
+        if staff.hourly:
+            cost += staff.wage * hours * 0.01
+        return cost
+
+    def _make_option(self, start, end):
+        return {
+            "start": self.sch._from_minutes(start),
+            "end": self.sch._from_minutes(end),
+            "start_min": start, "end_min": end,
+            "hours": (end - start) / 60.0,
+        }
+
+    def _grid_points(self, open_min, close_min):
+        pts = {open_min, close_min}
+        t = -(-open_min // self.grid) * self.grid
+        while t < close_min:
+            pts.add(t)
+            t += self.grid
+        return sorted(pts)
+
+    def run(self):
+        pulp = _load_pulp()
+        sch = self.sch
+        started = time.perf_counter()
+
+        pool = {}
+        cells = []
+        for st in sch.staff_table:
+            sid = st.id
+            if not self.force and st.max_days <= 0:
+                continue
+            min_h, max_h = self._hour_range(st)
+            if max_h <= 0:
+                continue
+            for d in sch.dates:
+                if d in st.ng or sch._get_day_type(d) == "closed":
+                    continue
+                if sch._is_frozen(sid, d):
+                    continue
+                op, cl = sch._day_window(d)
+                if op >= cl:
+                    continue
+                # 初期列は従来のパターン(時間上限内のもの)
+                init = [o for o in sch._pattern_options(st, d, force=self.force)
+                        if min_h <= o["hours"] <= max_h]
+                pool[(sid, d)] = init
+                cells.append((st, d, op, cl, min_h, max_h))
+
+        slot_reqs = {d: sch._open_slot_requirements(d) for d in sch.dates}
+        self.weeks = sch._group_dates_by_week()
+        week_of = {}
+        for wi, week in enumerate(self.weeks):
+            for d in week:
+                week_of[d] = wi
+        self.windows = sch._seven_day_windows() if not self.force else []
+        seven_of = {}
+        for i, span in enumerate(self.windows):
+            for d in span:
+                seven_of.setdefault(d, []).append(i)
+
+        added_total = 0
+        iterations = 0
+        last_obj = None
+        stalled = 0
+        for it in range(self.max_iterations):
+            iterations = it + 1
+            sch.cancel.check()
+            master = self._solve_master(pulp, pool, slot_reqs, week_of,
+                                        self.time_budget - (time.perf_counter() - started))
+            if master is None:
+                break
+            obj, (cov_pi, mgr_pi, day_pi, week_pi, seven_pi) = master
+            if last_obj is not None and last_obj - obj < self.min_improvement:
+                stalled += 1
+                if stalled >= 2:
+                    break
+            else:
+                stalled = 0
+            last_obj = obj
+
+            best_by_day = {}
+            out_of_time = False
+            for st, d, op, cl, min_h, max_h in cells:
+                # 価格付けはスタッフ×日ごとなので、時間の上限もここで確かめる
+                if time.perf_counter() - started > self.time_budget:
+                    out_of_time = True
+                    break
+                sid = st.id
+                reqs = slot_reqs.get(d, {})
+                if not reqs:
+                    continue
+                # スロット双対価格の累積和で、任意区間の価値を二分探索で求める
+                slots = sorted(reqs)
+                cum = [0.0]
+                for t in slots:
+                    v = cov_pi.get((d, t), 0.0)
+                    if st.manager:
+                        v += mgr_pi.get((d, t), 0.0)
+                    cum.append(cum[-1] + v)
+                fixed = day_pi.get((sid, d), 0.0)
+                fixed += week_pi.get((sid, week_of.get(d)), 0.0)
+                for i in seven_of.get(d, []):
+                    fixed += seven_pi.get((sid, i), 0.0)
+
+                existing = {(o["start_min"], o["end_min"]) for o in pool[(sid, d)]}
+                pts = self._grid_points(op, cl)
+                best = None
+                for i, a in enumerate(pts):
+                    # 終了時刻は時間の下限〜上限に入るものだけ見る
+                    lo = bisect_left(pts, a + min_h * 60 - 1e-6, i + 1)
+                    hi = bisect_right(pts, a + max_h * 60 + 1e-6, lo)
+                    for b in pts[lo:hi]:
+                        hrs = (b - a) / 60.0
+                        if (a, b) in existing:
+                            continue
+                        value = (cum[bisect_left(slots, b)]
+                                 - cum[bisect_left(slots, a)])
+                        rc = self._column_cost(st, hrs) - value - fixed
+                        if rc < -1e-6 and (best is None or rc < best[0]):
+                            best = (rc, a, b)
+                if best is not None:
+                    best_by_day.setdefault(d, []).append(best + (sid,))
+
+            added = 0
+            for d, cands in best_by_day.items():
+                cands.sort()
+                for rc, a, b, sid in cands[:self.columns_per_day]:
+                    pool[(sid, d)].append(self._make_option(a, b))
+                    added += 1
+
+            added_total += added
+            if added == 0 and not out_of_time:
+                break
+            if out_of_time or time.perf_counter() - started > self.time_budget:
+                print("[ColGen] time budget reached")
+                break
+
+        print("[ColGen] iterations={} columns_added={} pool={} ({:.2f}s)".format(
+            iterations, added_total, sum(len(v) for v in pool.values()),
+            time.perf_counter() - started))
+        for opts in pool.values():
+            opts.sort(key=lambda o: (o["start_min"], o["end_min"]))
+        return pool
+
+    def _solve_master(self, pulp, pool, slot_reqs, week_of, budget=30):
+        sch = self.sch
+        # スラックの重みは本番の MILP と同じく 15 分あたり (スロットの長さで掛ける)
+        per_slot = sch.slot_minutes / 15.0
+        prob = pulp.LpProblem("RakuShift_RMP", pulp.LpMinimize)
+        obj = pulp.LpAffineExpression()
+        lam = {}
+        staff_by_id = sch._staff_by_id
+
+        for (sid, d), opts in pool.items():
+            s = staff_by_id[sid]
+            for k, o in enumerate(opts):
+                # 上限1は day 行で表現する(変数上限に双対価格が逃げないように)
+                v = pulp.LpVariable("l_{}_{}_{}".format(sid, d, k), 0)
+                lam[(sid, d, k)] = v
+                obj += v * self._column_cost(s, o["hours"])
+
+        day_rows = {}
+        for (sid, d), opts in pool.items():
+            if opts:
+                row = pulp.lpSum(lam[(sid, d, k)] for k in range(len(opts))) <= 1
+                day_rows[(sid, d)] = _add_row(
+                    prob, row, "day_{}_{}".format(sid, d))
+
+        week_rows = {}
+        seven_rows = {}
+        for st in sch.staff_table:
+            sid = st.id
+            max_days = st.max_days
+            effective = max_days if not self.force else max(max_days, 6)
+            by_week = {}
+            for d in sch.dates:
+                for k in range(len(pool.get((sid, d), []))):
+                    by_week.setdefault(week_of.get(d), []).append(lam[(sid, d, k)])
+            for wi, wv in by_week.items():
+                rest = effective - sch._fixed_days_in_week(sid, self.weeks[wi])
+                week_rows[(sid, wi)] = _add_row(
+                    prob, pulp.lpSum(wv) <= max(rest, 0),
+                    "wk_{}_{}".format(sid, wi))
+            for i, span in enumerate(self.windows):
+                sv = [lam[(sid, d, k)] for d in span
+                      for k in range(len(pool.get((sid, d), [])))]
+                if sv:
+                    rest = 6 - sch._fixed_days(sid, span)
+                    seven_rows[(sid, i)] = _add_row(
+                        prob, pulp.lpSum(sv) <= max(rest, 0),
+                        "sv_{}_{}".format(sid, i))
+
+        cov_rows = {}
+        mgr_rows = {}
+        for d in sch.dates:
+            for slot_min, req in slot_reqs.get(d, {}).items():
+                workers = []
+                mgrs = []
+                for st in sch.staff_table:
+                    sid = st.id
+                    for k, o in enumerate(pool.get((sid, d), [])):
+                        if o["start_min"] <= slot_min < o["end_min"]:
+                            workers.append(lam[(sid, d, k)])
+                            if sid in sch._manager_ids:
+                                mgrs.append(lam[(sid, d, k)])
+                slack = pulp.LpVariable("cs_{}_{}".format(d, slot_min), 0)
+                obj += slack * sch.OBJECTIVE_WEIGHTS["coverage"] * per_slot
+                cov_rows[(d, slot_min)] = _add_row(
+                    prob, pulp.lpSum(workers) + slack >= req,
+                    "cov_{}_{}".format(d, slot_min))
+                need = sch.min_manager - sch._fixed_cover(
+                    d, slot_min, sch._manager_ids)
+                if sch._manager_ids and need > 0:
+                    mslack = pulp.LpVariable("ms_{}_{}".format(d, slot_min), 0)
+                    obj += mslack * sch.OBJECTIVE_WEIGHTS["manager"] * per_slot
+                    mgr_rows[(d, slot_min)] = _add_row(
+                        prob, pulp.lpSum(mgrs) + mslack >= need,
+                        "mgr_{}_{}".format(d, slot_min))
+
+        prob += obj
+        sch.cancel.solve(prob, pulp.PULP_CBC_CMD(
+            msg=0, timeLimit=sch.cancel.time_limit(min(30, max(1.0, budget)))))
+        if pulp.LpStatus[prob.status] != "Optimal":
+            print("[ColGen] master status: {}".format(
+                pulp.LpStatus[prob.status]))
+            return None
+
+        def pis(rows):
+            return {k: c.pi or 0.0 for k, c in rows.items()}
+
+        return pulp.value(prob.objective), (
+            pis(cov_rows), pis(mgr_rows), pis(day_rows),
+            pis(week_rows), pis(seven_rows))
+
+
+def _add_row(prob, constraint, name):
+    prob.addConstraint(constraint, name)
+    return constraint
@@ -0,0 +1,202 @@
+"""
+エンジンの比較: 同じ入力のコーパスを複数のエンジンで並行に解き、
+インスタンスごとの実行時間・不足・人件費・ルール違反を並べる
+
+    python compare_engines.py --corpus corpus/ --engines tiered,legacy,greedy
+    python compare_engines.py --synthetic 8 --workers 2 --json result.json
+
+コーパスは /generate のリクエスト本文 (JSON) を1ファイル1件で置いたディレクトリ
+(capture.py で本番から取ったキャプチャ *.json.gz も読める)。
+評価はどのエンジンの結果も tiered のルールで行う
+(不足・人件費は scenarios.evaluate、違反は audit.count_violations)。
+並行に解くと CPU を取り合うので、実行時間を厳密に比べるときは --workers 1
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+# 人件費や不足と違って、あってはならない違反 (監査の絶対ルール)
+HARD_RULES = ("weekly_limit", "seven_day", "break", "unknown", "closed",
+              "ng_date", "frozen", "duplicate", "outside_hours")
+# 責任者・指導役の配置の不足 (スロット数)
+PLACEMENT_RULES = ("manager", "ojt")
+
+
+def load_corpus(path):
+    # /generate の本文 (*.json) と capture.py のキャプチャ (*.json.gz) の両方を読む
+    import capture
+    from schemas import ShiftRequest
+    from tenants import date_range
+    instances = []
+    for rec in capture.load(path):
+        req = ShiftRequest.model_validate(rec["request"])
+        dates = req.dates or date_range(req.start_date, req.end_date or req.start_date)
+        instances.append({
+            "name": rec["name"], "mode": req.mode, "engine": req.engine,
+            "meta": rec["meta"],
+            "inputs": {"staff_list": req.staff_list, "config": req.config,
+                       "dates": dates, "requests": req.requests,
+                       "fixed_shifts": req.fixed_shifts,
+                       "freeze_before": req.freeze_before},
+        })
+    return instances
+
+
+def synthetic(n):
+    from bench_tuning import grid, make_instance
+    instances = []
+    for i, params in enumerate(grid(quick=False)[::max(1, 96 // max(n, 1))][:n]):
+        staff, config, dates = make_instance(*params, seed=i)
+        config.pop("auto_tune", None)
+        instances.append({
+            "name": "syn{:02d}_{}x{}".format(i, params[0], params[1]),
+            "mode": "auto",
+            "inputs": {"staff_list": staff, "config": config, "dates": dates,
+                       "requests": [], "fixed_shifts": [],
+                       "freeze_before": None},
+        })
+    return instances
+
+
+def run_task(name, engine, inputs, mode, time_limit):
+    # プロセスプールのワーカーで実行される
+    import audit
+    import engines
+    import scenarios
+    from cancel import CancelToken
+
+    row = {"instance": name, "engine": engine}
+    inputs = dict(inputs, config=dict(inputs["config"]))
+    if time_limit:
+        inputs["config"]["solver_time_limit"] = time_limit
+    force = (mode == "force")
+    started = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            token = CancelToken(time_limit * 4 + 30 if time_limit else None)
+            run = engines.run(engine, inputs, force=force, cancel_token=token)
+            shifts = run["shifts"] or []
+            row.update(scenarios.evaluate(run["scheduler"], shifts))
+            violations = audit.count_violations(run["scheduler"], shifts,
+                                                force=force)
+        row["status"] = "ok" if run["shifts"] else "failed"
+        row["violations"] = violations
+        row["hard_violations"] = sum(violations.get(k, 0) for k in HARD_RULES)
+        row["placement_slots"] = sum(violations.get(k, 0) for k in PLACEMENT_RULES)
+        if run["ignored"]:
+            row["ignored"] = run["ignored"]
+    except Exception as e:
+        row["status"] = "error"
+        row["message"] = str(e)
+    row["elapsed_sec"] = round(time.perf_counter() - started, 3)
+    return row
+
+
+def _rank_key(row):
+    # 絶対ルールの違反 -> 不足 -> 責任者・指導役の配置 -> 人件費 の順に良い方
+    if row.get("status") != "ok":
+        return (1, 0, 0, 0, 0)
+    return (0, row["hard_violations"], row["shortage_hours"],
+            row["placement_slots"], row["labor_cost"])
+
+
+def summarize(rows, engine_names):
+    by_instance = {}
+    for r in rows:
+        by_instance.setdefault(r["instance"], []).append(r)
+    wins = {e: 0 for e in engine_names}
+    for group in by_instance.values():
+        best = min(group, key=_rank_key)
+        if best.get("status") == "ok":
+            for r in group:
+                if _rank_key(r) == _rank_key(best):
+                    wins[r["engine"]] += 1
+    summary = []
+    for e in engine_names:
+        mine = [r for r in rows if r["engine"] == e]
+        ok = [r for r in mine if r.get("status") == "ok"]
+        summary.append({
+            "engine": e,
+            "solved": len(ok),
+            "instances": len(mine),
+            "median_sec": round(statistics.median(
+                r["elapsed_sec"] for r in mine), 3) if mine else None,
+            "total_sec": round(sum(r["elapsed_sec"] for r in mine), 2),
+            "shortage_hours": round(sum(r["shortage_hours"] for r in ok), 2),
+            "labor_cost": sum(r["labor_cost"] for r in ok),
+            "overtime_hours": round(sum(r["overtime_hours"] for r in ok), 2),
+            "hard_violations": sum(r["hard_violations"] for r in ok),
+            "placement_slots": sum(r["placement_slots"] for r in ok),
+            "wins": wins[e],
+        })
+    return summary
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--corpus", help="リクエスト本文 (*.json) のディレクトリ")
+    ap.add_argument("--synthetic", type=int, default=0,
+                    help="コーパスの代わりに合成インスタンスを N 件")
+    ap.add_argument("--engines", default="tiered,legacy,greedy")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--time-limit", type=float, default=60,
+                    help="各エンジンのソルバー時間上限 (秒)")
+    ap.add_argument("--json", help="結果を書き出すファイル")
+    args = ap.parse_args()
+
+    import engines
+    engine_names = args.engines.split(",")
+    for e in engine_names:
+        engines.get(e)
+    instances = load_corpus(args.corpus) if args.corpus else []
+    if args.synthetic:
+        instances += synthetic(args.synthetic)
+    if not instances:
+        ap.error("--corpus か --synthetic を指定してください")
+
+    started = time.perf_counter()
+    rows = []
+    # 子プロセスが親の状態を持ち込まないよう spawn で起動する (scenarios.py と同じ)
+    with ProcessPoolExecutor(max_workers=max(1, args.workers),
+                             mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [pool.submit(run_task, inst["name"], e, inst["inputs"],
+                               inst["mode"], args.time_limit)
+                   for inst in instances for e in engine_names]
+        for fut in futures:
+            row = fut.result()
+            rows.append(row)
+            print("{:24s} {:8s} {:7s} {:7.2f}s shortage={:6.1f}h cost={:>9}"
+                  " placement={} hard={}".format(
+                      row["instance"][:24], row["engine"], row["status"],
+                      row["elapsed_sec"], row.get("shortage_hours", 0.0),
+                      row.get("labor_cost", "-"), row.get("placement_slots", "-"),
+                      row.get("hard_violations", "-")))
+
+    summary = summarize(rows, engine_names)
+    print("")
+    for s in summary:
+        print("{engine:8s} solved {solved}/{instances} median {median_sec}s"
+              " shortage {shortage_hours}h cost {labor_cost}"
+              " placement {placement_slots} hard violations {hard_violations}"
+              " wins {wins}".format(**s))
+    print("total {:.1f}s on {} worker(s)".format(
+        time.perf_counter() - started, args.workers))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "rows": rows}, f,
+                      ensure_ascii=False, indent=2)
+        print("wrote {}".format(args.json))
+
+
+if __name__ == "__main__":
+    main()
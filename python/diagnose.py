@@ -0,0 +1,301 @@
+import time
+
+# 解けなかった・足りなかった理由を、店長が直せる形 (日付・時間帯・スタッフ・ルール) で返す。
+#
+# diagnose_failure: Tier 3 が解を返さなかったとき、段を1つずつ緩めて解き直す前に
+#   (下界で割り当て可能な人日が 0 と分かって Tier 3 を組まなかった場合も含む)
+#   原因を分類して、次に試す段を直接決める
+#     error          モデル構築・ソルバーの例外        -> 貪欲 (下の段も同じ構築で落ちる)
+#     no_requirements 必要人数が1つもない              -> 何もしない
+#     infeasible     硬い制約どうしが矛盾              -> 弾性 LP で矛盾する行を特定し、
+#                    週上限・7連勤なら Tier 1、辞書式の段の固定行だけなら同じ段を重み付きで
+#     no_assignable_staff 誰も割り当てられない         -> Tier 1 (強行: 週上限・勤務時間を緩める)
+#     time_limit     時間内に整数解なし                -> 貪欲 (Tier 2 もほぼ同じ大きさ)
+# explain_shortage: 解けたが不足 (スラック > 0) が残った枠と、誰も入れず変数すらない枠ごとに、
+#   入れなかったスタッフとその理由 (NG 日・週上限・7連勤・時間帯が合わない など) を数える
+#
+# 弾性 LP: 硬い制約の各行に非負の弾性変数を足し、その合計を LP 緩和で最小化する。
+# 弾性が正になった行と、それと変数を共有して等号で効いている行が矛盾の核
+# (1回の LP で求める近似の IIS)
+
+MAX_CONFLICTS = 20
+ELASTIC_TIME_LIMIT = 10
+
+REASON_LABELS = {
+    "unavailable": "NG日・休み申請",
+    "fixed_other_hours": "確定済みシフトが別の時間帯",
+    "frozen": "確定済みの期間",
+    "max_days_zero": "週の出勤上限が0日",
+    "no_matching_shift": "この時間帯を含む勤務パターンがない",
+    "weekly_limit": "週の出勤上限に到達",
+    "consecutive_days": "7連勤になる",
+    "other_hours": "同じ日に別の時間帯で勤務",
+    "not_chosen": "割り当て可能だが選ばれなかった",
+}
+
+RULE_LABELS = {
+    "coverage": "必要人数",
+    "manager": "責任者の配置",
+    "ojt": "新人の指導役",
+}
+
+
+# ---------- 失敗の診断 ----------
+
+def diagnose_failure(sch, failure):
+    started = time.perf_counter()
+    failure = failure or {}
+    status = failure.get("status")
+    model = failure.get("model")
+    force = failure.get("force", False)
+    tier = failure.get("tier", 3)
+    result = {"tier_failed": tier, "status": status, "conflicts": []}
+
+    if failure.get("error"):
+        result.update(cause="error", fallback={"tier": 0},
+                      message="モデルの構築中にエラー: {}".format(failure["error"]))
+    elif not any(sch._build_slot_requirements(d) for d in sch.dates
+                 if sch._get_day_type(d) != "closed"):
+        result.update(cause="no_requirements", fallback={"tier": None},
+                      message="必要人数が設定された営業日がありません")
+    elif status in ("Infeasible", "Unbounded", "Undefined") and model is not None:
+        conflicts = elastic_conflicts(sch, model)
+        rules = {c["rule"] for c in conflicts}
+        result["conflicts"] = conflicts
+        if conflicts and rules <= {"lexicographic"}:
+            result.update(cause="lexicographic_numerics",
+                          fallback={"tier": tier, "objective": "weighted"},
+                          message="辞書式の段の固定で数値的に解けなくなったため、重み付きで解き直します")
+        elif rules & {"weekly_limit", "consecutive_days", "one_per_day",
+                      "max_days_zero"}:
+            result.update(cause="infeasible", fallback={"tier": 1},
+                          message="出勤日数の上限どうしが矛盾しています: {}".format(
+                              _describe(conflicts)))
+        else:
+            result.update(cause="infeasible", fallback={"tier": 2},
+                          message="制約が矛盾しています: {}".format(
+                              _describe(conflicts) or status))
+    elif status == "Skipped" or _has_values(model):
+        # 解は出たが誰も入っていない / 下界の計算で割り当て可能な人日が 0
+        blocked = _blocked_everywhere(sch, force)
+        result["blocked"] = blocked
+        result.update(cause="no_assignable_staff",
+                      fallback={"tier": 1} if not force else {"tier": 0},
+                      message="割り当てられるスタッフがいません ({})".format(
+                          ", ".join("{} {}名".format(REASON_LABELS[k], len(v))
+                                    for k, v in blocked.items()) or "-"))
+    else:
+        result.update(cause="time_limit", fallback={"tier": 0},
+                      message="{:.0f}秒以内に解が見つかりませんでした"
+                              " (solver_time_limit を延ばすか期間を短くしてください)".format(
+                                  sch.time_limit))
+    result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    print("[Diagnose] {} -> fallback tier {} ({:.1f}ms)".format(
+        result["cause"], result["fallback"]["tier"], result["elapsed_ms"]))
+    return result
+
+
+def _has_values(model):
+    if model is None:
+        return False
+    return any(v.varValue is not None for v in model["x"].values())
+
+
+def _blocked_everywhere(sch, force):
+    # 全期間で1日も割り当てられないスタッフを理由ごとに
+    blocked = {}
+    for st in sch.staff_table:
+        reasons = set()
+        for d in sch.dates:
+            if sch._get_day_type(d) == "closed":
+                continue
+            reason = _day_reason(sch, st, d, force)
+            if reason is None:
+                reasons = None
+                break
+            reasons.add(reason)
+        if reasons:
+            key = sorted(reasons)[0] if len(reasons) == 1 else "unavailable"
+            blocked.setdefault(key, []).append(st.name)
+    return blocked
+
+
+def _day_reason(sch, st, d, force):
+    # その日に新しく割り当てられない理由 (割り当てられるなら None)
+    if (st.id, d) in sch._fixed_keys:
+        return "fixed_other_hours"
+    if sch.freeze_before and d < sch.freeze_before:
+        return "frozen"
+    if d in st.ng:
+        return "unavailable"
+    if not force and st.max_days <= 0:
+        return "max_days_zero"
+    if not sch._build_shift_options(st, d, force=force):
+        return "no_matching_shift"
+    return None
+
+
+def elastic_conflicts(sch, model):
+    pulp = _pulp()
+    prob = model["prob"]
+    info = model.get("rows", {})
+    lp = pulp.LpProblem("RakuShift_elastic", pulp.LpMinimize)
+    elastic = {}
+    for name, c in prob.constraints.items():
+        expr = pulp.lpSum(a * v for v, a in c.items())
+        rhs = -c.constant
+        e = elastic[name] = pulp.LpVariable("e_{}".format(len(elastic)), 0)
+        if c.sense == pulp.LpConstraintLE:
+            lp += expr - e <= rhs
+        elif c.sense == pulp.LpConstraintGE:
+            lp += expr + e >= rhs
+        else:
+            e2 = pulp.LpVariable("e2_{}".format(len(elastic)), 0)
+            lp += expr + e - e2 == rhs
+            elastic[name] = e + e2
+    lp.setObjective(pulp.lpSum(elastic.values()))
+    # 診断も打ち切り (切断・期限) の対象にする
+    sch.cancel.solve(lp, pulp.PULP_CBC_CMD(
+        msg=0, mip=False, timeLimit=sch.cancel.time_limit(ELASTIC_TIME_LIMIT)))
+    conflicts = []
+    for name, e in elastic.items():
+        amount = pulp.value(e) or 0.0
+        if amount <= 1e-6:
+            continue
+        row = dict(info.get(name) or {"rule": _row_rule(name)})
+        row["row"] = name
+        row["violation"] = round(amount, 3)
+        conflicts.append(row)
+        if len(conflicts) >= MAX_CONFLICTS:
+            break
+    # 緩めた行と変数を共有していて、弾性解で等号になっている硬い行が矛盾の相手
+    for row in conflicts:
+        used = set(v.name for v in prob.constraints[row["row"]].keys())
+        partners = []
+        for name, meta in info.items():
+            if name == row["row"] or (pulp.value(elastic[name]) or 0.0) > 1e-6:
+                continue
+            c = prob.constraints[name]
+            if not used.intersection(v.name for v in c.keys()):
+                continue
+            lhs = sum(a * (v.varValue or 0.0) for v, a in c.items())
+            if abs(lhs + c.constant) <= 1e-6:
+                partners.append(meta)
+        # 「1日1本」より週上限・7連勤の方が説明になるので先に出す
+        partners.sort(key=lambda m: m["rule"] == "one_per_day")
+        row["binding"] = [_named(sch, dict(m)) for m in partners[:5]]
+        _named(sch, row)
+    return conflicts
+
+
+def _named(sch, row):
+    if "staff_id" in row:
+        row["staff"] = sch._staff_by_id[row["staff_id"]].name
+    return row
+
+
+def _row_rule(name):
+    if name.startswith("lex_"):
+        return "lexicographic"
+    if name.startswith("alt_"):
+        return "alternative"
+    return "other"
+
+
+def _describe(conflicts):
+    return ", ".join("{} {}".format(c.get("staff", ""), c["rule"]).strip()
+                     for c in conflicts[:5])
+
+
+def _pulp():
+    from scheduler import _load_pulp
+    return _load_pulp()
+
+
+# ---------- 不足の説明 ----------
+
+def explain_shortage(sch, model, limit=MAX_CONFLICTS):
+    started = time.perf_counter()
+    short = {}
+    for (rule, d, t), v in model.get("slacks", {}).items():
+        if v.varValue is not None and v.varValue > 0.5:
+            short.setdefault((rule, d), {})[t] = int(round(v.varValue))
+    for (d, t), need in model.get("uncovered", {}).items():
+        short.setdefault(("coverage", d), {})[t] = need
+    if not short:
+        return None
+
+    force = model["force"]
+    working = {}
+    days_worked = {}
+    for sid, d, oi in sch._chosen(model):
+        working[(sid, d)] = model["staff_opts"][(sid, d)][oi]
+        days_worked.setdefault(sid, set()).add(d)
+    for f in sch.fixed_shifts:
+        working.setdefault((f["staff_id"], f["date"]), f)
+        days_worked.setdefault(f["staff_id"], set()).add(f["date"])
+    spans = sch._seven_day_windows() if not force else []
+
+    candidates = {
+        "coverage": sch.staff_table,
+        "manager": [st for st in sch.staff_table if st.id in sch._manager_ids],
+        "ojt": [st for st in sch.staff_table if st.id in sch._mentor_ids],
+    }
+    items = []
+    totals = {}
+    short_hours = {}
+    for (rule, d), slots in short.items():
+        blocked = {}
+        for st in candidates[rule]:
+            reason = _slot_reason(sch, st, d, slots, working, days_worked,
+                                  spans, force)
+            if reason:
+                blocked.setdefault(reason, []).append(st.name)
+                totals[reason] = totals.get(reason, 0) + 1
+        hours = sum(slots.values()) * sch.slot_hours
+        short_hours[rule] = short_hours.get(rule, 0.0) + hours
+        items.append({
+            "rule": rule, "date": d,
+            "ranges": sch._compress_ranges(slots),
+            "short_hours": hours,
+            "blocked": blocked,
+        })
+    items.sort(key=lambda c: -c["short_hours"])
+    shown = sorted(items[:limit], key=lambda c: (c["date"], c["rule"]))
+    top = max(totals, key=totals.get) if totals else None
+    return {
+        "short_hours": {k: round(v, 2) for k, v in short_hours.items()},
+        "blocked_totals": totals,
+        "top_reason": top,
+        "message": "{}で不足。主な理由: {}".format(
+            "・".join(RULE_LABELS[k] for k in short_hours),
+            REASON_LABELS.get(top, "-")),
+        "conflicts": shown,
+        "truncated": max(0, len(items) - limit),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def _slot_reason(sch, st, d, slots, working, days_worked, spans, force):
+    # 不足した枠 (slots) をこのスタッフが埋めていない理由。埋めていれば None
+    shift = working.get((st.id, d))
+    if shift is not None:
+        a, b = shift["start_min"], shift["end_min"]
+        if any(a <= t < b for t in slots):
+            return None
+        return "fixed_other_hours" if (st.id, d) in sch._fixed_keys else "other_hours"
+    reason = _day_reason(sch, st, d, force)
+    if reason:
+        return reason
+    if not any(o["start_min"] <= t < o["end_min"]
+               for o in sch._build_shift_options(st, d, force=force) for t in slots):
+        return "no_matching_shift"
+    worked = days_worked.get(st.id, set())
+    effective = st.max_days if not force else max(st.max_days, 6)
+    week = sch._iso_week(d)
+    if sum(1 for w in worked if sch._iso_week(w) == week) >= effective:
+        return "weekly_limit"
+    for span in spans:
+        if d in span and sum(1 for w in span if w in worked) >= 6:
+            return "consecutive_days"
+    return "not_chosen"
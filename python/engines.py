@@ -0,0 +1,89 @@
+import os
+import time
+
+# シフト作成エンジンの登録簿。リクエストの engine で実装を名前で選ぶ
+# (未指定なら RAKUSHIFT_ENGINE、既定は tiered)。
+#   tiered  scheduler.ShiftScheduler.solve (段階的に緩める MILP -> 貪欲)
+#   legacy  scheduler_backup.ShiftScheduler.solve (_solve_optimized -> _solve_fallback)
+#           確定済みシフト・freeze_before・キャンセルは扱わない (ignored に出す)
+#   greedy  scheduler.ShiftScheduler._solve_greedy だけ (比較の基準)
+# どのエンジンの結果も、監査・保存・比較は tiered のスケジューラーのルールで行う
+# (run() が返す scheduler)。新しい実装は register() で登録する。
+# 入力は {"staff_list", "config", "dates", "requests", "fixed_shifts", "freeze_before"}
+
+TIERED = "tiered"
+DEFAULT_ENGINE = os.environ.get("RAKUSHIFT_ENGINE", TIERED)
+
+_ENGINES = {}
+
+
+def register(name, solve, description=""):
+    # solve(inputs, sch, force, objective) -> シフトのリスト (解けなければ None)
+    #   sch は入力から作った tiered のスケジューラー (使っても使わなくてもよい)
+    _ENGINES[name] = {"name": name, "solve": solve, "description": description}
+
+
+def names():
+    return sorted(_ENGINES)
+
+
+def describe():
+    return [{"name": e["name"], "description": e["description"],
+             "default": e["name"] == DEFAULT_ENGINE}
+            for e in sorted(_ENGINES.values(), key=lambda e: e["name"])]
+
+
+def get(name=None):
+    name = name or DEFAULT_ENGINE
+    engine = _ENGINES.get(name)
+    if engine is None:
+        raise ValueError("unknown engine: {} (available: {})".format(
+            name, ", ".join(names())))
+    return engine
+
+
+def run(name, inputs, force=False, objective="weighted", cancel_token=None):
+    from scheduler import ShiftScheduler
+    engine = get(name)
+    started = time.perf_counter()
+    sch = ShiftScheduler(
+        inputs["staff_list"], inputs["config"], inputs["dates"],
+        inputs.get("requests"), fixed_shifts=inputs.get("fixed_shifts"),
+        freeze_before=inputs.get("freeze_before"), cancel_token=cancel_token)
+    shifts = engine["solve"](inputs, sch, force, objective)
+    elapsed = time.perf_counter() - started
+    print("[Engine] {} -> {} shifts ({:.2f}s)".format(
+        engine["name"], len(shifts or ()), elapsed))
+    return {"engine": engine["name"], "shifts": shifts, "scheduler": sch,
+            "elapsed_sec": round(elapsed, 3),
+            "ignored": _ignored(engine["name"], inputs)}
+
+
+def _ignored(name, inputs):
+    # legacy が読まない入力 (結果を比べるときの注意書き)
+    if name != "legacy":
+        return []
+    return [k for k in ("fixed_shifts", "freeze_before") if inputs.get(k)]
+
+
+# ---------- 登録済みのエンジン ----------
+
+def _solve_tiered(inputs, sch, force, objective):
+    return sch.solve(force=force, objective=objective)
+
+
+def _solve_legacy(inputs, sch, force, objective):
+    # 旧実装は pulp を import 時に読むので、使うときだけ読み込む
+    from scheduler_backup import ShiftScheduler as LegacyScheduler
+    legacy = LegacyScheduler(inputs["staff_list"], inputs["config"],
+                             sorted(inputs["dates"]), inputs.get("requests") or [])
+    return legacy.solve(force=force)
+
+
+def _solve_greedy(inputs, sch, force, objective):
+    return sch._solve_greedy()
+
+
+register(TIERED, _solve_tiered, "段階的に緩める MILP (Tier 3 -> 2 -> 1 -> 貪欲)")
+register("legacy", _solve_legacy, "旧実装 (scheduler_backup: 最適化 -> 貪欲)")
+register("greedy", _solve_greedy, "貪欲法のみ (比較の基準)")
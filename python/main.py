@@ -1,11 +1,51 @@
+import time
+_import_started = time.perf_counter()
+
+import asyncio
 import os
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from datetime import date
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Dict, Any
 from scheduler import ShiftScheduler
+from audit import audit_and_repair
+import analytics
+import capture
+import db
+import engines
+import multi_store
+import scenarios
+from schemas import (AnalyticsRequest, MultiStoreRequest, ScenarioRequest,
+                     ShiftRequest)
+import tenants
+import warmup
+import wire
+from admission import AdmissionController, Rejected
+import cancel
+from cancel import CancelToken, Cancelled
+
+warmup.record_import(_import_started)
+
+# クライアント切断の確認間隔 (秒)
+DISCONNECT_POLL_SECONDS = 0.5
+# 1回の /generate で返す別解の上限
+MAX_ALTERNATIVES = 5
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Cloud Run はスタートアップ完了までトラフィックを流さないので、ここで温める
+    if warmup.enabled():
+        warmup.warm_up()
+    if db.enabled() and os.environ.get("RAKUSHIFT_TENANT_LISTEN", "1") != "0":
+        tenants.store.start_listener()
+    yield
+    scenarios.shutdown()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
+admission = AdmissionController()
 
 app.add_middleware(
     CORSMiddleware,
@@ -16,52 +56,482 @@ app.add_middleware(
 )
 
 
-class ShiftRequest(BaseModel):
-    staff_list: List[Dict[str, Any]]
-    config: Dict[str, Any]
-    dates: List[str]
-    requests: List[Dict[str, Any]] = []
-    mode: str = "auto"
-
-
 @app.get("/")
 def read_root():
-    return {"status": "ok", "message": "Rakushift Engine is Ready"}
+    return {"status": "ok", "message": "Rakushift Engine is Ready",
+            "startup": warmup.STATS}
+
+
+@app.get("/engines")
+def read_engines():
+    return {"status": "ok", "engines": engines.describe()}
+
+
+@app.get("/metrics")
+def read_metrics():
+    return {"status": "ok", "admission": admission.metrics(),
+            "tenants": tenants.store.metrics(),
+            "analytics": analytics.cache.stats,
+            "capture": capture.stats}
+
+
+def _rejected(request, e):
+    return wire.respond(
+        request, {"status": "error", "message": e.message,
+                  "retry_after": e.retry_after},
+        status_code=e.status, headers={"Retry-After": str(e.retry_after)})
+
+
+def _unauthorized(request, e):
+    return wire.respond(request, {"status": "error", "message": str(e)},
+                        status_code=401)
+
+
+def _resolve(req):
+    # contract_id だけのリクエストを、DB から読んだテナントのデータで埋める。
+    # 読み込んだ場合は /check の結果キャッシュ用のキーを返す
+    if not req.dates and req.start_date:
+        req.dates = tenants.date_range(req.start_date, req.end_date or req.start_date)
+    if req.staff_list or not req.contract_id:
+        return None
+    snap = tenants.store.snapshot(req.contract_id, req.shop_password)
+    # リクエストの config は DB の値より優先する (エンジン専用の設定など)
+    overrides = req.config
+    req.config = {**snap["config"], **overrides}
+    req.staff_list = snap["staff_list"]
+    req.requests = snap["requests"]
+    # 確定済みシフトはパスワードを確かめたテナントのものだけ読む
+    req.organization_id = snap["organization_id"]
+    if req.freeze_before is None:
+        req.freeze_before = date.today().isoformat()
+    if not req.fixed_shifts and req.dates:
+        req.fixed_shifts = tenants.store.fixed_shifts(
+            req.organization_id, req.dates, req.freeze_before,
+            keep_existing=req.keep_existing)
+    return (req.contract_id, snap["version"], tuple(req.dates),
+            req.freeze_before,
+            tenants.fingerprint(overrides, req.fixed_shifts))
+
+
+def _run_check(req):
+    key = _resolve(req)
+
+    def check():
+        scheduler = ShiftScheduler(
+            req.staff_list, req.config, req.dates, req.requests,
+            fixed_shifts=req.fixed_shifts, freeze_before=req.freeze_before)
+        return scheduler.pre_check()
+
+    result = tenants.store.cached_result(key, check) if key else check()
+    return {"status": "success", "check": result}
+
+
+def _run_audit(req):
+    _resolve(req)
+    scheduler = ShiftScheduler(
+        req.staff_list, req.config, req.dates, req.requests,
+        fixed_shifts=req.fixed_shifts, freeze_before=req.freeze_before)
+    shifts, report = audit_and_repair(
+        scheduler, req.shifts, force=(req.mode == "force"))
+    return {"status": "success", "shifts": shifts, "audit": report}
+
+
+def _run_analytics(req):
+    # 期間の人件費・人時・充足率・残業。
+    # DB から読んだ場合はシフトに版がないので RAKUSHIFT_ANALYTICS_TTL 秒だけ使い回す
+    start = req.start_date or (min(req.dates) if req.dates else None)
+    end = req.end_date or (max(req.dates) if req.dates else start)
+    if not start:
+        raise ValueError("start_date is required")
+    from_db = not req.staff_list and req.contract_id
+    if from_db:
+        snap = tenants.store.snapshot(req.contract_id, req.shop_password)
+        req.config = {**snap["config"], **req.config}
+        req.staff_list = snap["staff_list"]
+        org = snap["organization_id"]
+        key = (req.tenant(), start, end, snap["version"],
+               tenants.fingerprint(req.config))
+    else:
+        key = (req.tenant(), start, end,
+               tenants.fingerprint(req.staff_list, req.config, req.shifts))
+
+    result = analytics.cache.get(key, expires=from_db)
+    cached = result is not None
+    if result is None:
+        if from_db:
+            req.shifts = tenants.store.shifts_between(org, start, end)
+        result = analytics.compute(req.staff_list, req.config, req.shifts,
+                                   start, end)
+        analytics.cache.put(key, result)
+    response = {"status": "success", "analytics": result, "cached": cached}
+    if req.now:
+        shifts = req.shifts
+        if from_db and (cached or not start <= req.now[:10] <= end):
+            shifts = tenants.store.shifts_between(org, req.now[:10], req.now[:10])
+        response["today"] = analytics.today_status(req.staff_list, shifts, req.now)
+    return response
+
+
+def _ai_draft(req):
+    # AI の案は初期解のヒントにするだけなので、失敗してもそのまま解く
+    from ai_scheduler import AIShiftScheduler, GEMINI_BASE_URL
+    # キーはリクエストの config → テナントの DB (このときだけ読む) → 環境変数の順
+    key = req.config.get("gemini_api_key")
+    if not key and req.contract_id and req.shop_password and db.enabled():
+        try:
+            key = tenants.store.api_key(req.contract_id, req.shop_password)
+        except Exception as e:
+            print("AI key lookup failed: {}".format(e))
+    key = key or os.environ.get("GEMINI_API_KEY")
+    base_url = os.environ.get("RAKUSHIFT_AI_BASE_URL") or GEMINI_BASE_URL
+    try:
+        ai = AIShiftScheduler(key, base_url=base_url)
+        return ai.generate(req.staff_list, req.config, req.dates,
+                           req.requests, chunked=True)
+    except Exception as e:
+        print("AI hint skipped: {}".format(e))
+        return []
+
+
+def _persist(req, scheduler, response):
+    # 保存できたらシフト本体は返さず要約だけにする。失敗時はシフトを返して
+    # クライアント側の保存にまかせる。
+    # 保存先はパスワードを確かめたテナントの組織だけ (本文の organization_id は使わない)
+    try:
+        org = tenants.store.snapshot(
+            req.contract_id, req.shop_password)["organization_id"]
+        response["persisted"] = db.persist_shifts(
+            org, req.dates, response["shifts"],
+            keep_before=req.freeze_before,
+            keep_keys=scheduler._fixed_keys)
+    except Exception as e:
+        print("Persist Error: {}".format(e))
+        response["persist_error"] = str(e)
+        return
+    analytics.cache.invalidate(req.tenant())
+    response["shift_count"] = len(response.pop("shifts"))
+    if "audit" in response:
+        audit = response["audit"]
+        response["audit"] = {k: audit[k] for k in
+                             ("violations_before", "violations_after", "moves")}
+
+
+def _run_generate(req, token=None):
+    _resolve(req)
+    engine = engines.get(req.engine)["name"]
+    print("Received request: {} staff, {} dates, mode={} engine={}".format(
+        len(req.staff_list), len(req.dates), req.mode, engine))
+    if engine != engines.TIERED:
+        return _run_engine(req, engine, token)
 
+    hints = req.hint_shifts
+    if req.ai_hint and not hints:
+        hints = _ai_draft(req)
 
+    scheduler = ShiftScheduler(
+        req.staff_list, req.config, req.dates, req.requests,
+        fixed_shifts=req.fixed_shifts, freeze_before=req.freeze_before,
+        cancel_token=token, hint_shifts=hints)
+
+    force = (req.mode == "force")
+    result = scheduler.solve(force=force, objective=req.objective)
+
+    bound = scheduler.bound or {}
+    # 確定済みシフトで足りている期間は、空のシフトで成功とする (診断はしない)
+    nothing_to_do = (scheduler.solved_with or {}).get("nothing_to_do", False)
+    if result or nothing_to_do:
+        response = {
+            "status": "success",
+            "mode": "math_force" if force else "math",
+            "engine": engines.TIERED,
+            "shifts": result,
+            "fixed_count": len(scheduler.fixed_shifts),
+            "shortage_lower_bound_hours": bound.get("lower_bound_hours"),
+        }
+        if nothing_to_do:
+            response["nothing_to_do"] = True
+        if scheduler.hint_report:
+            response["hint"] = scheduler.hint_report
+        if scheduler.tuning:
+            response["tuning"] = scheduler.tuning
+        if scheduler.presolve_report:
+            response["presolve"] = scheduler.presolve_report
+        if scheduler.multires_report:
+            response["multires"] = scheduler.multires_report
+        if scheduler.diagnosis:
+            response["diagnosis"] = scheduler.diagnosis
+        if scheduler.shortages:
+            response["shortages"] = scheduler.shortages
+        summary = scheduler.solution_summary()
+        if summary:
+            response["summary"] = summary
+        if req.alternatives > 0:
+            response["alternatives"] = scheduler.solve_alternatives(
+                min(req.alternatives, MAX_ALTERNATIVES),
+                min_diff=req.alternatives_min_diff,
+                gap=req.alternatives_gap)
+        # 緩和した段(Tier 1 / 貪欲)の解は、その段の上限で監査する
+        solved = scheduler.solved_with or {}
+        audit_force = force or solved.get("force", False)
+        if _audit_wanted(req, solved, summary):
+            response["shifts"], response["audit"] = audit_and_repair(
+                scheduler, result, force=audit_force)
+            for alt in response.get("alternatives", ()):
+                alt["shifts"], report = audit_and_repair(
+                    scheduler, alt["shifts"], force=audit_force)
+                alt["audit"] = {k: report[k] for k in
+                                ("violations_before", "violations_after", "moves")}
+        if req.persist:
+            _persist(req, scheduler, response)
+        return response
+    else:
+        return {"status": "success", "mode": "math_failed", "shifts": [],
+                "shortage_lower_bound_hours": bound.get("lower_bound_hours"),
+                "diagnosis": scheduler.diagnosis, "tuning": scheduler.tuning}
+
+
+def _audit_wanted(req, solved, summary):
+    # audit を指定しなければ、Tier 3 が最適解で不足なしと示した解は監査しない
+    # (同じルールをソルバーが確かめ済みで、局所探索で直せるものがない)
+    if req.audit is not None:
+        return req.audit
+    if solved.get("nothing_to_do"):
+        return False
+    proven = (solved.get("tier") == 3 and solved.get("status") == "Optimal"
+              and summary is not None
+              and not any(summary[k] for k in ("coverage_shortage_hours",
+                                               "manager_shortage_hours",
+                                               "ojt_violation_hours")))
+    return not proven
+
+
+def _run_engine(req, engine, token):
+    # tiered 以外のエンジン。監査・保存は tiered のスケジューラーのルールで行う
+    force = (req.mode == "force")
+    run = engines.run(engine, _inputs(req), force=force,
+                      objective=req.objective, cancel_token=token)
+    scheduler = run["scheduler"]
+    if not run["shifts"]:
+        return {"status": "success", "mode": "math_failed", "engine": engine,
+                "shifts": [], "elapsed_sec": run["elapsed_sec"]}
+    response = {
+        "status": "success",
+        "mode": "math_force" if force else "math",
+        "engine": engine,
+        "shifts": run["shifts"],
+        "fixed_count": len(scheduler.fixed_shifts),
+        "elapsed_sec": run["elapsed_sec"],
+    }
+    if run["ignored"]:
+        response["ignored"] = run["ignored"]
+    if req.audit is not False:
+        response["shifts"], response["audit"] = audit_and_repair(
+            scheduler, run["shifts"], force=force)
+    if req.persist:
+        _persist(req, scheduler, response)
+    return response
+
+
+def _inputs(req):
+    _resolve(req)
+    return {"staff_list": req.staff_list, "config": req.config,
+            "dates": req.dates, "requests": req.requests,
+            "fixed_shifts": req.fixed_shifts,
+            "freeze_before": req.freeze_before}
+
+
+async def _run_scenarios(req, token, tenant):
+    scenarios.validate(req.scenarios)
+    base = await run_in_threadpool(_inputs, req)
+    runs = list(req.scenarios)
+    if req.include_base:
+        runs.insert(0, {"name": "base", "deltas": []})
+    result = await scenarios.run_all(
+        base, runs, req.mode, req.budget_seconds or scenarios.DEFAULT_BUDGET,
+        token, slots=admission.borrow(tenant))
+    return {"status": "success", **result}
+
+
+async def _run_multi_store(req, token, tenant):
+    multi_store.validate(req.stores, req.staff_list)
+    dates = req.dates
+    if not dates and req.start_date:
+        dates = tenants.date_range(req.start_date, req.end_date or req.start_date)
+    if not dates:
+        raise ValueError("dates or start_date is required")
+    coordinator = await run_in_threadpool(
+        multi_store.Coordinator, req.stores, req.staff_list, dates, req.requests,
+        mode=req.mode, freeze_before=req.freeze_before,
+        budget=req.budget_seconds or multi_store.DEFAULT_BUDGET,
+        max_rounds=req.max_rounds or multi_store.DEFAULT_ROUNDS)
+    result = await coordinator.run(token, slots=admission.borrow(tenant))
+    return {"status": "success", **result}
+
+
+async def _admission_key(request, req):
+    # 公平性のキー。本文の contract_id は誰でも名乗れるので、店舗パスワードを
+    # 確かめられたテナントだけその名前で数え、それ以外は接続元の IP ごとに数える
+    if req.contract_id and req.shop_password and db.enabled():
+        try:
+            await run_in_threadpool(tenants.store.snapshot, req.contract_id,
+                                    req.shop_password)
+            return "tenant:{}".format(req.contract_id)
+        except tenants.Unauthorized:
+            raise
+        except Exception as e:
+            print("Tenant lookup for admission failed: {}".format(e))
+    return "ip:{}".format(request.client.host if request.client else "unknown")
+
+
+async def _watch(request, token):
+    # 切断と期限切れを監視し、検知したらトークン経由で CBC を止める
+    while not token.cancelled:
+        if await request.is_disconnected():
+            token.cancel("disconnect")
+            return
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+
+def _cancelled(request, e, token):
+    admission.record_cancel(e.reason, token.elapsed())
+    if e.reason == "deadline":
+        return wire.respond(
+            request, {"status": "error", "reason": e.reason,
+                      "message": "計算が期限内に終わらなかったため中止しました"},
+            status_code=504)
+    # 切断済みなので誰も読まないが、ログ上は 499 (client closed request) とする
+    return wire.respond(request, {"status": "error", "reason": e.reason},
+                        status_code=499)
+
+
+# JSON / 列指向JSON / MessagePack を Content-Type と Accept で切り替える
 @app.post("/check")
-def check_feasibility(req: ShiftRequest):
+async def check_feasibility(request: Request):
     try:
-        scheduler = ShiftScheduler(
-            req.staff_list, req.config, req.dates, req.requests)
-        result = scheduler.pre_check()
-        return {"status": "success", "check": result}
+        req = await wire.read_request(request, ShiftRequest)
+        # /check は軽いので長いソルブの待ち行列とは別枠で通す
+        async with admission.check_slot():
+            result = await run_in_threadpool(_run_check, req)
+        return wire.respond(request, result)
+    except tenants.Unauthorized as e:
+        return _unauthorized(request, e)
     except Exception as e:
         print("Check Error: {}".format(e))
-        return {"status": "error", "message": str(e)}
+        return wire.respond(request, {"status": "error", "message": str(e)})
 
 
-@app.post("/generate")
-def generate_shifts(req: ShiftRequest):
-    print("Received request: {} staff, {} dates, mode={}".format(
-        len(req.staff_list), len(req.dates), req.mode))
-
+@app.post("/audit")
+async def audit_shifts(request: Request):
     try:
-        scheduler = ShiftScheduler(
-            req.staff_list, req.config, req.dates, req.requests)
+        req = await wire.read_request(request, ShiftRequest)
+        # 監査は局所探索だけなので /check と同じ枠で通す
+        async with admission.check_slot():
+            result = await run_in_threadpool(_run_audit, req)
+        return wire.respond(request, result)
+    except tenants.Unauthorized as e:
+        return _unauthorized(request, e)
+    except Exception as e:
+        print("Audit Error: {}".format(e))
+        return wire.respond(request, {"status": "error", "message": str(e)})
 
-        force = (req.mode == "force")
-        result = scheduler.solve(force=force)
 
-        if result:
-            return {
-                "status": "success",
-                "mode": "math_force" if force else "math",
-                "shifts": result
-            }
-        else:
-            return {"status": "success", "mode": "math_failed", "shifts": []}
+@app.post("/analytics")
+async def read_analytics(request: Request):
+    try:
+        req = await wire.read_request(request, AnalyticsRequest)
+        async with admission.check_slot():
+            result = await run_in_threadpool(_run_analytics, req)
+        return wire.respond(request, result)
+    except tenants.Unauthorized as e:
+        return _unauthorized(request, e)
+    except Exception as e:
+        print("Analytics Error: {}".format(e))
+        return wire.respond(request, {"status": "error", "message": str(e)})
 
+
+@app.post("/generate")
+async def generate_shifts(request: Request):
+    token = None
+    req = None
+    try:
+        req = await wire.read_request(request, ShiftRequest)
+        tenant = await _admission_key(request, req)
+        token = CancelToken(req.deadline_seconds or cancel.DEFAULT_DEADLINE)
+        watcher = asyncio.create_task(_watch(request, token))
+        try:
+            async with admission.solve_slot(tenant, token):
+                result = await run_in_threadpool(_run_generate, req, token)
+        finally:
+            watcher.cancel()
+        capture.submit(req, capture.outcome(result), token.elapsed())
+        return wire.respond(request, result)
+    except Rejected as e:
+        print("Rejected: {} (retry after {}s)".format(e.message, e.retry_after))
+        return _rejected(request, e)
+    except Cancelled as e:
+        print("Cancelled: {} after {:.1f}s".format(e.reason, token.elapsed()))
+        capture.submit(req, capture.outcome(reason=e.reason), token.elapsed())
+        return _cancelled(request, e, token)
+    except tenants.Unauthorized as e:
+        return _unauthorized(request, e)
     except Exception as e:
         print("Error: {}".format(e))
-        return {"status": "error", "message": str(e)}
+        if token is not None:
+            capture.submit(req, capture.outcome(error=e), token.elapsed())
+        return wire.respond(request, {"status": "error", "message": str(e)})
+
+
+@app.post("/scenarios")
+async def run_scenarios(request: Request):
+    token = None
+    try:
+        req = await wire.read_request(request, ScenarioRequest)
+        tenant = await _admission_key(request, req)
+        token = CancelToken(req.deadline_seconds or cancel.DEFAULT_DEADLINE)
+        watcher = asyncio.create_task(_watch(request, token))
+        try:
+            # 1件目はこの枠で解き、2件目以降は空き枠を借りられたときだけ並べる
+            async with admission.solve_slot(tenant, token):
+                result = await _run_scenarios(req, token, tenant)
+        finally:
+            watcher.cancel()
+        return wire.respond(request, result)
+    except Rejected as e:
+        print("Rejected: {} (retry after {}s)".format(e.message, e.retry_after))
+        return _rejected(request, e)
+    except Cancelled as e:
+        print("Cancelled: {} after {:.1f}s".format(e.reason, token.elapsed()))
+        return _cancelled(request, e, token)
+    except tenants.Unauthorized as e:
+        return _unauthorized(request, e)
+    except Exception as e:
+        print("Scenario Error: {}".format(e))
+        return wire.respond(request, {"status": "error", "message": str(e)})
+
+
+@app.post("/multi_store")
+async def run_multi_store(request: Request):
+    token = None
+    try:
+        req = await wire.read_request(request, MultiStoreRequest)
+        tenant = await _admission_key(request, req)
+        token = CancelToken(req.deadline_seconds or cancel.DEFAULT_DEADLINE)
+        watcher = asyncio.create_task(_watch(request, token))
+        try:
+            # 店舗ごとの部分問題も、この枠に加えて空き枠を借りられた分だけ並べる
+            async with admission.solve_slot(tenant, token):
+                result = await _run_multi_store(req, token, tenant)
+        finally:
+            watcher.cancel()
+        return wire.respond(request, result)
+    except Rejected as e:
+        print("Rejected: {} (retry after {}s)".format(e.message, e.retry_after))
+        return _rejected(request, e)
+    except Cancelled as e:
+        print("Cancelled: {} after {:.1f}s".format(e.reason, token.elapsed()))
+        return _cancelled(request, e, token)
+    except tenants.Unauthorized as e:
+        return _unauthorized(request, e)
+    except Exception as e:
+        print("MultiStore Error: {}".format(e))
+        return wire.respond(request, {"status": "error", "message": str(e)})
@@ -0,0 +1,421 @@
+import io
+import time
+from contextlib import redirect_stdout
+
+import scenarios
+from cancel import CancelToken, Cancelled
+from tenants import fingerprint
+
+# 複数店舗のシフトを、店舗ごとの部分問題に分けて解く。
+#   - スタッフは共通のプール。staff["stores"] で入れる店舗を指定する
+#     (なければ home_store の1店舗、どちらもなければ全店舗)
+#   - 2店舗以上に入れるスタッフ (共有スタッフ) の各日は、どれか1店舗だけが持つ。
+#     持っていない店舗ではその日を NG 日として渡すので、同じ日に2店舗で
+#     勤務することはない (= 同じ時刻の二重勤務も起きない)
+#   - 店舗ごとの部分問題は ShiftScheduler そのまま。scenarios のプロセスプールで並行に解く
+#   - 店舗をまたぐ週上限・7連勤は、解いた後に全店舗のシフトを突き合わせて確かめ、
+#     超えた分は「外しても不足にならない」シフトから外してその店舗で解き直す
+#   - 不足が残った店舗・日には、他の店舗が持っていて使っていない共有スタッフの日を回す
+# これを数ラウンド繰り返す (入力が変わった店舗だけ解き直す)。
+# 最後に突き合わせた結果は必ず週上限・7連勤を満たす (超えた分は外したまま返す)
+
+MAX_STORES = 50
+DEFAULT_ROUNDS = 4
+DEFAULT_BUDGET = 30.0
+
+
+def eligible_stores(staff, store_ids):
+    stores = staff.get("stores")
+    if stores:
+        wanted = set(str(s) for s in stores)
+        return [s for s in store_ids if s in wanted]
+    home = staff.get("home_store")
+    if home:
+        return [str(home)]
+    return list(store_ids)
+
+
+def validate(stores, staff_list):
+    if not stores:
+        raise ValueError("stores is required")
+    if len(stores) > MAX_STORES:
+        raise ValueError("too many stores (max {})".format(MAX_STORES))
+    ids = [s["id"] for s in stores]
+    if len(set(ids)) != len(ids):
+        raise ValueError("duplicate store id")
+    known = set(ids)
+    for st in staff_list:
+        unknown = [s for s in (st.get("stores") or []) if str(s) not in known]
+        home = st.get("home_store")
+        if home and str(home) not in known:
+            unknown.append(home)
+        if unknown:
+            raise ValueError("staff {} refers to unknown store(s): {}".format(
+                st["id"], ", ".join(str(s) for s in unknown)))
+
+
+def solve_store(store_id, inputs, mode, budget, stop=None):
+    # プロセスプールのワーカーで実行される
+    from scheduler import ShiftScheduler
+
+    started = time.perf_counter()
+    row = {"store_id": store_id, "shifts": []}
+    token = CancelToken(budget * 1.5 + 5)
+    try:
+        with redirect_stdout(io.StringIO()), scenarios.stop_watch(stop, token):
+            sch = ShiftScheduler(
+                inputs["staff_list"], dict(inputs["config"], solver_time_limit=budget),
+                inputs["dates"], inputs["requests"],
+                fixed_shifts=inputs["fixed_shifts"],
+                freeze_before=inputs["freeze_before"], cancel_token=token)
+            row["shifts"] = sch.solve(force=(mode == "force")) or []
+        row["status"] = "ok"
+        row["tier"] = (sch.solved_with or {}).get("tier")
+    except Cancelled as e:
+        row["status"] = "timeout" if e.reason == "deadline" else "cancelled"
+    except Exception as e:
+        row["status"] = "error"
+        row["message"] = str(e)
+    row["elapsed_sec"] = round(time.perf_counter() - started, 2)
+    return row
+
+
+class Coordinator:
+
+    def __init__(self, stores, staff_list, dates, requests=None, mode="auto",
+                 freeze_before=None, budget=DEFAULT_BUDGET,
+                 max_rounds=DEFAULT_ROUNDS):
+        from scheduler import ShiftScheduler
+        self.dates = sorted(dates)
+        self.requests = requests or []
+        self.mode = mode
+        self.force = (mode == "force")
+        self.freeze_before = freeze_before
+        self.budget = budget
+        self.max_rounds = max(1, int(max_rounds))
+        self.store_ids = [s["id"] for s in stores]
+        self.stores = {s["id"]: s for s in stores}
+        self.staff = {st["id"]: st for st in staff_list}
+        self.eligible = {sid: eligible_stores(st, self.store_ids)
+                         for sid, st in self.staff.items()}
+        self.shared = {sid for sid, e in self.eligible.items() if len(e) > 1}
+        self.members = {s: [sid for sid in self.staff if s in self.eligible[sid]]
+                        for s in self.store_ids}
+
+        # ルール (必要人数・営業日・スタッフの上限) は店舗ごとのスケジューラーから読む
+        self.sch = {}
+        with redirect_stdout(io.StringIO()):
+            for s in self.store_ids:
+                self.sch[s] = ShiftScheduler(
+                    [self.staff[sid] for sid in self.members[s]],
+                    self.stores[s].get("config") or {}, self.dates,
+                    self.requests, fixed_shifts=self.stores[s].get("fixed_shifts"),
+                    freeze_before=freeze_before)
+        self.records = {}
+        for s in self.store_ids:
+            for st in self.sch[s].staff_table:
+                self.records.setdefault(st.id, st)
+        self.req = {s: {d: self.sch[s]._build_slot_requirements(d)
+                        for d in self.dates
+                        if self.sch[s]._get_day_type(d) != "closed"}
+                    for s in self.store_ids}
+
+        # 確定済みシフト: (スタッフ, 日) -> 店舗
+        self.fixed = {}
+        for s in self.store_ids:
+            for f in self.sch[s].fixed_shifts:
+                self.fixed[(f["staff_id"], f["date"])] = s
+        days = sorted(set(self.dates) | {d for _, d in self.fixed})
+        self.windows = ([days[i:i + 7] for i in range(len(days) - 6)]
+                        if not self.force else [])
+        any_sch = self.sch[self.store_ids[0]]
+        self._iso_week = any_sch._iso_week
+
+        # 共有スタッフの日の持ち主 (スタッフ, 日) -> 店舗 / 週上限で外した (スタッフ, 日)
+        self.owner = {}
+        self.banned = set()
+        self.results = {}
+        self.solves = {s: 0 for s in self.store_ids}
+        self.rounds = []
+
+    # ---------- 部分問題の入力 ----------
+
+    def _limit(self, sid):
+        max_days = self.records[sid].max_days
+        return max(max_days, 6) if self.force else max_days
+
+    def _blocked(self, sid, s):
+        if sid in self.shared:
+            return [d for d in self.dates
+                    if self.owner.get((sid, d)) != s or (sid, d) in self.banned]
+        return [d for d in self.dates if (sid, d) in self.banned]
+
+    def store_inputs(self, s):
+        staff = []
+        for sid in self.members[s]:
+            st = self.staff[sid]
+            blocked = self._blocked(sid, s)
+            if blocked:
+                st = dict(st, unavailable_dates=_ng_list(st) + blocked)
+            staff.append(st)
+        store = self.stores[s]
+        return {"staff_list": staff, "config": store.get("config") or {},
+                "dates": self.dates, "requests": self.requests,
+                "fixed_shifts": store.get("fixed_shifts") or [],
+                "freeze_before": self.freeze_before}
+
+    def _signature(self, s):
+        return fingerprint(sorted((sid, self._blocked(sid, s))
+                                  for sid in self.members[s]))
+
+    # ---------- 初期の割り振り ----------
+
+    def allocate(self):
+        # 共有スタッフの各日を「必要人時 / 割り振り済みの人時」が最も大きい店舗に持たせる
+        need = {s: {d: sum(r.values()) * self.sch[s].slot_hours
+                    for d, r in self.req[s].items()}
+                for s in self.store_ids}
+        supply = {s: {d: 0.0 for d in self.dates} for s in self.store_ids}
+        for s in self.store_ids:
+            for sid in self.members[s]:
+                if sid in self.shared:
+                    continue
+                st = self.records[sid]
+                for d in self.req[s]:
+                    if d not in st.ng:
+                        supply[s][d] += st.max_hours
+        # 入れる店舗が少ない人から決める
+        order = sorted(self.shared, key=lambda sid: (len(self.eligible[sid]), sid))
+        for d in self.dates:
+            for sid in order:
+                st = self.records[sid]
+                fixed_at = self.fixed.get((sid, d))
+                if fixed_at is not None:
+                    self.owner[(sid, d)] = fixed_at
+                    continue
+                if d in st.ng:
+                    continue
+                cands = [s for s in self.eligible[sid] if self.req[s].get(d)]
+                if not cands:
+                    continue
+                home = self.staff[sid].get("home_store")
+                best = max(cands, key=lambda s: (
+                    need[s][d] / (1.0 + supply[s][d]), s == home))
+                self.owner[(sid, d)] = best
+                supply[best][d] += st.max_hours
+
+    # ---------- 突き合わせ ----------
+
+    def _coverage(self):
+        cover = {s: {d: {t: 0 for t in r} for d, r in self.req[s].items()}
+                 for s in self.store_ids}
+        for s in self.store_ids:
+            shifts = list(self.results.get(s, {}).get("shifts", ()))
+            for sh in shifts + self.sch[s].fixed_shifts:
+                self._add_cover(cover, s, sh, 1)
+        return cover
+
+    def _add_cover(self, cover, s, sh, sign):
+        day = cover[s].get(sh["date"])
+        if day is None:
+            return
+        a, b = _span(self.sch[s], sh)
+        for t in day:
+            if a <= t < b:
+                day[t] += sign
+
+    def _value(self, cover, s, sh):
+        # 外すと不足になるスロットの数 (小さいほど外しやすい)
+        req = self.req[s].get(sh["date"], {})
+        day = cover[s].get(sh["date"], {})
+        a, b = _span(self.sch[s], sh)
+        return sum(1 for t in req if a <= t < b and day[t] <= req[t])
+
+    def _worked(self):
+        # スタッフ -> {日: (店舗, シフト or None(確定済み))}
+        worked = {}
+        for (sid, d), s in self.fixed.items():
+            worked.setdefault(sid, {})[d] = (s, None)
+        for s in self.store_ids:
+            for sh in self.results.get(s, {}).get("shifts", ()):
+                worked.setdefault(sh["staff_id"], {})[sh["date"]] = (s, sh)
+        return worked
+
+    def enforce(self, cover):
+        # 店舗をまたぐ週上限・7連勤を超えた分を外す。外した (スタッフ, 日) は以後使わない
+        released = []
+        worked = self._worked()
+        for sid in sorted(self.shared):
+            days = worked.get(sid)
+            if not days:
+                continue
+            limit = self._limit(sid)
+            weeks = {}
+            for d in days:
+                weeks.setdefault(self._iso_week(d), []).append(d)
+            groups = [(w, limit) for w in weeks.values()]
+            groups += [([d for d in span if d in days], 6) for span in self.windows]
+            for group, cap in groups:
+                group = [d for d in group if d in days]
+                while len(group) > cap:
+                    movable = [d for d in group if days[d][1] is not None]
+                    if not movable:
+                        break
+                    d = min(movable, key=lambda x: (
+                        self._value(cover, days[x][0], days[x][1]), x))
+                    s, sh = days.pop(d)
+                    group.remove(d)
+                    self.results[s]["shifts"].remove(sh)
+                    self._add_cover(cover, s, sh, -1)
+                    self.banned.add((sid, d))
+                    released.append({"staff_id": sid, "date": d, "store_id": s})
+        return released
+
+    def rebalance(self, cover):
+        # 不足が残った店舗・日に、他の店舗が持っていて使っていない共有スタッフの日を回す
+        moved = []
+        worked = self._worked()
+        week_days = {}
+        for sid, days in worked.items():
+            for d in days:
+                key = (sid, self._iso_week(d))
+                week_days[key] = week_days.get(key, 0) + 1
+        taken = set()
+        for s in self.store_ids:
+            for d, req in self.req[s].items():
+                short = max([req[t] - cover[s][d][t] for t in req] or [0])
+                if short <= 0:
+                    continue
+                cands = []
+                for sid in self.members[s]:
+                    if sid not in self.shared or (sid, d) in taken:
+                        continue
+                    st = self.records[sid]
+                    if ((sid, d) in self.banned or d in st.ng or st.max_hours <= 0
+                            or d in worked.get(sid, {})
+                            or self.owner.get((sid, d)) in (None, s)):
+                        continue
+                    key = (sid, self._iso_week(d))
+                    if week_days.get(key, 0) >= self._limit(sid):
+                        continue
+                    cands.append((week_days.get(key, 0), sid))
+                for _, sid in sorted(cands)[:short]:
+                    moved.append({"staff_id": sid, "date": d, "store_id": s,
+                                  "from_store": self.owner[(sid, d)]})
+                    self.owner[(sid, d)] = s
+                    taken.add((sid, d))
+                    key = (sid, self._iso_week(d))
+                    week_days[key] = week_days.get(key, 0) + 1
+        return moved
+
+    def verify(self):
+        # 返す前の検算: 二重勤務と店舗をまたぐ上限超過の数 (0 のはず)
+        seen = {}
+        double = 0
+        for s in self.store_ids:
+            for sh in self.results.get(s, {}).get("shifts", ()):
+                key = (sh["staff_id"], sh["date"])
+                if key in seen or key in self.fixed:
+                    double += 1
+                seen[key] = s
+        over = 0
+        for sid, days in self._worked().items():
+            weeks = {}
+            for d in days:
+                weeks[self._iso_week(d)] = weeks.get(self._iso_week(d), 0) + 1
+            over += sum(max(0, n - self._limit(sid)) for n in weeks.values())
+        return {"double_bookings": double, "weekly_over": over}
+
+    # ---------- 実行 ----------
+
+    async def run(self, token, slots=None):
+        # slots: admission.borrow(...)。店舗の部分問題を並べる数は受付制御に従う
+        started = time.perf_counter()
+        self.allocate()
+        signatures = {}
+        released_total = moved_total = 0
+        for n in range(self.max_rounds):
+            if token.cancelled:
+                raise Cancelled(token.reason or "cancelled")
+            todo = [s for s in self.store_ids
+                    if signatures.get(s) != self._signature(s)]
+            if not todo:
+                break
+            round_started = time.perf_counter()
+            calls = [(s, self.store_inputs(s), self.mode, self.budget) for s in todo]
+            for s in todo:
+                signatures[s] = self._signature(s)
+            rows = await scenarios.fan_out(solve_store, calls, token, slots)
+            for s, row in zip(todo, rows):
+                if isinstance(row, Exception):
+                    print("[MultiStore] worker error: {}".format(row))
+                    scenarios.reset_pool()
+                    row = {"store_id": s, "status": "error", "shifts": [],
+                           "message": str(row)}
+                self.results[s] = row
+                self.solves[s] += 1
+
+            cover = self._coverage()
+            released = self.enforce(cover)
+            last = (n == self.max_rounds - 1)
+            moved = [] if last else self.rebalance(cover)
+            released_total += len(released)
+            moved_total += len(moved)
+            self.rounds.append({
+                "round": n + 1, "solved": todo, "released": len(released),
+                "moved": len(moved),
+                "elapsed_sec": round(time.perf_counter() - round_started, 2)})
+            print("[MultiStore] round {}: solved {} store(s), released {},"
+                  " moved {} ({:.2f}s)".format(n + 1, len(todo), len(released),
+                                               len(moved),
+                                               time.perf_counter() - round_started))
+        return self._response(released_total, moved_total,
+                              time.perf_counter() - started)
+
+    def _response(self, released, moved, elapsed):
+        stores = []
+        shifts = []
+        for s in self.store_ids:
+            row = self.results.get(s, {"status": "skipped", "shifts": []})
+            store_shifts = [dict(sh, store_id=s) for sh in row["shifts"]]
+            shifts.extend(store_shifts)
+            entry = {"store_id": s, "status": row["status"],
+                     "tier": row.get("tier"), "solves": self.solves[s],
+                     "shifts": store_shifts}
+            entry.update(scenarios.evaluate(self.sch[s], row["shifts"]))
+            if row.get("message"):
+                entry["message"] = row["message"]
+            stores.append(entry)
+        check = self.verify()
+        print("[MultiStore] {} store(s), {} shared staff, {} round(s) in {:.2f}s"
+              " (released {}, moved {}, {})".format(
+                  len(self.store_ids), len(self.shared), len(self.rounds),
+                  elapsed, released, moved, check))
+        return {
+            "stores": stores,
+            "shifts": shifts,
+            "linking": dict(check, shared_staff=len(self.shared),
+                            released=released, moved=moved),
+            "rounds": self.rounds,
+            "workers": scenarios.workers(),
+            "elapsed_sec": round(elapsed, 2),
+        }
+
+
+def _span(sch, sh):
+    a = sh.get("start_min")
+    b = sh.get("end_min")
+    if a is None:
+        a = sch._to_minutes(sh["start_time"])
+    if b is None:
+        b = sch._to_minutes(sh["end_time"])
+    return a, b
+
+
+def _ng_list(staff):
+    raw = staff.get("unavailable_dates")
+    if not raw:
+        return []
+    if isinstance(raw, list):
+        return [str(d).strip() for d in raw]
+    return [d.strip() for d in str(raw).split(",") if d.strip()]
@@ -0,0 +1,110 @@
+import time
+
+# 粗いスロットから細かいスロットへの2段階の解き方 (config の coarse_slot_minutes)。
+#   1. 同じ入力を coarse_slot_minutes (30 / 60 分) のスロットで解き、誰がどの日の
+#      どの時間帯に入るかの骨組みを得る。必要人数の行は 1/2〜1/4 になる
+#   2. 細かいスロット (slot_minutes) で見て「境目」の粗いスロットを探す。
+#      粗いスロットの中で必要人数が変わる、粗い解の人数が変わる (勤務の始まり・終わりが
+#      中にある)、粗い解では足りない、のどれか
+#   3. 境目に掛からない勤務は粗い解の時間帯に固定し、境目に掛かる勤務と境目のある日に
+#      休みのスタッフだけ自由にして、細かいスロットで解き直す。粗い解は MIP start にも使う
+# 固定は選択肢を絞るだけなので、週上限などの制約はそのまま効く。
+# 解けなかったときは None を返し、solve() が固定なしの通常の段に進む
+
+# 粗い段に使うソルバー時間の割合
+COARSE_SHARE = 0.3
+
+
+def boundary_segments(coarse, sch, d, spans):
+    # 境目になる粗いスロットの開始分。spans は粗い解と確定済みの (開始分, 終了分)
+    fine = sch._build_slot_requirements(d)
+    step = coarse.slot_minutes
+    edges = []
+    for c in coarse._build_slot_requirements(d):
+        ts = [t for t in sch._slot_range(d, c, c + step) if t in fine]
+        if not ts:
+            continue
+        cover = [sum(1 for a, b in spans if a <= t < b) for t in ts]
+        reqs = [fine[t] for t in ts]
+        if (len(set(reqs)) > 1 or len(set(cover)) > 1
+                or any(n < r for n, r in zip(cover, reqs))):
+            edges.append(c)
+    return edges
+
+
+def coarse_to_fine(sch, force=False, objective="weighted"):
+    from scheduler import ShiftScheduler
+    started = time.perf_counter()
+    report = {"coarse_minutes": sch.coarse_slot_minutes,
+              "fine_minutes": sch.slot_minutes}
+    sch.multires_report = report
+
+    # 粗い段: 同じ入力でスロットだけ粗くする (自由シフトは作った列をそのまま使う)
+    config = dict(sch.config, slot_minutes=sch.coarse_slot_minutes,
+                  coarse_slot_minutes=None, auto_tune=False, flex_shifts=None,
+                  solver_time_limit=max(5.0, sch.time_limit * COARSE_SHARE))
+    coarse = ShiftScheduler(sch.staff_list, config, sch.dates, sch.requests,
+                            fixed_shifts=sch.fixed_shifts,
+                            freeze_before=sch.freeze_before,
+                            cancel_token=sch.cancel)
+    coarse._flex_pool = sch._flex_pool
+    coarse.solver_threads = sch.solver_threads
+    coarse.solver_gap = sch.solver_gap
+    shifts = coarse._solve_milp(force=force, tier=3, objective=objective)
+    report["coarse_sec"] = round(time.perf_counter() - started, 2)
+    if not shifts:
+        report["status"] = "coarse_failed"
+        print("[MultiRes] coarse solve failed, solving at {} min".format(
+            sch.slot_minutes))
+        return None
+
+    chosen = {(s["staff_id"], s["date"]): (sch._to_minutes(s["start_time"]),
+                                           sch._to_minutes(s["end_time"]))
+              for s in shifts}
+    by_date = {}
+    for (sid, d), span in chosen.items():
+        by_date.setdefault(d, []).append(span)
+    for f in sch.fixed_shifts:
+        by_date.setdefault(f["date"], []).append((f["start_min"], f["end_min"]))
+
+    step = sch.coarse_slot_minutes
+    restrict = {}
+    segments = free = 0
+    for d in sch.dates:
+        edges = boundary_segments(coarse, sch, d, by_date.get(d, ()))
+        segments += len(edges)
+        for st in sch.staff_table:
+            key = (st.id, d)
+            span = chosen.get(key)
+            if edges and (span is None or any(
+                    span[0] < e + step and e < span[1] for e in edges)):
+                free += 1
+                continue
+            restrict[key] = span
+    report.update(boundary_segments=segments, fixed_staff_days=len(restrict),
+                  free_staff_days=free)
+
+    # 細かい段: 固定した骨組みの上で境目だけ解く。案が来ていなければ粗い解を初期解にする
+    fine_started = time.perf_counter()
+    own_hint = sch._hint is None
+    if own_hint:
+        sch._hint = chosen
+        sch.hint_report = {"received": len(chosen), "validated": len(chosen),
+                           "dropped": {}, "survived": 1.0}
+    sch._restrict = restrict
+    try:
+        result = sch._solve_milp(force=force, tier=3, objective=objective)
+    finally:
+        sch._restrict = None
+        if own_hint:
+            report["warm_start"] = (sch.hint_report or {}).get("incumbent")
+            sch._hint = None
+            sch.hint_report = None
+    report["fine_sec"] = round(time.perf_counter() - fine_started, 2)
+    report["status"] = "ok" if result else "fine_failed"
+    report["elapsed_sec"] = round(time.perf_counter() - started, 2)
+    print("[MultiRes] {}min -> {}min: {} boundary segment(s), fixed {} / free {}"
+          " staff-days, coarse {:.2f}s + fine {:.2f}s ({})".format(
+              step, sch.slot_minutes, segments, len(restrict), free,
+              report["coarse_sec"], report["fine_sec"], report["status"]))
+    return result
@@ -0,0 +1,145 @@
+import time
+
+# MILP の変数を作る前に、(スタッフ, 日) ごとの選択肢から解に効かないものを落とす。
+#
+# 1. 禁止: 週上限 0 のスタッフ (強行時以外) / 確定済みシフトで週上限や
+#    7日窓の上限を使い切っている日 の選択肢は x == 0 が確定なので変数を作らない
+# 2. 支配: 同じ人・同じ日の選択肢 A, B について
+#      B の担当スロット ⊇ A の担当スロット (必要人数のあるスロットだけで比べる)
+#      かつ B の時給コスト <= A の時給コスト かつ B の超過時間 <= A の超過時間
+#    なら、A を使う解は B に差し替えても制約を満たし目的関数の各項が悪くならない。
+#    A を落とす (全く同じなら番号の小さい方を残す)。
+#    新人は OJT 制約で「担当スロットが多いほど不利」なので、Tier 3 では
+#    担当スロットが一致する場合だけ比べる
+# 3. 行の削減: 選べる日数がその週 (7日窓) の残り上限以下なら週上限 (7連勤) の行は
+#    常に満たされるので作らない。選択肢が1つだけの日の「1日1本」の行も作らない
+#
+# 禁止した (スタッフ, 日) は forbidden で返す (月給スタッフの「出勤しない日」の
+# 定数項を残して、目的関数の値を presolve なしと揃えるため)。
+# 落とした数は report に残す。config の presolve: false で無効にできる
+
+
+def presolve(sch, staff_opts, force=False, tier=3):
+    # staff_opts を書き換え、作るべき週上限・7日窓の行を返す
+    started = time.perf_counter()
+    report = {"options_before": sum(len(o) for o in staff_opts.values()),
+              "forbidden": 0, "dominated": 0,
+              "week_rows_dropped": 0, "span_rows_dropped": 0,
+              "day_rows_dropped": 0}
+
+    week_groups = sch._group_dates_by_week()
+    spans = sch._seven_day_windows() if not force else []
+
+    # ---- 1. 禁止された選択肢 ----
+    forbidden = set()
+    for st in sch.staff_table:
+        sid = st.id
+        if not force and st.max_days <= 0:
+            _forbid(staff_opts, report, sid, sch.dates, forbidden)
+            continue
+        effective = st.max_days if not force else max(st.max_days, 6)
+        for week in week_groups:
+            if effective - sch._fixed_days_in_week(sid, week) <= 0:
+                _forbid(staff_opts, report, sid, week, forbidden)
+        for span in spans:
+            if 6 - sch._fixed_days(sid, span) <= 0:
+                _forbid(staff_opts, report, sid, span, forbidden)
+
+    # ---- 2. 支配される選択肢 ----
+    slots_by_date = {d: tuple(sorted(sch._build_slot_requirements(d)))
+                     for d in sch.dates}
+    kept_cache = {}
+    ojt = tier >= 3 and bool(sch._rookie_ids) and bool(sch._mentor_ids)
+    for (sid, d), opts in staff_opts.items():
+        if len(opts) < 2:
+            continue
+        st = sch._staff_by_id[sid]
+        strict = ojt and st.rookie
+        # 選択肢は営業時間ごとに共有されているので、同じ条件の結果も共有する
+        key = (id(opts), slots_by_date[d], st.wage if st.hourly else 0.0,
+               st.max_hours, strict)
+        kept = kept_cache.get(key)
+        if kept is None:
+            kept = kept_cache[key] = (
+                opts, _undominated(opts, slots_by_date[d], st, strict))
+        kept = kept[1]
+        if len(kept) < len(opts):
+            report["dominated"] += len(opts) - len(kept)
+            staff_opts[(sid, d)] = kept
+
+    # ---- 3. 常に満たされる行 ----
+    week_rows = []
+    span_rows = []
+    for st in sch.staff_table:
+        sid = st.id
+        if not force and st.max_days <= 0:
+            continue
+        effective = st.max_days if not force else max(st.max_days, 6)
+        for week in week_groups:
+            days = [d for d in week if staff_opts.get((sid, d))]
+            if not days:
+                continue
+            rest = effective - sch._fixed_days_in_week(sid, week)
+            if len(days) <= rest:
+                report["week_rows_dropped"] += 1
+            else:
+                week_rows.append((sid, days, max(rest, 0)))
+        for span in spans:
+            days = [d for d in span if staff_opts.get((sid, d))]
+            if not days:
+                continue
+            rest = 6 - sch._fixed_days(sid, span)
+            if len(days) <= rest:
+                report["span_rows_dropped"] += 1
+            else:
+                span_rows.append((sid, days, max(rest, 0)))
+    report["day_rows_dropped"] = sum(1 for o in staff_opts.values() if len(o) == 1)
+
+    report["options_after"] = sum(len(o) for o in staff_opts.values())
+    report["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    print("[Presolve] options {} -> {} (forbidden={} dominated={}),"
+          " rows dropped week={} span={} day={} ({:.1f}ms)".format(
+              report["options_before"], report["options_after"],
+              report["forbidden"], report["dominated"],
+              report["week_rows_dropped"], report["span_rows_dropped"],
+              report["day_rows_dropped"], report["elapsed_ms"]))
+    return {"week_rows": week_rows, "span_rows": span_rows,
+            "forbidden": forbidden, "report": report}
+
+
+def _forbid(staff_opts, report, sid, dates, forbidden):
+    for d in dates:
+        opts = staff_opts.get((sid, d))
+        if opts:
+            report["forbidden"] += len(opts)
+            staff_opts[(sid, d)] = ()
+            forbidden.add((sid, d))
+
+
+def _undominated(opts, slots, st, strict):
+    # (担当スロット, 時給コスト, 超過時間) で比べて支配されないものだけ残す
+    # 超過時間は強行時以外は目的関数にないが、長すぎる勤務に寄らないよう常に比べる
+    rows = []
+    for o in opts:
+        cover = frozenset(t for t in slots if o["start_min"] <= t < o["end_min"])
+        cost = st.wage * o["hours"] if st.hourly else 0.0
+        over = max(0.0, o["hours"] - st.max_hours)
+        rows.append((cover, cost, over))
+    kept = []
+    for i, (cover, cost, over) in enumerate(rows):
+        dominated = False
+        for j, (c2, cost2, over2) in enumerate(rows):
+            if i == j or cost2 > cost or over2 > over:
+                continue
+            if strict and c2 != cover:
+                continue
+            if not c2 >= cover:
+                continue
+            # 完全に同じなら番号の小さい方を残す
+            if c2 == cover and cost2 == cost and over2 == over and j > i:
+                continue
+            dominated = True
+            break
+        if not dominated:
+            kept.append(opts[i])
+    return tuple(kept)
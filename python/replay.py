@@ -0,0 +1,124 @@
+"""
+キャプチャの再生: capture.py で本番から取ったリクエストのコーパスを今のエンジンで解き直し、
+前回の結果 (または本番で記録した結果) と比べて悪くなったものを報告する
+
+    python replay.py --corpus captures/ --json baseline.json            # 基準を作る
+    python replay.py --corpus captures/ --baseline baseline.json        # 変更後に比べる
+    python replay.py --corpus captures/ --engine legacy --workers 2 --time-limit 30
+
+悪化とみなすもの (インスタンスごと):
+  - 基準では解けたのに解けない (failed / error / timeout)
+  - 実行時間が基準の --slower 倍を超え、かつ --min-delta 秒以上遅い
+  - 不足 (時間) ・絶対ルールの違反が増えた (--baseline のときだけ。本番の記録には無い)
+--baseline がなければ本番で記録した状態・時間と比べる (マシンが違うので時間は目安)。
+悪化が1件でもあれば終了コード 1 (CI で使える)
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from compare_engines import load_corpus, run_task  # noqa: E402
+
+OK = ("ok", "success")
+
+
+def _reference(inst, baseline):
+    if baseline is not None:
+        return baseline.get(inst["name"])
+    meta = inst.get("meta") or {}
+    if not meta:
+        return None
+    return {"status": meta.get("status"), "elapsed_sec": meta.get("elapsed_sec"),
+            "source": "capture"}
+
+
+def regressions(row, ref, slower, min_delta):
+    if ref is None:
+        return []
+    found = []
+    if ref.get("status") in OK and row.get("status") not in OK:
+        found.append("status {} -> {}".format(ref["status"], row.get("status")))
+    before = ref.get("elapsed_sec")
+    after = row.get("elapsed_sec")
+    if before is not None and after is not None:
+        if after > before * slower and after - before >= min_delta:
+            found.append("time {:.2f}s -> {:.2f}s".format(before, after))
+    if row.get("status") in OK and ref.get("status") in OK:
+        for key, tol in (("shortage_hours", 0.25), ("hard_violations", 0)):
+            if key in ref and key in row and row[key] > ref[key] + tol:
+                found.append("{} {} -> {}".format(key, ref[key], row[key]))
+    return found
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--corpus", required=True, help="キャプチャのディレクトリ")
+    ap.add_argument("--engine", help="エンジン (未指定ならキャプチャの engine / 既定)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--time-limit", type=float, default=None,
+                    help="ソルバー時間上限 (秒)。未指定ならキャプチャの設定どおり")
+    ap.add_argument("--baseline", help="比べる前回の --json の結果")
+    ap.add_argument("--slower", type=float, default=1.5)
+    ap.add_argument("--min-delta", type=float, default=2.0)
+    ap.add_argument("--limit", type=int, default=0, help="先頭 N 件だけ")
+    ap.add_argument("--json", help="結果を書き出すファイル (次回の --baseline)")
+    args = ap.parse_args()
+
+    import engines
+    instances = load_corpus(args.corpus)
+    if args.limit:
+        instances = instances[:args.limit]
+    if not instances:
+        ap.error("コーパスが空です: {}".format(args.corpus))
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = {r["instance"]: r for r in json.load(f)["rows"]}
+
+    started = time.perf_counter()
+    rows = []
+    found = 0
+    # 子プロセスが親の状態を持ち込まないよう spawn で起動する (scenarios.py と同じ)
+    with ProcessPoolExecutor(max_workers=max(1, args.workers),
+                             mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = []
+        for inst in instances:
+            engine = engines.get(args.engine or inst.get("engine"))["name"]
+            futures.append(pool.submit(run_task, inst["name"], engine, inst["inputs"],
+                                       inst["mode"], args.time_limit))
+        for inst, fut in zip(instances, futures):
+            row = fut.result()
+            row["regressions"] = regressions(
+                row, _reference(inst, baseline), args.slower, args.min_delta)
+            found += bool(row["regressions"])
+            rows.append(row)
+            print("{:32s} {:8s} {:7s} {:7.2f}s shortage={:6.1f}h hard={} {}".format(
+                row["instance"][-32:], row["engine"], row["status"],
+                row["elapsed_sec"], row.get("shortage_hours", 0.0),
+                row.get("hard_violations", "-"),
+                "REGRESSION: " + "; ".join(row["regressions"])
+                if row["regressions"] else ""))
+
+    ok = [r for r in rows if r["status"] in OK]
+    print("")
+    print("{} instance(s), {} solved, {} regression(s), solve time {:.1f}s,"
+          " wall {:.1f}s on {} worker(s)".format(
+              len(rows), len(ok), found, sum(r["elapsed_sec"] for r in rows),
+              time.perf_counter() - started, args.workers))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"corpus": args.corpus, "rows": rows}, f,
+                      ensure_ascii=False, indent=2)
+        print("wrote {}".format(args.json))
+    return 1 if found else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
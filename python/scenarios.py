@@ -0,0 +1,426 @@
+import asyncio
+import copy
+import functools
+import hashlib
+import io
+import multiprocessing
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, redirect_stdout
+
+from cancel import CancelToken, Cancelled
+
+# What-if シナリオ: 基準の入力 (staff_list / config / requests / fixed_shifts) に
+# 宣言的な差分を当てたものを、プロセスプールで並行に解いて比較表を返す。
+#   {"name": "土曜4人", "deltas": [{"type": "staff_req", "values": {"min_weekend": 4}}]}
+# 差分の種類は DELTAS を参照。
+#   RAKUSHIFT_SCENARIO_WORKERS  プロセス数 (既定: CPU コア数)
+# 基準の入力は pickle して各タスクに同じバイト列を渡し、ワーカー側では
+# 指紋ごとに復元済みのものを使い回す (差分を当てるときだけ必要な部分を複製する)。
+# 並べる数は受付制御に従う (fan_out): リクエスト自身の1枠で1件、2件目以降は
+# admission の空き枠を借りられたときだけ。中止はワーカーへも送り、実行中の CBC を止める。
+
+MAX_SCENARIOS = 20
+DEFAULT_BUDGET = 30.0
+
+NEW_STAFF_DEFAULTS = {
+    "role": "staff", "evaluation": "B", "salary_type": "hourly",
+    "hourly_wage": 1100, "max_days_week": 5, "max_hours_day": 8,
+}
+
+# ワーカーが中止の合図を確かめる間隔 (秒)
+STOP_POLL_SECONDS = 0.5
+# 空き枠を借りに行く間隔 (秒)
+BORROW_POLL_SECONDS = 1.0
+
+_pool = None
+_manager = None
+_pool_lock = threading.Lock()
+# ワーカー側: 指紋 -> 復元した基準入力
+_BASES = OrderedDict()
+_BASES_MAX = 4
+
+
+def workers():
+    return max(1, int(os.environ.get("RAKUSHIFT_SCENARIO_WORKERS")
+                      or os.cpu_count() or 1))
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # uvicorn のスレッドを抱えたまま fork しないように spawn で起動する
+                _pool = ProcessPoolExecutor(
+                    max_workers=workers(),
+                    mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def _get_manager():
+    # プールのワーカーへ中止を送る Event を作るためのマネージャー (初回だけ起動)
+    global _manager
+    if _manager is None:
+        with _pool_lock:
+            if _manager is None:
+                _manager = multiprocessing.get_context("spawn").Manager()
+    return _manager
+
+
+def reset_pool():
+    # ワーカーが落ちたプールを捨てる。次の get_pool() で作り直す
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+def shutdown():
+    global _manager
+    reset_pool()
+    if _manager is not None:
+        _manager.shutdown()
+        _manager = None
+
+
+@contextmanager
+def stop_watch(stop, token):
+    # ワーカー側: 親からの中止 (stop.set()) をトークンへ伝え、実行中の CBC を kill させる
+    if stop is None:
+        yield
+        return
+    done = threading.Event()
+
+    def watch():
+        while not done.is_set():
+            try:
+                if stop.wait(STOP_POLL_SECONDS):
+                    token.cancel("cancelled")
+                    return
+            except Exception:
+                # 親のマネージャーが終了した
+                return
+
+    threading.Thread(target=watch, daemon=True, name="stop-watch").start()
+    try:
+        yield
+    finally:
+        done.set()
+
+
+async def fan_out(fn, calls, token, slots=None):
+    # calls の各引数で fn(*args, stop=...) をプロセスプールで並行に実行し、結果
+    # (ワーカーが落ちたときは例外) を同じ順に返す。
+    #   - 1件目はリクエスト自身の受付枠で動かす。2件目以降は slots (admission.borrow)
+    #     から空き枠を借りられたときだけ並べ、終わったらすぐ返す
+    #   - 中止されたら未着手のものを取り消し、実行中のワーカーには stop を送る
+    loop = asyncio.get_running_loop()
+    pool = get_pool()
+    stop = await loop.run_in_executor(None, lambda: _get_manager().Event())
+    woke = asyncio.Event()
+    token.on_cancel(lambda: loop.call_soon_threadsafe(woke.set))
+    limit = workers()
+    pending = list(enumerate(calls))
+    running = {}
+    results = [None] * len(calls)
+    try:
+        while pending or running:
+            token.check()
+            while pending and len(running) < limit:
+                borrowed = False
+                if running and slots is not None:
+                    if not slots.try_take():
+                        break
+                    borrowed = True
+                i, args = pending.pop(0)
+                fut = loop.run_in_executor(
+                    pool, functools.partial(fn, *args, stop=stop))
+                running[fut] = (i, borrowed)
+            waiter = asyncio.ensure_future(woke.wait())
+            done, _ = await asyncio.wait(
+                list(running) + [waiter], timeout=BORROW_POLL_SECONDS,
+                return_when=asyncio.FIRST_COMPLETED)
+            waiter.cancel()
+            for fut in done:
+                if fut is waiter:
+                    continue
+                i, borrowed = running.pop(fut)
+                if borrowed:
+                    slots.release()
+                try:
+                    results[i] = fut.result()
+                except Exception as e:
+                    results[i] = e
+    except (Cancelled, asyncio.CancelledError):
+        await loop.run_in_executor(None, stop.set)
+        for fut, (i, borrowed) in running.items():
+            fut.cancel()
+            if borrowed:
+                slots.release()
+        raise Cancelled(token.reason or "cancelled")
+    return results
+
+
+# ---------- 差分 ----------
+
+def _add_staff(inputs, delta, n):
+    template = dict(NEW_STAFF_DEFAULTS, **(delta.get("staff") or {}))
+    count = int(delta.get("count", 1))
+    for i in range(count):
+        s = dict(template)
+        s["id"] = "{}-{}-{}".format(template.get("id") or "what-if", n, i + 1)
+        s.setdefault("name", "追加スタッフ{}".format(i + 1))
+        inputs["staff_list"].append(s)
+
+
+def _remove_staff(inputs, delta, n):
+    ids = set(delta.get("staff_ids") or [delta.get("staff_id")])
+    inputs["staff_list"] = [s for s in inputs["staff_list"] if s["id"] not in ids]
+
+
+def _update_staff(inputs, delta, n):
+    ids = set(delta.get("staff_ids") or [delta.get("staff_id")])
+    inputs["staff_list"] = [dict(s, **delta["values"]) if s["id"] in ids else s
+                            for s in inputs["staff_list"]]
+
+
+def _staff_req(inputs, delta, n):
+    cfg = inputs["config"]
+    cfg["staff_req"] = dict(cfg.get("staff_req") or {}, **delta["values"])
+
+
+def _time_staff_req(inputs, delta, n):
+    # {"days": [6], "start": "10:00", "end": "18:00", "count": 4}
+    cfg = inputs["config"]
+    rule = {k: delta[k] for k in ("days", "start", "end", "count") if k in delta}
+    rule.setdefault("start", "00:00")
+    rule.setdefault("end", "24:00")
+    cfg["time_staff_req"] = list(cfg.get("time_staff_req") or []) + [rule]
+
+
+def _close_days(inputs, delta, n):
+    # 曜日は JS と同じ 0=日 ... 6=土
+    cfg = inputs["config"]
+    cfg["closed_days"] = sorted(set(cfg.get("closed_days") or [])
+                                | set(delta["days"]))
+
+
+def _open_days(inputs, delta, n):
+    cfg = inputs["config"]
+    cfg["closed_days"] = sorted(set(cfg.get("closed_days") or [])
+                                - set(delta["days"]))
+
+
+def _opening_hours(inputs, delta, n):
+    cfg = inputs["config"]
+    op = cfg.get("opening_time", "09:00")
+    cl = cfg.get("closing_time", "22:00")
+    ot = copy.deepcopy(cfg.get("opening_times") or {})
+    if not ot.get("weekday"):
+        ot = {k: {"start": op, "end": cl}
+              for k in ("weekday", "weekend", "holiday")}
+    for key in delta.get("day_types") or [delta.get("day_type", "weekday")]:
+        ot[key] = dict(ot.get(key) or {}, start=delta["start"], end=delta["end"])
+    cfg["opening_times"] = ot
+
+
+def _config(inputs, delta, n):
+    inputs["config"].update(delta["values"])
+
+
+DELTAS = {
+    "add_staff": _add_staff,
+    "remove_staff": _remove_staff,
+    "update_staff": _update_staff,
+    "staff_req": _staff_req,
+    "time_staff_req": _time_staff_req,
+    "close_days": _close_days,
+    "open_days": _open_days,
+    "opening_hours": _opening_hours,
+    "config": _config,
+}
+
+
+_ADAPTERS = {}
+
+
+def _typed(kind, value, partial_staff=False):
+    # 差分の値もリクエスト本体と同じ型 (schemas) で検証・変換する
+    from pydantic import TypeAdapter
+    import schemas
+    adapter = _ADAPTERS.get(kind)
+    if adapter is None:
+        adapter = _ADAPTERS[kind] = TypeAdapter(getattr(schemas, kind))
+    if partial_staff:
+        # 追加・変更するスタッフは id がなくてもよい
+        out = adapter.validate_python(dict(value, id=value.get("id", "")))
+        if "id" not in value:
+            out.pop("id")
+        return out
+    return adapter.validate_python(value)
+
+
+def _check_delta(delta):
+    kind = delta.get("type")
+    if kind == "add_staff":
+        delta["staff"] = _typed("Staff", delta.get("staff") or {}, partial_staff=True)
+        delta["count"] = int(delta.get("count", 1))
+    elif kind == "update_staff":
+        delta["values"] = _typed("Staff", delta.get("values") or {},
+                                 partial_staff=True)
+    elif kind == "staff_req":
+        delta["values"] = _typed("StaffReq", delta.get("values") or {})
+    elif kind == "time_staff_req":
+        rule = _typed("TimeStaffReq", {k: delta[k] for k in
+                                       ("days", "start", "end", "count")
+                                       if k in delta})
+        delta.update(rule)
+    elif kind in ("close_days", "open_days"):
+        delta["days"] = [int(d) for d in delta.get("days") or []]
+    elif kind == "opening_hours":
+        delta.update(_typed("Window", {"start": delta.get("start"),
+                                       "end": delta.get("end")}))
+    elif kind == "config":
+        delta["values"] = _typed("Config", delta.get("values") or {})
+
+
+def validate(scenarios):
+    # 差分の種類と値を確かめ、値は型を揃えたもので置き換える
+    if len(scenarios) > MAX_SCENARIOS:
+        raise ValueError("too many scenarios (max {})".format(MAX_SCENARIOS))
+    for sc in scenarios:
+        for delta in sc.get("deltas") or []:
+            if delta.get("type") not in DELTAS:
+                raise ValueError("unknown delta type: {}".format(delta.get("type")))
+            _check_delta(delta)
+
+
+def apply_deltas(base, deltas):
+    # 基準は書き換えない。staff_list と config だけ浅く複製して差分を当てる
+    inputs = dict(base)
+    inputs["staff_list"] = list(base["staff_list"])
+    inputs["config"] = dict(base["config"])
+    for n, delta in enumerate(deltas or []):
+        DELTAS[delta["type"]](inputs, delta, n + 1)
+    return inputs
+
+
+# ---------- 評価 ----------
+
+def evaluate(sch, shifts):
+    # 解の中身から不足・人件費・残業を数える (MILP でも貪欲でも同じ物差し)
+    by_date = {}
+    for s in list(shifts) + sch.fixed_shifts:
+        by_date.setdefault(s["date"], []).append(
+            (sch._to_minutes(s["start_time"]), sch._to_minutes(s["end_time"])))
+    shortage = 0
+    for d in sch.dates:
+        spans = by_date.get(d, [])
+        for t, req in sch._build_slot_requirements(d).items():
+            cov = sum(1 for a, b in spans if a <= t < b)
+            shortage += max(0, req - cov)
+
+    # 人件費は時給制の分だけ (月給はシナリオで変わらないので比較に含めない)
+    labor = staff_hours = overtime = 0.0
+    for s in shifts:
+        st = sch._staff_by_id.get(s["staff_id"])
+        if st is None:
+            continue
+        hours = (sch._to_minutes(s["end_time"])
+                 - sch._to_minutes(s["start_time"])) / 60.0
+        staff_hours += hours
+        overtime += max(0.0, hours - st.max_hours)
+        if st.hourly:
+            labor += st.wage * hours
+    return {
+        "shortage_hours": shortage * sch.slot_hours,
+        "labor_cost": round(labor),
+        "overtime_hours": round(overtime, 2),
+        "staff_hours": round(staff_hours, 2),
+        "shift_count": len(shifts),
+    }
+
+
+def _base_inputs(key, blob):
+    base = _BASES.get(key)
+    if base is None:
+        base = _BASES[key] = pickle.loads(blob)
+        while len(_BASES) > _BASES_MAX:
+            _BASES.popitem(last=False)
+    return base
+
+
+def run_scenario(key, blob, scenario, mode, budget, stop=None):
+    # プロセスプールのワーカーで実行される
+    from scheduler import ShiftScheduler
+
+    started = time.perf_counter()
+    row = {"name": scenario.get("name") or "scenario",
+           "deltas": len(scenario.get("deltas") or [])}
+    token = CancelToken(budget * 1.5 + 5)
+    log = io.StringIO()
+    try:
+        with redirect_stdout(log), stop_watch(stop, token):
+            inputs = apply_deltas(_base_inputs(key, blob), scenario.get("deltas"))
+            inputs["config"]["solver_time_limit"] = budget
+            sch = ShiftScheduler(
+                inputs["staff_list"], inputs["config"], inputs["dates"],
+                inputs["requests"], fixed_shifts=inputs["fixed_shifts"],
+                freeze_before=inputs["freeze_before"], cancel_token=token)
+            shifts = sch.solve(force=(mode == "force")) or []
+        row.update(evaluate(sch, shifts))
+        row["status"] = "ok"
+        row["shortage_lower_bound_hours"] = round(
+            (sch.bound or {}).get("lower_bound_hours") or 0.0, 1)
+        row["staff_count"] = len(sch.staff_list)
+        row["tier"] = (sch.solved_with or {}).get("tier")
+    except Cancelled as e:
+        row["status"] = "timeout" if e.reason == "deadline" else "cancelled"
+    except Exception as e:
+        row["status"] = "error"
+        row["message"] = str(e)
+    row["elapsed_sec"] = round(time.perf_counter() - started, 2)
+    return row
+
+
+def compare(rows):
+    # 先頭 (基準) との差分を各行に付ける
+    base = rows[0] if rows and rows[0].get("status") == "ok" else None
+    for row in rows[1:]:
+        if base is None or row.get("status") != "ok":
+            continue
+        row["vs_base"] = {
+            k: round(row[k] - base[k], 2)
+            for k in ("shortage_hours", "labor_cost", "overtime_hours",
+                      "staff_hours")}
+    return rows
+
+
+async def run_all(base, runs, mode, budget, token, slots=None):
+    # 各シナリオをプロセスプールで並行に解く (並べる数と中止は fan_out)
+    blob = pickle.dumps(base, protocol=pickle.HIGHEST_PROTOCOL)
+    key = hashlib.sha1(blob).hexdigest()
+    started = time.perf_counter()
+    results = await fan_out(run_scenario,
+                            [(key, blob, sc, mode, budget) for sc in runs],
+                            token, slots)
+
+    rows = []
+    for sc, res in zip(runs, results):
+        if isinstance(res, Exception):
+            # ワーカーが落ちた (BrokenProcessPool など)。次回は作り直す
+            print("[Scenario] worker error: {}".format(res))
+            reset_pool()
+            res = {"name": sc.get("name") or "scenario", "status": "error",
+                   "message": str(res)}
+        rows.append(res)
+    elapsed = time.perf_counter() - started
+    print("[Scenario] {} scenario(s) on {} worker(s) in {:.2f}s".format(
+        len(runs), workers(), elapsed))
+    return {"scenarios": compare(rows), "workers": workers(),
+            "elapsed_sec": round(elapsed, 2)}
@@ -1,6 +1,28 @@
-import pulp
+import math
+import os
+import re
+import tempfile
+import time
 from datetime import datetime, timedelta
 
+from bounds import coverage_bound
+import cancel
+from cancel import CancelToken, Cancelled
+from staff_table import OptionCatalog, StaffRecord, ng_dates_by_staff
+
+# pulp は CBC バイナリの探索も含めて読み込みが重いため、初回のソルブ時に遅延ロードする
+pulp = None
+
+
+def _load_pulp():
+    global pulp
+    if pulp is None:
+        import pulp as _pulp
+        # CBC サブプロセスをキャンセル時に kill できるようにする
+        cancel.install(_pulp)
+        pulp = _pulp
+    return pulp
+
 
 class ShiftScheduler:
 
@@ -13,11 +35,38 @@ class ShiftScheduler:
     ROOKIE_ROLES = {"rookie"}
     POWER_SCORE = {"A": 3.0, "B": 2.0, "C": 1.0, "D": 0.5}
 
-    def __init__(self, staff_list, config, dates, requests=None):
+    # 重み付き和モードでの各項の係数 (この順が優先度)
+    OBJECTIVE_WEIGHTS = {
+        "coverage": 1000000,
+        "manager": 500000,
+        "ojt": 200000,
+        "overtime": 50000,
+        "monthly": 30000,
+        "power": 10000,
+        "cost": 1,
+    }
+    # 辞書式モードの段。最後の段の好みの項は元の重みでまとめて最小化する
+    LEXICO_STAGES = [
+        ["coverage"],
+        ["manager"],
+        ["ojt"],
+        ["overtime"],
+        ["monthly", "power", "cost"],
+    ]
+    LEXICO_FINAL_GAP = 0.01
+    TIER_LABELS = {3: "full", 2: "no OJT/balance", 1: "legal only"}
+    # 必要人数のスロットの長さ (分) として使える値
+    SLOT_CHOICES = (5, 10, 15, 20, 30, 60)
+
+    def __init__(self, staff_list, config, dates, requests=None,
+                 fixed_shifts=None, freeze_before=None, cancel_token=None,
+                 hint_shifts=None):
         self.staff_list = staff_list or []
         self.config = config or {}
         self.dates = sorted(dates or [])
         self.requests = requests or []
+        # この日付より前は確定済み(新しいシフトを作らない)
+        self.freeze_before = freeze_before
 
         raw_patterns = self.config.get("custom_shifts", [])
         self.shift_patterns = []
@@ -50,6 +99,27 @@ class ShiftScheduler:
         self.min_holiday = int(sr.get("min_holiday", 3))
         self.min_manager = int(sr.get("min_manager", 1))
         self.time_staff_req = self.config.get("time_staff_req", [])
+        # 時間帯別の必要人数は (曜日の集合, 開始分, 終了分, 人数) に一度だけ直す
+        self._time_rules = [
+            (frozenset(rule.get("days", [])),
+             self._to_minutes(rule.get("start", "00:00")),
+             self._to_minutes(rule.get("end", "24:00")),
+             int(rule.get("count", 0)))
+            for rule in self.time_staff_req]
+
+        # 必要人数のスロットの長さ (分)。スロットは開店時刻から刻む。
+        # 時間単位のパターンしかない店は 60 にすると行が 1/4 になる。
+        # coarse_slot_minutes を指定すると、粗いスロットで先に解いて
+        # 境目だけ細かいスロットで詰め直す (multires.py)
+        self.slot_minutes = self._slot_length("slot_minutes", 15)
+        self.slot_hours = self.slot_minutes / 60.0
+        self.coarse_slot_minutes = self._slot_length("coarse_slot_minutes", None)
+        if self.coarse_slot_minutes is not None and (
+                self.coarse_slot_minutes <= self.slot_minutes
+                or self.coarse_slot_minutes % self.slot_minutes):
+            raise ValueError(
+                "coarse_slot_minutes must be a multiple of slot_minutes ({})".format(
+                    self.slot_minutes))
 
         self.break_rules = self.config.get("break_rules", [])
         if not self.break_rules:
@@ -59,27 +129,109 @@ class ShiftScheduler:
         self.special_holidays = self.config.get("special_holidays", [])
         self.special_days = self.config.get("special_days", {})
 
+        # 自由シフト(列生成): {"enabled": true, "grid_minutes": 30, "min_hours": 4}
+        self.flex = self.config.get("flex_shifts") or {}
+        self._flex_pool = None
+        self.bound = None
+        # 最終的に解を出した段 {"tier": 3/2/1/0(貪欲), "force": bool}
+        self.solved_with = None
+        self.time_limit = float(self.config.get("solver_time_limit", 120))
+        # 特徴量から選んだ CBC の設定 (tuning.py)。auto_tune: false なら使わない
+        self.auto_tune = self.config.get("auto_tune", True)
+        self.solver_threads = None
+        self.solver_gap = None
+        self.tuning = None
+        # クライアント切断・期限切れで処理全体を打ち切るためのトークン
+        self.cancel = cancel_token or CancelToken()
+        # AI などが作った案。検証後に MILP の初期解 (MIP start) として使う
+        self.hint_shifts = hint_shifts or []
+        self.hint_benchmark = bool(self.config.get("hint_benchmark"))
+        self._hint = None
+        self._measuring = None
+        self.hint_report = None
+        # 粗いスロットの解で固定した (スタッフ, 日) -> 勤務時間帯 (None は休み) と結果
+        self._restrict = None
+        self.multires_report = None
+        # 解を出した MILP のモデル。別解 (solve_alternatives) で使い回す
+        self._model = None
+        # 直近の presolve で落とした選択肢・行の数
+        self.presolve_report = None
+        # Tier 3 が解を返さなかった理由と選んだ段 / 解に残った不足の理由 (diagnose.py)
+        self._failure = None
+        self.diagnosis = None
+        self.shortages = None
+
         self._mentor_ids = set()
         self._rookie_ids = set()
         self._monthly_ids = set()
         self._manager_ids = set()
         self._eval_rank = {}
 
-        for s in self.staff_list:
-            sid = s["id"]
-            role = str(s.get("role", "staff")).lower()
-            evaluation = str(s.get("evaluation", "B")).upper()
-            salary = str(s.get("salary_type", "hourly")).lower()
-
-            if role in self.MENTOR_ROLES:
+        # スタッフ表: staff_list の dict は最初に一度だけ読む
+        ng_dates = ng_dates_by_staff(self.staff_list, self.requests)
+        self.staff_table = []
+        self._staff_by_id = {}
+        for i, s in enumerate(self.staff_list):
+            st = StaffRecord(i, s, ng_dates[s["id"]])
+            sid = st.id
+            st.mentor = st.role in self.MENTOR_ROLES
+            st.rookie = st.role in self.ROOKIE_ROLES or st.rank == "D"
+            st.manager = st.role == "manager"
+            if st.rank not in self.POWER_SCORE:
+                st.rank = "B"
+            self.staff_table.append(st)
+            self._staff_by_id[sid] = st
+
+            if st.mentor:
                 self._mentor_ids.add(sid)
-            if role in self.ROOKIE_ROLES or evaluation == "D":
+            if st.rookie:
                 self._rookie_ids.add(sid)
-            if role == "manager":
+            if st.manager:
                 self._manager_ids.add(sid)
-            if salary == "monthly":
+            if st.monthly:
                 self._monthly_ids.add(sid)
-            self._eval_rank[sid] = evaluation if evaluation in self.POWER_SCORE else "B"
+            self._eval_rank[sid] = st.rank
+
+        # 勤務時間帯の選択肢は営業時間ごとに一度だけ作り、全スタッフで共有する
+        self.option_catalog = OptionCatalog(
+            self.shift_patterns, self._from_minutes, self._to_minutes)
+        self._day_types = {}
+        self._day_windows = {}
+        # 日付ごとの (曜日, ISO 週, 年) と必要人数のスロット。日付文字列の解析は1日1回
+        self._date_cache = {}
+        self._slot_req_cache = {}
+        self._week_groups = None
+
+        # 確定済みシフト(過去分・確定済みの未来分)は変数を作らず定数として扱う
+        self.fixed_shifts = []
+        self._fixed_keys = set()
+        self._fixed_by_date = {}
+        # (スタッフ, ISO 週) -> 確定済みの出勤日数
+        self._fixed_week_days = {}
+        for f in fixed_shifts or []:
+            sid = f.get("staff_id")
+            d = str(f.get("date", ""))
+            # start_min / end_min が付いていれば (列指向の入力など) そのまま使う
+            st = f.get("start_min")
+            if st is None:
+                st = self._to_minutes(f.get("start_time"))
+            en = f.get("end_min")
+            if en is None:
+                en = self._to_minutes(f.get("end_time"))
+            if not sid or not d or st >= en or (sid, d) in self._fixed_keys:
+                continue
+            entry = {
+                "staff_id": sid, "date": d,
+                "start_time": self._from_minutes(st),
+                "end_time": self._from_minutes(en),
+                "break_minutes": f.get("break_minutes", 0),
+                "start_min": st, "end_min": en,
+            }
+            self.fixed_shifts.append(entry)
+            self._fixed_keys.add((sid, d))
+            self._fixed_by_date.setdefault(d, []).append(entry)
+            wk = (sid, self._iso_week(d))
+            self._fixed_week_days[wk] = self._fixed_week_days.get(wk, 0) + 1
 
         print("[Init] Staff:{} Dates:{} Patterns:{}".format(
             len(self.staff_list), len(self.dates), len(self.shift_patterns)))
@@ -89,6 +241,19 @@ class ShiftScheduler:
         print("[Init] Mentors:{} Rookies:{} Monthly:{}".format(
             len(self._mentor_ids), len(self._rookie_ids),
             len(self._monthly_ids)))
+        if self.fixed_shifts or self.freeze_before:
+            print("[Init] Fixed:{} FreezeBefore:{}".format(
+                len(self.fixed_shifts), self.freeze_before))
+
+    def _slot_length(self, key, default):
+        value = self.config.get(key)
+        if value in (None, "", 0):
+            return default
+        value = int(value)
+        if value not in self.SLOT_CHOICES:
+            raise ValueError("{} must be one of {}".format(
+                key, ", ".join(str(v) for v in self.SLOT_CHOICES)))
+        return value
 
     def _to_minutes(self, time_str):
         try:
@@ -101,15 +266,30 @@ class ShiftScheduler:
         return "{:02d}:{:02d}".format(int(mins) // 60, int(mins) % 60)
 
     def _get_day_type(self, date_str):
+        t = self._day_types.get(date_str)
+        if t is None:
+            t = self._day_types[date_str] = self._classify_day(date_str)
+        return t
+
+    def _date_facts(self, date_str):
+        # (weekday, ISO (年, 週), 暦の年)
+        facts = self._date_cache.get(date_str)
+        if facts is None:
+            dt = datetime.strptime(date_str, "%Y-%m-%d")
+            facts = self._date_cache[date_str] = (
+                dt.weekday(), tuple(dt.isocalendar()[:2]), dt.year)
+        return facts
+
+    def _classify_day(self, date_str):
         if date_str in self.special_holidays:
             return "closed"
-        dt = datetime.strptime(date_str, "%Y-%m-%d")
-        js_dow = (dt.weekday() + 1) % 7
+        weekday = self._date_facts(date_str)[0]
+        js_dow = (weekday + 1) % 7
         if js_dow in self.closed_days:
             return "closed"
-        if dt.weekday() == 6:
+        if weekday == 6:
             return "holiday"
-        if dt.weekday() == 5:
+        if weekday == 5:
             return "weekend"
         return "weekday"
 
@@ -134,6 +314,15 @@ class ShiftScheduler:
         ot = self.opening_times.get(key, {})
         return ot.get("start", self.op_limit), ot.get("end", self.cl_limit)
 
+    def _day_window(self, date_str):
+        # (開店, 閉店) の分。選択肢カタログのキー
+        w = self._day_windows.get(date_str)
+        if w is None:
+            op, cl = self._get_opening_hours(date_str)
+            w = self._day_windows[date_str] = (self._to_minutes(op),
+                                               self._to_minutes(cl))
+        return w
+
     def _get_break_minutes(self, hours):
         brk = 0
         for rule in sorted(self.break_rules, key=lambda r: r.get("min_hours", 0)):
@@ -141,77 +330,69 @@ class ShiftScheduler:
                 brk = rule.get("break_minutes", 0)
         return brk
 
+    def _staff(self, staff):
+        # staff_list の dict でも StaffRecord でも受け付ける
+        if isinstance(staff, StaffRecord):
+            return staff
+        st = self._staff_by_id.get(staff["id"])
+        if st is None:
+            st = StaffRecord(-1, staff, ng_dates_by_staff(
+                [staff], self.requests)[staff["id"]])
+        return st
+
     def _get_staff_ng_dates(self, staff):
-        raw = staff.get("unavailable_dates")
-        ng = []
-        if raw:
-            if isinstance(raw, list):
-                ng = [str(d).strip() for d in raw]
-            else:
-                ng = [str(d).strip() for d in str(raw).split(",")]
-        for req in self.requests:
-            if (req.get("staff_id") == staff["id"]
-                    and req.get("type") in ("off", "holiday")
-                    and req.get("status") == "approved"):
-                rd = str(req.get("dates", ""))
-                if rd and rd not in ng:
-                    ng.append(rd)
-        return ng
+        return self._staff(staff).ng
 
     def _group_dates_by_week(self):
-        if not self.dates:
-            return []
+        # 期間は変わらないので一度だけ作る (返したリストは書き換えないこと)
+        if self._week_groups is not None:
+            return self._week_groups
         weeks, cur = [], []
         for d in self.dates:
-            dt = datetime.strptime(d, "%Y-%m-%d")
             if not cur:
                 cur.append(d)
             else:
-                prev = datetime.strptime(cur[-1], "%Y-%m-%d")
-                if dt.isocalendar()[1] == prev.isocalendar()[1] and dt.year == prev.year:
+                _, week, year = self._date_facts(d)
+                _, prev_week, prev_year = self._date_facts(cur[-1])
+                if week[1] == prev_week[1] and year == prev_year:
                     cur.append(d)
                 else:
                     weeks.append(cur)
                     cur = [d]
         if cur:
             weeks.append(cur)
+        self._week_groups = weeks
         return weeks
 
     def _build_shift_options(self, staff, date_str, force=False):
-        day_open, day_close = self._get_opening_hours(date_str)
-        open_min = self._to_minutes(day_open)
-        close_min = self._to_minutes(day_close)
-        if open_min >= close_min:
-            return []
-
-        max_hours = float(staff.get("max_hours_day") or 8)
-        if not force and max_hours <= 0:
-            return []
-        if force and max_hours <= 0:
-            max_hours = 8
-
-        options = []
-        seen = set()
-        for pat in self.shift_patterns:
-            ps = max(self._to_minutes(pat["start"]), open_min)
-            pe = min(self._to_minutes(pat["end"]), close_min)
-            if ps >= pe:
-                continue
-            hrs = (pe - ps) / 60.0
-            if hrs < 1:
-                continue
-            key = (ps, pe)
-            if key in seen:
-                continue
-            seen.add(key)
-            options.append({
-                "start": self._from_minutes(ps),
-                "end": self._from_minutes(pe),
-                "start_min": ps, "end_min": pe, "hours": hrs,
-            })
-        return options
+        st = self._staff(staff)
+        if self._is_frozen(st.id, date_str):
+            return ()
+        if self._flex_pool is not None:
+            opts = self._flex_pool.get((st.id, date_str), ())
+        else:
+            opts = self._pattern_options(st, date_str, force=force)
+        if self._restrict is not None and (st.id, date_str) in self._restrict:
+            keep = self._restrict[(st.id, date_str)]
+            return tuple(o for o in opts
+                         if (o["start_min"], o["end_min"]) == keep)
+        return opts
+
+    def _pattern_options(self, staff, date_str, force=False):
+        # 選択肢は営業時間だけで決まる (上限 0 時間のスタッフは強行時以外なし)
+        if not force and self._staff(staff).max_hours <= 0:
+            return ()
+        return self.option_catalog.options(*self._day_window(date_str))
 
     def _build_slot_requirements(self, date_str):
+        # 日付ごとに一度だけ作る。返した dict は共有なので書き換えないこと
+        slots = self._slot_req_cache.get(date_str)
+        if slots is None:
+            slots = self._slot_req_cache[date_str] = \
+                self._compute_slot_requirements(date_str)
+        return slots
+
+    def _compute_slot_requirements(self, date_str):
         req_num = self._get_required_staff(date_str)
         if req_num <= 0:
             return {}
@@ -220,24 +401,66 @@ class ShiftScheduler:
         cl = self._to_minutes(day_close)
         if op >= cl:
             return {}
+        step = self.slot_minutes
         slots = {}
-        for t in range(op, cl, 15):
+        for t in range(op, cl, step):
             slots[t] = req_num
 
-        dt = datetime.strptime(date_str, "%Y-%m-%d")
-        js_dow = (dt.weekday() + 1) % 7
-        for rule in self.time_staff_req:
-            if js_dow not in rule.get("days", []):
+        # 時間帯の指定がスロットに少しでも掛かれば、そのスロットの必要人数にする
+        # (粗いスロットでは区間内の最大)
+        js_dow = (self._date_facts(date_str)[0] + 1) % 7
+        for days, rs, re, rc in self._time_rules:
+            if js_dow not in days:
                 continue
-            rs = self._to_minutes(rule.get("start", "00:00"))
-            re = self._to_minutes(rule.get("end", "24:00"))
-            rc = int(rule.get("count", 0))
-            for t in range(op, cl, 15):
-                in_range = (rs <= t < re) if rs <= re else (t >= rs or t < re)
+            for t in range(op, cl, step):
+                if rs <= re:
+                    in_range = rs < t + step and t < re
+                else:
+                    in_range = t + step > rs or t < re
                 if in_range and t in slots:
                     slots[t] = max(slots[t], rc)
         return slots
 
+    def _slot_range(self, date_str, a, b):
+        # [a, b) の中に始まるスロットの開始分
+        op = self._day_window(date_str)[0]
+        step = self.slot_minutes
+        first = op + max(0, -(-(a - op) // step)) * step
+        return range(first, b, step)
+
+    def _is_frozen(self, sid, date_str):
+        if (sid, date_str) in self._fixed_keys:
+            return True
+        return bool(self.freeze_before) and date_str < self.freeze_before
+
+    def _fixed_cover(self, date_str, slot_min, ids=None):
+        return sum(1 for f in self._fixed_by_date.get(date_str, ())
+                   if f["start_min"] <= slot_min < f["end_min"]
+                   and (ids is None or f["staff_id"] in ids))
+
+    def _open_slot_requirements(self, date_str):
+        # 確定済みシフトで埋まっている分を差し引いた残りの必要人数
+        slots = {}
+        for slot_min, req in self._build_slot_requirements(date_str).items():
+            rest = req - self._fixed_cover(date_str, slot_min)
+            if rest > 0:
+                slots[slot_min] = rest
+        return slots
+
+    def _fixed_days(self, sid, dates):
+        return sum(1 for d in dates if (sid, d) in self._fixed_keys)
+
+    def _iso_week(self, date_str):
+        return self._date_facts(date_str)[1]
+
+    def _fixed_days_in_week(self, sid, week):
+        return self._fixed_week_days.get((sid, self._iso_week(week[0])), 0)
+
+    def _seven_day_windows(self):
+        # 期間の前後にある確定済みシフトも含めて7日窓を作る(期間境界の連勤も判定する)
+        days = sorted(set(self.dates) | {f["date"] for f in self.fixed_shifts})
+        return [days[i:i + 7] for i in range(len(days) - 6)]
+
     def _is_mentor(self, staff):
         return staff["id"] in self._mentor_ids
 
@@ -249,13 +472,11 @@ class ShiftScheduler:
         daily_details = []
         total_shortage = 0.0
 
-        usable = [s for s in self.staff_list
-                   if int(s.get("max_days_week") or 5) > 0]
-        unusable = [s for s in self.staff_list
-                    if int(s.get("max_days_week") or 5) <= 0]
+        usable = [st for st in self.staff_table if st.max_days > 0]
+        unusable = [st for st in self.staff_table if st.max_days <= 0]
 
         if unusable:
-            names = [s.get("name", s["id"]) for s in unusable]
+            names = [st.raw.get("name", st.id) for st in unusable]
             warnings.append({
                 "type": "unusable_staff",
                 "message": "{}名が出勤不可(max_days=0): {}".format(
@@ -263,38 +484,25 @@ class ShiftScheduler:
                 "severity": "info",
             })
 
+        # スロット単位の不足に加え、週上限・7連勤を考慮した人数不足も下界に含める
+        bound = coverage_bound(self)
         for d in self.dates:
-            if self._get_day_type(d) == "closed":
+            info = bound["daily"].get(d)
+            if not info:
                 continue
-            slot_reqs = self._build_slot_requirements(d)
-            if not slot_reqs:
-                continue
-            available = [s for s in usable
-                         if d not in self._get_staff_ng_dates(s)]
-            shortage_slots = {}
-            for slot_min, req in slot_reqs.items():
-                cover = 0
-                for s in available:
-                    for opt in self._build_shift_options(s, d):
-                        if opt["start_min"] <= slot_min < opt["end_min"]:
-                            cover += 1
-                            break
-                gap = req - cover
-                if gap > 0:
-                    shortage_slots[slot_min] = gap
-
-            if shortage_slots:
-                ranges = self._compress_ranges(shortage_slots)
-                hrs = sum(v * 0.25 for v in shortage_slots.values())
-                total_shortage += hrs
-                daily_details.append({
-                    "date": d,
-                    "day_type": self._get_day_type(d),
-                    "available_staff": len(available),
-                    "required_per_slot": self._get_required_staff(d),
-                    "shortage_ranges": ranges,
-                    "shortage_hours": round(hrs, 1),
-                })
+            available = [st for st in usable if d not in st.ng]
+            hrs = info["slot_shortage_hours"] + info["staffing_shortage_hours"]
+            total_shortage += hrs
+            daily_details.append({
+                "date": d,
+                "day_type": self._get_day_type(d),
+                "available_staff": len(available),
+                "required_per_slot": self._get_required_staff(d),
+                "shortage_ranges": self._compress_ranges(info["shortage_slots"]),
+                "shortage_hours": round(hrs, 1),
+                "staffing_shortage_hours": round(
+                    info["staffing_shortage_hours"], 1),
+            })
 
         if total_shortage > 0:
             warnings.append({
@@ -305,7 +513,7 @@ class ShiftScheduler:
                 "affected_days": len(daily_details),
             })
 
-        return {
+        result = {
             "feasible": total_shortage == 0,
             "warnings": warnings,
             "daily_details": daily_details,
@@ -316,9 +524,17 @@ class ShiftScheduler:
                 "work_dates": len([d for d in self.dates
                                    if self._get_day_type(d) != "closed"]),
                 "total_shortage_hours": round(total_shortage, 1),
+                "staffing_shortage_hours": round(
+                    bound["staffing_shortage_hours"], 1),
                 "affected_days": len(daily_details),
+                "bound_ms": bound["elapsed_ms"],
             },
         }
+        if self.auto_tune:
+            # 生成前に UI が「時間がかかります」と警告できるよう予想時間を返す
+            from tuning import plan
+            result["tuning"] = plan(self, bound)
+        return result
 
     def _compress_ranges(self, slots):
         ranges = []
@@ -327,124 +543,261 @@ class ShiftScheduler:
             v = slots[t]
             if start is None:
                 start, short = t, v
-            elif t == prev + 15 and v == short:
+            elif t == prev + self.slot_minutes and v == short:
                 pass
             else:
                 ranges.append({"start": self._from_minutes(start),
-                               "end": self._from_minutes(prev + 15),
+                               "end": self._from_minutes(prev + self.slot_minutes),
                                "shortage": short})
                 start, short = t, v
             prev = t
         if start is not None:
             ranges.append({"start": self._from_minutes(start),
-                           "end": self._from_minutes(prev + 15),
+                           "end": self._from_minutes(prev + self.slot_minutes),
                            "shortage": short})
         return ranges
 
-    def solve(self, force=False):
-        result = self._solve_milp(force=force, tier=3)
-        if result:
-            print("[Solve] Tier 3 (full) succeeded")
-            return result
-
-        print("[Fallback] Relaxing Tier 3...")
-        result = self._solve_milp(force=force, tier=2)
-        if result:
-            print("[Solve] Tier 2 (no OJT/balance) succeeded")
-            return result
-
-        print("[Fallback] Relaxing to Tier 1 + force...")
-        result = self._solve_milp(force=True, tier=1)
-        if result:
-            print("[Solve] Tier 1 (legal only) succeeded")
-            return result
-
+    def solve(self, force=False, objective="weighted"):
+        if self.flex.get("enabled"):
+            from colgen import ColumnGenerator
+            self._flex_pool = ColumnGenerator(self, force=force).run()
+
+        self.cancel.check()
+        if self.hint_shifts:
+            self._prepare_hint(force)
+        self.bound = coverage_bound(self, force=force)
+        if self.auto_tune:
+            from tuning import tune
+            self.tuning = tune(self, self.bound)
+        if self._nothing_to_do():
+            # 必要人数は確定済みシフトで埋まっている (または必要人数がない)。作るシフトはない
+            print("[Bound] Nothing left to staff")
+            self.solved_with = {"tier": 3, "force": force, "nothing_to_do": True}
+            return []
+        if (self.bound["open_days"] and self.bound["assignable_staff_days"] == 0
+                and not force):
+            # 足りない日があるのに誰も割り当てられないので Tier 3/2 は組まない
+            print("[Bound] No assignable staff-days, skipping Tier 3/2")
+            self._failure = {"tier": 3, "force": force, "status": "Skipped"}
+        else:
+            if self.coarse_slot_minutes:
+                # 粗いスロットで骨組みを決めてから境目だけ細かく解く。だめなら通常の Tier 3
+                from multires import coarse_to_fine
+                result = coarse_to_fine(self, force=force, objective=objective)
+                if result:
+                    print("[Solve] Tier 3 (coarse -> fine) succeeded")
+                    return result
+            result = self._solve_milp(force=force, tier=3, objective=objective)
+            if result:
+                print("[Solve] Tier 3 (full) succeeded")
+                return result
+
+        # 段を1つずつ緩めて解き直す前に、失敗の原因から次に試す段を決める
+        self.cancel.check()
+        from diagnose import diagnose_failure
+        self.diagnosis = diagnose_failure(self, self._failure)
+        self._failure = None
+        plan = self.diagnosis["fallback"]
+        start = plan["tier"]
+        if start is None:
+            return None
+        objective = plan.get("objective", objective)
+
+        for tier in range(start, 1, -1):
+            self.cancel.check()
+            print("[Fallback] Tier {} ({})...".format(tier, self.TIER_LABELS[tier]))
+            result = self._solve_milp(force=force, tier=tier, objective=objective)
+            if result:
+                print("[Solve] Tier {} ({}) succeeded".format(
+                    tier, self.TIER_LABELS[tier]))
+                return result
+
+        if start >= 1:
+            self.cancel.check()
+            print("[Fallback] Relaxing to Tier 1 + force...")
+            result = self._solve_milp(force=True, tier=1, objective=objective)
+            if result:
+                print("[Solve] Tier 1 (legal only) succeeded")
+                return result
+
+        self.cancel.check()
         print("[Fallback] Greedy...")
         return self._solve_greedy()
 
-    def _solve_milp(self, force=False, tier=3):
+    def _nothing_to_do(self):
+        # 人数も店長の在席も確定済みシフトで足りていれば、作るシフトはない
+        if self.bound["open_days"]:
+            return False
+        for d in self.dates:
+            if self._get_day_type(d) == "closed":
+                continue
+            if not any(st.manager and d not in st.ng for st in self.staff_table):
+                continue
+            for slot_min in self._build_slot_requirements(d):
+                if self._fixed_cover(d, slot_min, self._manager_ids) < self.min_manager:
+                    return False
+        return True
+
+    def _solve_milp(self, force=False, tier=3, objective="weighted"):
+        _load_pulp()
+        model = None
+        self._failure = {"tier": tier, "force": force, "objective": objective}
         try:
-            prob = pulp.LpProblem("RakuShift_v2", pulp.LpMinimize)
-            penalty = pulp.LpAffineExpression()
-
-            x = {}
-            staff_opts = {}
+            model = self._build_milp(force=force, tier=tier)
+            measuring = self._start_from_hint(model, force, tier)
+            try:
+                if objective == "lexicographic":
+                    status = self._run_lexicographic(model)
+                else:
+                    status = self._run_weighted(model)
+            finally:
+                if measuring:
+                    self._finish_measure()
 
-            for s in self.staff_list:
-                sid = s["id"]
-                ng = self._get_staff_ng_dates(s)
-                for d in self.dates:
-                    if d in ng or self._get_day_type(d) == "closed":
-                        staff_opts[(sid, d)] = []
-                        continue
-                    opts = self._build_shift_options(s, d, force=force)
-                    staff_opts[(sid, d)] = opts
-                    for oi in range(len(opts)):
-                        x[(sid, d, oi)] = pulp.LpVariable(
-                            "x_{}_{}_{}" .format(sid, d, oi),
-                            0, 1, pulp.LpBinary)
+            print("[MILP] Status: {} (tier={}, force={}, objective={})".format(
+                status, tier, force, objective))
 
-            # ========== TIER 1: Legal / Contract ==========
+            self._failure.update(status=status, model=model)
+            if status not in ("Optimal", "Not Solved"):
+                return None
+            shifts = self._extract_shifts(model)
+            if not shifts:
+                return None
+            self.solved_with = {"tier": tier, "force": force, "status": status}
+            self._model = model
+            self._failure = None
+            if model["slacks"] or model["uncovered"]:
+                from diagnose import explain_shortage
+                self.shortages = explain_shortage(self, model)
+            return shifts
+
+        except Cancelled:
+            raise
+        except Exception as e:
+            self.cancel.check()
+            print("[MILP Error] {}".format(e))
+            import traceback
+            traceback.print_exc()
+            self._failure.update(error=str(e), model=model)
+            return None
 
-            for s in self.staff_list:
-                sid = s["id"]
-                for d in self.dates:
-                    opts = staff_opts.get((sid, d), [])
-                    if opts:
-                        prob += pulp.lpSum(
-                            x[(sid, d, oi)] for oi in range(len(opts))
-                        ) <= 1
-
-            week_groups = self._group_dates_by_week()
-            for s in self.staff_list:
-                sid = s["id"]
-                max_days = int(s.get("max_days_week") or 5)
-                if not force and max_days <= 0:
-                    for d in self.dates:
-                        for oi in range(len(staff_opts.get((sid, d), []))):
-                            prob += x[(sid, d, oi)] == 0
+    def _build_milp(self, force=False, tier=3):
+        prob = pulp.LpProblem("RakuShift_v2", pulp.LpMinimize)
+        # 目的関数は優先度ごとに分けて持ち、重み付き和か辞書式かを後で選ぶ
+        terms = {k: pulp.LpAffineExpression() for k in self.OBJECTIVE_WEIGHTS}
+
+        x = {}
+        staff_opts = {}
+        # 名前付きの硬い制約 -> {"rule", "staff_id", "dates", "limit"} (診断用)
+        rows = {}
+        # 違反量のスラック (種類, 日, スロット) -> 変数 (不足の説明用)
+        slacks = {}
+        # 誰も入れない枠の不足 (日, スロット) -> 人数。変数を持たない定数なので
+        # 目的関数には入れず、要約と不足の説明にだけ足す
+        uncovered = {}
+        # スロット単位の違反は 15 分あたりに揃えて目的関数に入れる
+        # (スロットの長さを変えても人件費などとの釣り合いが変わらないように)
+        per_slot = self.slot_minutes / 15.0
+
+        for st in self.staff_table:
+            sid = st.id
+            for d in self.dates:
+                if d in st.ng or self._get_day_type(d) == "closed":
+                    staff_opts[(sid, d)] = ()
                     continue
-                effective = max_days if not force else max(max_days, 6)
-                for week in week_groups:
-                    wv = []
-                    for d in week:
-                        for oi in range(len(staff_opts.get((sid, d), []))):
-                            wv.append(x[(sid, d, oi)])
-                    if wv:
-                        prob += pulp.lpSum(wv) <= effective
-
-            if not force:
-                sorted_d = sorted(self.dates)
-                for s in self.staff_list:
-                    sid = s["id"]
-                    for i in range(len(sorted_d) - 6):
-                        span = sorted_d[i:i + 7]
-                        sv = []
-                        for d in span:
-                            for oi in range(len(staff_opts.get((sid, d), []))):
-                                sv.append(x[(sid, d, oi)])
-                        if sv:
-                            prob += pulp.lpSum(sv) <= 6
-
-            # ========== TIER 2: Coverage ==========
-
-            if tier >= 2:
-                for d in self.dates:
-                    slot_reqs = self._build_slot_requirements(d)
-                    for slot_min, req in slot_reqs.items():
-                        workers = []
-                        for s in self.staff_list:
-                            sid = s["id"]
-                            for oi, opt in enumerate(staff_opts.get((sid, d), [])):
-                                if opt["start_min"] <= slot_min < opt["end_min"]:
-                                    workers.append(x[(sid, d, oi)])
-                        if workers:
-                            slack = pulp.LpVariable(
-                                "cov_{}_{}".format(d, slot_min),
-                                0, None, pulp.LpInteger)
-                            prob += pulp.lpSum(workers) + slack >= req
-                            penalty += slack * 1000000
+                staff_opts[(sid, d)] = self._build_shift_options(st, d, force=force)
+
+        # 変数を作る前に、禁止・支配される選択肢と常に満たされる行を落とす
+        if self.config.get("presolve", True):
+            from presolve import presolve
+            pre = presolve(self, staff_opts, force=force, tier=tier)
+            self.presolve_report = pre["report"]
+        else:
+            pre = None
+
+        for (sid, d), opts in staff_opts.items():
+            for oi in range(len(opts)):
+                x[(sid, d, oi)] = pulp.LpVariable(
+                    "x_{}_{}_{}" .format(sid, d, oi),
+                    0, 1, pulp.LpBinary)
+
+        # ========== TIER 1: Legal / Contract ==========
+
+        for st in self.staff_table:
+            sid = st.id
+            for di, d in enumerate(self.dates):
+                opts = staff_opts.get((sid, d), ())
+                if len(opts) > 1 or (opts and pre is None):
+                    name = "day_{}_{}".format(st.index, di)
+                    prob += pulp.lpSum(
+                        x[(sid, d, oi)] for oi in range(len(opts))
+                    ) <= 1, name
+                    rows[name] = {"rule": "one_per_day", "staff_id": sid,
+                                  "dates": [d], "limit": 1}
+
+        if pre is not None:
+            for rule, limit_rows in (("weekly_limit", pre["week_rows"]),
+                                     ("consecutive_days", pre["span_rows"])):
+                for sid, days, rest in limit_rows:
+                    name = "{}_{}".format(rule, len(rows))
+                    prob += pulp.lpSum(
+                        x[(sid, d, oi)] for d in days
+                        for oi in range(len(staff_opts[(sid, d)]))) <= rest, name
+                    rows[name] = {"rule": rule, "staff_id": sid,
+                                  "dates": days, "limit": rest}
+        else:
+            self._limit_rows(prob, x, staff_opts, force, rows)
 
+        # ========== TIER 2: Coverage ==========
+
+        if tier >= 2:
+            for d in self.dates:
+                slot_reqs = self._open_slot_requirements(d)
+                for slot_min, req in slot_reqs.items():
+                    workers = []
+                    for st in self.staff_table:
+                        sid = st.id
+                        for oi, opt in enumerate(staff_opts.get((sid, d), [])):
+                            if opt["start_min"] <= slot_min < opt["end_min"]:
+                                workers.append(x[(sid, d, oi)])
+                    if workers:
+                        slack = pulp.LpVariable(
+                            "cov_{}_{}".format(d, slot_min),
+                            0, None, pulp.LpInteger)
+                        prob += pulp.lpSum(workers) + slack >= req
+                        terms["coverage"] += slack * per_slot
+                        slacks[("coverage", d, slot_min)] = slack
+                    else:
+                        uncovered[(d, slot_min)] = req
+
+            for d in self.dates:
+                if self._get_day_type(d) == "closed":
+                    continue
+                slot_reqs = self._build_slot_requirements(d)
+                if not slot_reqs:
+                    continue
+                for slot_min in slot_reqs:
+                    need = self.min_manager - self._fixed_cover(
+                        d, slot_min, self._manager_ids)
+                    if need <= 0:
+                        continue
+                    mgr_vars = []
+                    for mid in self._manager_ids:
+                        for oi, opt in enumerate(staff_opts.get((mid, d), [])):
+                            if opt["start_min"] <= slot_min < opt["end_min"]:
+                                mgr_vars.append(x[(mid, d, oi)])
+                    if mgr_vars:
+                        slack = pulp.LpVariable(
+                            "mgr_{}_{}".format(d, slot_min),
+                            0, None, pulp.LpInteger)
+                        prob += pulp.lpSum(mgr_vars) + slack >= need
+                        terms["manager"] += slack * per_slot
+                        slacks[("manager", d, slot_min)] = slack
+
+        # ========== TIER 3: OJT / Power Balance ==========
+
+        if tier >= 3:
+            if self._rookie_ids and self._mentor_ids:
                 for d in self.dates:
                     if self._get_day_type(d) == "closed":
                         continue
@@ -452,157 +805,425 @@ class ShiftScheduler:
                     if not slot_reqs:
                         continue
                     for slot_min in slot_reqs:
-                        mgr_vars = []
-                        for mid in self._manager_ids:
-                            for oi, opt in enumerate(staff_opts.get((mid, d), [])):
+                        rookie_vars = []
+                        mentor_vars = []
+                        for st in self.staff_table:
+                            sid = st.id
+                            for oi, opt in enumerate(staff_opts.get((sid, d), [])):
                                 if opt["start_min"] <= slot_min < opt["end_min"]:
-                                    mgr_vars.append(x[(mid, d, oi)])
-                        if mgr_vars:
+                                    if sid in self._rookie_ids:
+                                        rookie_vars.append(x[(sid, d, oi)])
+                                    if sid in self._mentor_ids:
+                                        mentor_vars.append(x[(sid, d, oi)])
+                        fixed_m = self._fixed_cover(d, slot_min, self._mentor_ids)
+                        fixed_r = self._fixed_cover(d, slot_min, self._rookie_ids)
+                        if (rookie_vars or fixed_r) and (mentor_vars or fixed_m):
                             slack = pulp.LpVariable(
-                                "mgr_{}_{}".format(d, slot_min),
+                                "ojt_{}_{}".format(d, slot_min),
                                 0, None, pulp.LpInteger)
-                            prob += pulp.lpSum(mgr_vars) + slack >= self.min_manager
-                            penalty += slack * 500000
-
-            # ========== TIER 3: OJT / Power Balance ==========
-
-            if tier >= 3:
-                if self._rookie_ids and self._mentor_ids:
-                    for d in self.dates:
-                        if self._get_day_type(d) == "closed":
-                            continue
-                        slot_reqs = self._build_slot_requirements(d)
-                        if not slot_reqs:
-                            continue
-                        for slot_min in slot_reqs:
-                            rookie_vars = []
-                            mentor_vars = []
-                            for s in self.staff_list:
-                                sid = s["id"]
-                                for oi, opt in enumerate(staff_opts.get((sid, d), [])):
-                                    if opt["start_min"] <= slot_min < opt["end_min"]:
-                                        if sid in self._rookie_ids:
-                                            rookie_vars.append(x[(sid, d, oi)])
-                                        if sid in self._mentor_ids:
-                                            mentor_vars.append(x[(sid, d, oi)])
-                            if rookie_vars and mentor_vars:
-                                slack = pulp.LpVariable(
-                                    "ojt_{}_{}".format(d, slot_min),
-                                    0, None, pulp.LpInteger)
-                                prob += pulp.lpSum(mentor_vars) + slack >= pulp.lpSum(rookie_vars)
-                                penalty += slack * 200000
-                            elif rookie_vars and not mentor_vars:
-                                for rv in rookie_vars:
-                                    penalty += rv * 200000
-
+                            prob += (pulp.lpSum(mentor_vars) + fixed_m + slack
+                                     >= pulp.lpSum(rookie_vars) + fixed_r)
+                            terms["ojt"] += slack * per_slot
+                            slacks[("ojt", d, slot_min)] = slack
+                        elif rookie_vars and not mentor_vars:
+                            for rv in rookie_vars:
+                                terms["ojt"] += rv * per_slot
+
+            for d in self.dates:
+                if self._get_day_type(d) == "closed":
+                    continue
+                slot_reqs = self._build_slot_requirements(d)
+                if not slot_reqs:
+                    continue
+                power_expr = pulp.LpAffineExpression()
+                for st in self.staff_table:
+                    sid = st.id
+                    pw = self.POWER_SCORE.get(st.rank, 2.0)
+                    for oi in range(len(staff_opts.get((sid, d), []))):
+                        power_expr += x[(sid, d, oi)] * pw
+                    if (sid, d) in self._fixed_keys:
+                        power_expr += pw
+                min_req = self._get_required_staff(d)
+                if min_req > 0:
+                    slack = pulp.LpVariable("pw_{}".format(d), 0, None)
+                    prob += power_expr + slack >= 1.5 * min_req
+                    terms["power"] += slack
+
+            for st in self.staff_table:
+                sid = st.id
+                cost = {"A": 0, "B": 50, "C": 500, "D": 2000}.get(st.rank, 50)
                 for d in self.dates:
-                    if self._get_day_type(d) == "closed":
-                        continue
-                    slot_reqs = self._build_slot_requirements(d)
-                    if not slot_reqs:
-                        continue
-                    power_expr = pulp.LpAffineExpression()
-                    for s in self.staff_list:
-                        sid = s["id"]
-                        rank = self._eval_rank.get(sid, "B")
-                        pw = self.POWER_SCORE.get(rank, 2.0)
-                        for oi in range(len(staff_opts.get((sid, d), []))):
-                            power_expr += x[(sid, d, oi)] * pw
-                    min_req = self._get_required_staff(d)
-                    if min_req > 0:
-                        slack = pulp.LpVariable("pw_{}".format(d), 0, None)
-                        prob += power_expr + slack >= 1.5 * min_req
-                        penalty += slack * 10000
-
-                for s in self.staff_list:
-                    sid = s["id"]
-                    rank = self._eval_rank.get(sid, "B")
-                    cost = {"A": 0, "B": 50, "C": 500, "D": 2000}.get(rank, 50)
-                    for d in self.dates:
-                        for oi in range(len(staff_opts.get((sid, d), []))):
-                            penalty += x[(sid, d, oi)] * cost
+                    for oi in range(len(staff_opts.get((sid, d), []))):
+                        terms["cost"] += x[(sid, d, oi)] * cost
 
-            # ========== OBJECTIVES ==========
+        # ========== OBJECTIVES ==========
 
-            for sid in self._monthly_ids:
-                for d in self.dates:
-                    if self._get_day_type(d) == "closed":
-                        continue
-                    opts = staff_opts.get((sid, d), [])
-                    if opts:
-                        not_working = 1 - pulp.lpSum(
-                            x[(sid, d, oi)] for oi in range(len(opts)))
-                        penalty += not_working * 30000
-
-            for s in self.staff_list:
-                if str(s.get("salary_type", "hourly")).lower() != "hourly":
+        for sid in self._monthly_ids:
+            for d in self.dates:
+                if self._get_day_type(d) == "closed":
                     continue
-                wage = float(s.get("hourly_wage", 1100))
-                sid = s["id"]
+                opts = staff_opts.get((sid, d), [])
+                if opts:
+                    not_working = 1 - pulp.lpSum(
+                        x[(sid, d, oi)] for oi in range(len(opts)))
+                    terms["monthly"] += not_working
+                elif pre is not None and (sid, d) in pre["forbidden"]:
+                    terms["monthly"] += 1
+
+        for st in self.staff_table:
+            if not st.hourly:
+                continue
+            wage = st.wage
+            sid = st.id
+            for d in self.dates:
+                for oi, opt in enumerate(staff_opts.get((sid, d), [])):
+                    terms["cost"] += x[(sid, d, oi)] * wage * opt["hours"] * 0.01
+
+        if force:
+            for st in self.staff_table:
+                mh = st.max_hours
+                sid = st.id
                 for d in self.dates:
                     for oi, opt in enumerate(staff_opts.get((sid, d), [])):
-                        penalty += x[(sid, d, oi)] * wage * opt["hours"] * 0.01
-
-            if force:
-                for s in self.staff_list:
-                    mh = float(s.get("max_hours_day") or 8)
-                    sid = s["id"]
-                    for d in self.dates:
-                        for oi, opt in enumerate(staff_opts.get((sid, d), [])):
-                            if opt["hours"] > mh:
-                                penalty += x[(sid, d, oi)] * (opt["hours"] - mh) * 50000
-
-            prob += penalty
-            solver = pulp.PULP_CBC_CMD(msg=0, timeLimit=120)
-            prob.solve(solver)
-
+                        if opt["hours"] > mh:
+                            terms["overtime"] += x[(sid, d, oi)] * (opt["hours"] - mh)
+
+        return {"prob": prob, "x": x, "staff_opts": staff_opts,
+                "terms": terms, "force": force, "tier": tier,
+                "rows": rows, "slacks": slacks, "uncovered": uncovered}
+
+    def _limit_rows(self, prob, x, staff_opts, force, rows):
+        # presolve なしのときの週上限・7連勤の行
+        week_groups = self._group_dates_by_week()
+        for st in self.staff_table:
+            sid = st.id
+            max_days = st.max_days
+            if not force and max_days <= 0:
+                for d in self.dates:
+                    for oi in range(len(staff_opts.get((sid, d), []))):
+                        name = "max_days_zero_{}".format(len(rows))
+                        prob += x[(sid, d, oi)] == 0, name
+                        rows[name] = {"rule": "max_days_zero", "staff_id": sid,
+                                      "dates": [d], "limit": 0}
+                continue
+            effective = max_days if not force else max(max_days, 6)
+            for week in week_groups:
+                wv = []
+                for d in week:
+                    for oi in range(len(staff_opts.get((sid, d), []))):
+                        wv.append(x[(sid, d, oi)])
+                if wv:
+                    rest = max(effective - self._fixed_days_in_week(sid, week), 0)
+                    name = "weekly_limit_{}".format(len(rows))
+                    prob += pulp.lpSum(wv) <= rest, name
+                    rows[name] = {"rule": "weekly_limit", "staff_id": sid,
+                                  "dates": week, "limit": rest}
+
+        if not force:
+            for st in self.staff_table:
+                sid = st.id
+                for span in self._seven_day_windows():
+                    sv = []
+                    for d in span:
+                        for oi in range(len(staff_opts.get((sid, d), []))):
+                            sv.append(x[(sid, d, oi)])
+                    if sv:
+                        rest = max(6 - self._fixed_days(sid, span), 0)
+                        name = "consecutive_days_{}".format(len(rows))
+                        prob += pulp.lpSum(sv) <= rest, name
+                        rows[name] = {"rule": "consecutive_days", "staff_id": sid,
+                                      "dates": span, "limit": rest}
+
+    def _run_weighted(self, model):
+        prob = model["prob"]
+        prob.setObjective(self._weighted_objective(model))
+        self.cancel.solve(prob, pulp.PULP_CBC_CMD(
+            msg=0, timeLimit=self.cancel.time_limit(self.time_limit),
+            threads=self.solver_threads, gapRel=self.solver_gap,
+            **self._hint_options(model)))
+        return pulp.LpStatus[prob.status]
+
+    def _run_lexicographic(self, model):
+        # 優先度の高い項から順に最小化し、その値を制約として固定して次へ進む。
+        # 各段は前段の解を初期解(warm start)として使う。
+        prob = model["prob"]
+        terms = model["terms"]
+        deadline = time.perf_counter() + self.cancel.time_limit(self.time_limit)
+        stages = [[k for k in keys if terms[k].keys()]
+                  for keys in self.LEXICO_STAGES]
+        stages = [keys for keys in stages if keys]
+        status = "Not Solved"
+        for i, keys in enumerate(stages):
+            if len(keys) == 1:
+                expr = terms[keys[0]]
+            else:
+                expr = pulp.lpSum(terms[k] * self.OBJECTIVE_WEIGHTS[k]
+                                  for k in keys)
+            prob.setObjective(expr)
+            remaining = max(1.0, deadline - time.perf_counter())
+            last = (i == len(stages) - 1)
+            # 優先度の高い段は厳密に、最後の好みの段だけ相対ギャップで打ち切る
+            opts = {"warmStart": True} if i > 0 else self._hint_options(model)
+            self.cancel.solve(prob, pulp.PULP_CBC_CMD(
+                msg=0, timeLimit=remaining, threads=self.solver_threads,
+                gapRel=self.LEXICO_FINAL_GAP if last else None, **opts))
+            status = pulp.LpStatus[prob.status]
+            value = pulp.value(expr)
+            print("[Lexico] stage {} {}: {} = {}".format(
+                i + 1, "+".join(keys), status, value))
+            if status not in ("Optimal", "Not Solved") or value is None:
+                break
+            if not last:
+                tol = 1e-6 + abs(value) * 1e-9
+                prob += expr <= value + tol, "lex_{}".format(i)
+        return status
+
+    def _weighted_objective(self, model):
+        return pulp.lpSum(expr * self.OBJECTIVE_WEIGHTS[k]
+                          for k, expr in model["terms"].items())
+
+    # ---------- 別解 (solution pool) ----------
+
+    def solve_alternatives(self, k, min_diff=None, gap=0.05):
+        # 解いたモデルに「これまでの解と min_diff 件以上違う」カット (no-good) と
+        # 目的関数の上限 (最良値の gap 以内) を足して解き直し、別解を k 個まで作る。
+        # モデルは組み直さないので、k 回 /generate を呼ぶよりずっと安い
+        model = self._model
+        if model is None or k <= 0:
+            return []
+        started = time.perf_counter()
+        prob, x = model["prob"], model["x"]
+        objective = self._weighted_objective(model)
+        prob.setObjective(objective)
+        best = pulp.value(objective)
+        chosen = self._chosen(model)
+        if best is None or not chosen:
+            return []
+        prob += objective <= best + abs(best) * gap + 1e-6, "alt_cutoff"
+        if min_diff is None:
+            min_diff = max(2, int(math.ceil(len(chosen) * 0.1)))
+        per_alt = float(self.config.get("alternative_time_limit", 15))
+
+        alternatives = []
+        seen = [chosen]
+        for i in range(k):
+            rest = self.cancel.remaining()
+            if rest is not None and rest < per_alt + 5:
+                print("[Alt] stopping: {:.0f}s left before deadline".format(rest))
+                break
+            prev = seen[-1]
+            prob += (pulp.lpSum(x[key] for key in prev)
+                     <= len(prev) - min(min_diff, len(prev))), "alt_nogood_{}".format(i)
+            self.cancel.solve(prob, pulp.PULP_CBC_CMD(
+                msg=0, timeLimit=self.cancel.time_limit(per_alt),
+                threads=self.solver_threads, gapRel=self.LEXICO_FINAL_GAP))
             status = pulp.LpStatus[prob.status]
-            print("[MILP] Status: {} (tier={}, force={})".format(
-                status, tier, force))
+            picked = self._chosen(model)
+            if status not in ("Optimal", "Not Solved") or not picked:
+                print("[Alt] no more alternatives within gap ({})".format(status))
+                break
+            seen.append(picked)
+            alternatives.append({
+                "rank": i + 1,
+                "shifts": self._extract_shifts(model) or [],
+                "summary": self.solution_summary(model),
+                "differs_from_best": len(chosen ^ picked),
+            })
+        print("[Alt] {} alternative(s) in {:.2f}s (min_diff={}, gap={})".format(
+            len(alternatives), time.perf_counter() - started, min_diff, gap))
+        return alternatives
+
+    def _chosen(self, model):
+        return {key for key, v in model["x"].items()
+                if v.varValue is not None and v.varValue > 0.5}
+
+    def solution_summary(self, model=None):
+        # 目的関数の内訳 (違反量) と人件費。別解どうしを比べるための要約
+        model = model or self._model
+        if model is None:
+            return None
+        # スロット単位の項は 15 分単位で入っている
+        terms = {k: round(pulp.value(expr) or 0.0, 2)
+                 for k, expr in model["terms"].items()}
+        labor = 0.0
+        for (sid, d, oi), v in model["x"].items():
+            if v.varValue is not None and v.varValue > 0.5:
+                st = self._staff_by_id[sid]
+                if st.hourly:
+                    labor += st.wage * model["staff_opts"][(sid, d)][oi]["hours"]
+        return {
+            "objective": round(pulp.value(self._weighted_objective(model)) or 0.0, 2),
+            "coverage_shortage_hours": round(
+                terms["coverage"] * 0.25
+                + sum(model["uncovered"].values()) * self.slot_hours, 2),
+            "manager_shortage_hours": terms["manager"] * 0.25,
+            "ojt_violation_hours": terms["ojt"] * 0.25,
+            "overtime_hours": terms["overtime"],
+            "labor_cost": round(labor),
+        }
 
-            if status not in ("Optimal", "Not Solved"):
-                return None
+    # ---------- 初期解ヒント (MIP start) ----------
+
+    def _prepare_hint(self, force):
+        # 案から NG 日・確定済み枠・週の上限・7連勤などの絶対ルール違反を外すだけにする。
+        # 足したり動かしたりはしない (初期解の質はソルバーが上げる)
+        from audit import hard_filter
+        shifts, report = hard_filter(self, self.hint_shifts, force=force)
+        self._hint = {}
+        for sh in shifts:
+            self._hint[(sh["staff_id"], sh["date"])] = (
+                self._to_minutes(sh["start_time"]),
+                self._to_minutes(sh["end_time"]))
+        received = len(self.hint_shifts)
+        self.hint_report = {
+            "received": received,
+            "validated": len(self._hint),
+            "dropped": report["dropped"],
+            "survived": round(len(self._hint) / received, 3) if received else None,
+        }
+        print("[Hint] kept {}/{} shifts of the draft, dropped {} ({}ms)".format(
+            len(self._hint), received, report["dropped"], report["elapsed_ms"]))
 
-            shifts = []
-            warnings = []
-            for s in self.staff_list:
-                sid = s["id"]
-                for d in self.dates:
-                    for oi, opt in enumerate(staff_opts.get((sid, d), [])):
-                        if (sid, d, oi) in x and pulp.value(x[(sid, d, oi)]) == 1:
-                            hrs = opt["hours"]
-                            brk = self._get_break_minutes(hrs)
-                            mh = float(s.get("max_hours_day") or 8)
-                            entry = {
-                                "staff_id": sid,
-                                "date": d,
-                                "start_time": opt["start"],
-                                "end_time": opt["end"],
-                                "break_minutes": brk,
-                            }
-                            if hrs > mh:
-                                entry["overtime"] = True
-                                entry["overtime_hours"] = round(hrs - mh, 1)
-                                warnings.append("{} {}: {:.1f}h over".format(
-                                    s.get("name", ""), d, hrs - mh))
-                            shifts.append(entry)
-
-            self._validate(shifts)
-            if warnings:
-                print("[OVERTIME]")
-                for w in warnings:
-                    print("  " + w)
-            print("[Result] {} shifts".format(len(shifts)))
-            return shifts if shifts else None
+    def _hint_options(self, model):
+        if not model.get("hinted"):
+            return {}
+        opts = {"warmStart": True}
+        if model.get("log_path"):
+            opts["logPath"] = model["log_path"]
+        return opts
+
+    def _apply_hint(self, model):
+        # 案を x の初期値に写す。同じ時間帯の選択肢がなければ重なりの大きいものを使う。
+        # スラック変数も案から決まる値にして、CBC が完全な初期解として受け取れるようにする
+        x = model["x"]
+        exact = nearest = 0
+        for (sid, d), opts in model["staff_opts"].items():
+            if not opts:
+                continue
+            want = self._hint.get((sid, d))
+            pick = None
+            if want is not None:
+                a, b = want
+                best = None
+                for oi, o in enumerate(opts):
+                    overlap = min(b, o["end_min"]) - max(a, o["start_min"])
+                    key = (overlap, -abs((o["end_min"] - o["start_min"]) - (b - a)))
+                    if overlap > 0 and (best is None or key > best[0]):
+                        best = (key, oi)
+                    if (o["start_min"], o["end_min"]) == (a, b):
+                        best = ((float("inf"), 0), oi)
+                        break
+                if best is not None:
+                    pick = best[1]
+                    if best[0][0] == float("inf"):
+                        exact += 1
+                    else:
+                        nearest += 1
+            for oi in range(len(opts)):
+                x[(sid, d, oi)].setInitialValue(1 if oi == pick else 0)
+
+        for c in model["prob"].constraints.values():
+            unknown = [(v, a) for v, a in c.items() if v.varValue is None]
+            if len(unknown) != 1 or c.sense != pulp.LpConstraintGE:
+                continue
+            v, coef = unknown[0]
+            rest = c.constant + sum(a * w.varValue for w, a in c.items()
+                                    if w is not v)
+            need = max(0.0, -rest / coef)
+            if v.cat == pulp.LpInteger:
+                need = math.ceil(need - 1e-9)
+            v.setInitialValue(need)
+        for v in model["prob"].variables():
+            if v.varValue is None:
+                v.setInitialValue(0)
+        model["hinted"] = True
+        return {"mapped_exact": exact, "mapped_nearest": nearest,
+                "unmapped": len(self._hint) - exact - nearest}
+
+    def _start_from_hint(self, model, force, tier):
+        # どの段でも案を初期解にする。初期解までの時間は最初の MILP でだけ測る
+        if self._hint is not None:
+            mapping = self._apply_hint(model)
+            if "incumbent" not in self.hint_report:
+                self.hint_report.update(mapping)
+                self.hint_report["hint_objective"] = round(
+                    pulp.value(self._weighted_objective(model)), 2)
+                fd, model["log_path"] = tempfile.mkstemp(
+                    prefix="rakushift_cbc_", suffix=".log")
+                os.close(fd)
+                self._measuring = model
+                if self.hint_benchmark:
+                    self.hint_report["baseline"] = self._baseline_incumbent(
+                        force, tier)
+                return True
+        return False
+
+    def _finish_measure(self):
+        model = self._measuring
+        self._measuring = None
+        self.hint_report["incumbent"] = _parse_cbc_log(model["log_path"])
+        os.remove(model["log_path"])
+        base = self.hint_report.get("baseline") or {}
+        hinted = self.hint_report["incumbent"]
+        if base.get("seconds") is not None and hinted.get("seconds") is not None:
+            self.hint_report["time_to_incumbent_saved"] = round(
+                base["seconds"] - hinted["seconds"], 3)
+        print("[Hint] {}".format(self.hint_report))
+
+    def _baseline_incumbent(self, force, tier):
+        # ヒントなしで同じモデルを組み、最初の整数解が出たところで止めて比べる
+        model = self._build_milp(force=force, tier=tier)
+        prob = model["prob"]
+        prob.setObjective(self._weighted_objective(model))
+        fd, path = tempfile.mkstemp(prefix="rakushift_cbc_", suffix=".log")
+        os.close(fd)
+        try:
+            self.cancel.solve(prob, pulp.PULP_CBC_CMD(
+                msg=0, timeLimit=self.cancel.time_limit(self.time_limit),
+                threads=self.solver_threads, logPath=path,
+                options=["maxSolutions 1"]))
+            return _parse_cbc_log(path)
+        finally:
+            os.remove(path)
+
+    def _extract_shifts(self, model):
+        x = model["x"]
+        staff_opts = model["staff_opts"]
+        shifts = []
+        warnings = []
+        for st in self.staff_table:
+            sid = st.id
+            for d in self.dates:
+                for oi, opt in enumerate(staff_opts.get((sid, d), [])):
+                    if (sid, d, oi) in x and pulp.value(x[(sid, d, oi)]) == 1:
+                        hrs = opt["hours"]
+                        brk = self._get_break_minutes(hrs)
+                        mh = st.max_hours
+                        entry = {
+                            "staff_id": sid,
+                            "date": d,
+                            "start_time": opt["start"],
+                            "end_time": opt["end"],
+                            "break_minutes": brk,
+                        }
+                        if hrs > mh:
+                            entry["overtime"] = True
+                            entry["overtime_hours"] = round(hrs - mh, 1)
+                            warnings.append("{} {}: {:.1f}h over".format(
+                                st.name, d, hrs - mh))
+                        shifts.append(entry)
 
-        except Exception as e:
-            print("[MILP Error] {}".format(e))
-            import traceback
-            traceback.print_exc()
-            return None
+        self._validate(shifts)
+        if warnings:
+            print("[OVERTIME]")
+            for w in warnings:
+                print("  " + w)
+        print("[Result] {} shifts".format(len(shifts)))
+        return shifts if shifts else None
 
     def _validate(self, shifts):
         violations = 0
+        shifts = list(shifts) + self.fixed_shifts
         for d in self.dates:
             reqs = self._build_slot_requirements(d)
             day_s = [s for s in shifts if s["date"] == d]
@@ -619,17 +1240,26 @@ class ShiftScheduler:
         else:
             print("  VALIDATION: {} violations".format(violations))
 
+    def _greedy_week(self, date_str):
+        _, week, year = self._date_facts(date_str)
+        return "{}-W{}".format(year, week[1])
+
     def _solve_greedy(self):
         shifts = []
         weekly_count = {}
+        for f in self.fixed_shifts:
+            wk = self._greedy_week(f["date"])
+            weekly_count.setdefault(f["staff_id"], {})
+            weekly_count[f["staff_id"]][wk] = (
+                weekly_count[f["staff_id"]].get(wk, 0) + 1)
         for d in sorted(self.dates):
+            self.cancel.check()
             if self._get_day_type(d) == "closed":
                 continue
-            slot_reqs = self._build_slot_requirements(d)
+            slot_reqs = self._open_slot_requirements(d)
             if not slot_reqs:
                 continue
-            dt = datetime.strptime(d, "%Y-%m-%d")
-            wk = "{}-W{}".format(dt.year, dt.isocalendar()[1])
+            wk = self._greedy_week(d)
             day_shifts = []
             assigned = set()
 
@@ -649,20 +1279,19 @@ class ShiftScheduler:
                 best_cov = 0
 
                 sorted_staff = sorted(
-                    self.staff_list,
-                    key=lambda s: (
-                        0 if s["id"] in self._mentor_ids else 1,
-                        {"A": 0, "B": 1, "C": 2, "D": 3}.get(
-                            self._eval_rank.get(s["id"], "B"), 2)
+                    self.staff_table,
+                    key=lambda st: (
+                        0 if st.mentor else 1,
+                        {"A": 0, "B": 1, "C": 2, "D": 3}.get(st.rank, 2)
                     ))
 
                 for s in sorted_staff:
-                    sid = s["id"]
+                    sid = s.id
                     if sid in assigned:
                         continue
-                    if d in self._get_staff_ng_dates(s):
+                    if d in s.ng:
                         continue
-                    md = int(s.get("max_days_week") or 5)
+                    md = s.max_days
                     if md <= 0:
                         md = 6
                     cur = weekly_count.get(sid, {}).get(wk, 0)
@@ -682,20 +1311,46 @@ class ShiftScheduler:
                 if best_s and best_o:
                     brk = self._get_break_minutes(best_o["hours"])
                     day_shifts.append({
-                        "staff_id": best_s["id"],
+                        "staff_id": best_s.id,
                         "date": d,
                         "start_time": best_o["start"],
                         "end_time": best_o["end"],
                         "break_minutes": brk,
                     })
-                    assigned.add(best_s["id"])
-                    weekly_count.setdefault(best_s["id"], {})
-                    weekly_count[best_s["id"]][wk] = (
-                        weekly_count[best_s["id"]].get(wk, 0) + 1)
+                    assigned.add(best_s.id)
+                    weekly_count.setdefault(best_s.id, {})
+                    weekly_count[best_s.id][wk] = (
+                        weekly_count[best_s.id].get(wk, 0) + 1)
                 else:
                     break
             shifts.extend(day_shifts)
 
+        self.solved_with = {"tier": 0, "force": True}
         print("[Greedy] {} shifts".format(len(shifts)))
         self._validate(shifts)
         return shifts if shifts else None
+
+
+_CBC_INCUMBENT = re.compile(
+    r"Integer solution of (\S+) found by .* \(([\d.]+) seconds\)")
+
+
+def _parse_cbc_log(path):
+    # 最初の整数解 (incumbent) が見つかった時刻と値、MIP start が使われたか
+    result = {"seconds": None, "objective": None, "mipstart_used": False}
+    try:
+        with open(path) as f:
+            for line in f:
+                if "MIPStart provided solution" in line:
+                    result["mipstart_used"] = True
+                m = _CBC_INCUMBENT.search(line)
+                if m and result["seconds"] is None:
+                    result["objective"] = float(m.group(1))
+                    result["seconds"] = float(m.group(2))
+                if line.startswith("Total time"):
+                    m = re.search(r"Wallclock seconds\):\s*([\d.]+)", line)
+                    if m:
+                        result["total_seconds"] = float(m.group(1))
+    except OSError:
+        pass
+    return result
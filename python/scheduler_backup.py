@@ -590,7 +590,8 @@ class ShiftScheduler:
                                 penalty += x[(s['id'], d, oi)] * overtime * 50000
 
             problem += penalty
-            solver = pulp.PULP_CBC_CMD(msg=0, timeLimit=120)
+            solver = pulp.PULP_CBC_CMD(
+                msg=0, timeLimit=float(self.config.get('solver_time_limit', 120)))
             problem.solve(solver)
 
             status = pulp.LpStatus[problem.status]
@@ -0,0 +1,231 @@
+from typing import Any, Dict, List, Optional
+
+from pydantic import (BaseModel, BeforeValidator, ConfigDict, Field,
+                      StringConstraints, with_config)
+from typing_extensions import Annotated, NotRequired, TypedDict
+
+# エンジンAPIのリクエストの型。
+#   - スタッフ・設定・シフト・申請の各行は TypedDict なので、検証後もエンジンが
+#     そのまま使える dict になる (モデルのインスタンスに包まない)
+#   - 型の変換 (数値の id -> 文字列, "5" -> 5, role の小文字化など) は pydantic-core が
+#     入口で一度だけ行う。JSON は model_validate_json でバイト列から直接読む
+#   - 知らない列 (email など) は落とさずに残す (extra="allow")
+#   - 値を省略した列はそのまま省略のままにする (既定値はエンジン側の既定を使う)
+# レスポンスのシフトも Shift と同じ形 (overtime / overtime_hours が付くことがある)
+
+_ROW = ConfigDict(extra="allow", coerce_numbers_to_str=True)
+
+
+def _blank_to_none(value):
+    # フォームから来る空文字は「未設定」として扱う
+    return None if value == "" else value
+
+
+def _split_dates(value):
+    # "2026-11-01, 2026-11-02" のようなカンマ区切りもリストに揃える
+    if isinstance(value, str):
+        return [d.strip() for d in value.split(",") if d.strip()]
+    return value
+
+
+DateStr = Annotated[str, StringConstraints(pattern=r"^\d{4}-\d{2}-\d{2}$")]
+TimeStr = Annotated[str, StringConstraints(
+    strip_whitespace=True, pattern=r"^\d{1,2}:\d{2}(:\d{2})?$")]
+Lower = Annotated[str, StringConstraints(strip_whitespace=True, to_lower=True)]
+Upper = Annotated[str, StringConstraints(strip_whitespace=True, to_upper=True)]
+# DB の null やフォームの空文字は未設定 (エンジンの既定: staff / B / hourly)
+OptLower = Annotated[Optional[Lower], BeforeValidator(_blank_to_none)]
+OptUpper = Annotated[Optional[Upper], BeforeValidator(_blank_to_none)]
+OptInt = Annotated[Optional[int], BeforeValidator(_blank_to_none)]
+OptFloat = Annotated[Optional[float], BeforeValidator(_blank_to_none)]
+DateList = Annotated[Optional[List[str]], BeforeValidator(_split_dates)]
+
+
+@with_config(_ROW)
+class Staff(TypedDict):
+    id: str
+    name: NotRequired[Optional[str]]
+    role: NotRequired[OptLower]
+    evaluation: NotRequired[OptUpper]
+    salary_type: NotRequired[OptLower]
+    hourly_wage: NotRequired[OptFloat]
+    monthly_salary: NotRequired[OptFloat]
+    max_days_week: NotRequired[OptInt]
+    max_hours_day: NotRequired[OptFloat]
+    unavailable_dates: NotRequired[DateList]
+    # 複数店舗 (/multi_store): 入れる店舗の id。なければ home_store だけ、
+    # どちらもなければ全店舗
+    stores: NotRequired[Optional[List[str]]]
+    home_store: NotRequired[Optional[str]]
+
+
+@with_config(_ROW)
+class Shift(TypedDict):
+    staff_id: str
+    date: DateStr
+    start_time: TimeStr
+    end_time: TimeStr
+    break_minutes: NotRequired[OptInt]
+
+
+@with_config(_ROW)
+class LeaveRequest(TypedDict):
+    staff_id: str
+    type: NotRequired[Optional[str]]
+    status: NotRequired[Optional[str]]
+    dates: NotRequired[Optional[str]]
+    start_time: NotRequired[Optional[str]]
+    end_time: NotRequired[Optional[str]]
+
+
+@with_config(_ROW)
+class Window(TypedDict):
+    start: NotRequired[TimeStr]
+    end: NotRequired[TimeStr]
+
+
+@with_config(_ROW)
+class Pattern(TypedDict):
+    start: NotRequired[TimeStr]
+    end: NotRequired[TimeStr]
+    name: NotRequired[Optional[str]]
+
+
+@with_config(_ROW)
+class StaffReq(TypedDict):
+    min_weekday: NotRequired[int]
+    min_weekend: NotRequired[int]
+    min_holiday: NotRequired[int]
+    min_manager: NotRequired[int]
+
+
+@with_config(_ROW)
+class TimeStaffReq(TypedDict):
+    days: NotRequired[List[int]]
+    start: NotRequired[TimeStr]
+    end: NotRequired[TimeStr]
+    count: NotRequired[int]
+
+
+@with_config(_ROW)
+class BreakRule(TypedDict):
+    min_hours: NotRequired[float]
+    break_minutes: NotRequired[int]
+
+
+@with_config(_ROW)
+class Config(TypedDict):
+    # 設定は DB の config 行そのままなので null の列もある。
+    # エンジンが null を扱えない列も、ここでは形だけ確かめる
+    opening_time: NotRequired[Optional[TimeStr]]
+    closing_time: NotRequired[Optional[TimeStr]]
+    opening_times: NotRequired[Optional[Dict[str, Window]]]
+    staff_req: NotRequired[Optional[StaffReq]]
+    time_staff_req: NotRequired[Optional[List[TimeStaffReq]]]
+    break_rules: NotRequired[Optional[List[BreakRule]]]
+    closed_days: NotRequired[Optional[List[int]]]
+    special_holidays: NotRequired[Optional[List[str]]]
+    special_days: NotRequired[Optional[Dict[str, Window]]]
+    custom_shifts: NotRequired[Optional[List[Pattern]]]
+    solver_time_limit: NotRequired[OptFloat]
+    # 必要人数のスロットの長さ (分) と、先に解く粗いスロットの長さ
+    slot_minutes: NotRequired[OptInt]
+    coarse_slot_minutes: NotRequired[OptInt]
+    hourly_wage_default: NotRequired[OptFloat]
+    flex_shifts: NotRequired[Optional[Dict[str, Any]]]
+
+
+@with_config(_ROW)
+class Store(TypedDict):
+    id: str
+    name: NotRequired[Optional[str]]
+    config: NotRequired[Config]
+    fixed_shifts: NotRequired[List[Shift]]
+
+
+class ShiftRequest(BaseModel):
+    # contract_id だけ送られた場合 (staff_list が空) はエンジンが DB から読み込む
+    staff_list: List[Staff] = []
+    config: Config = Field(default_factory=dict)
+    dates: List[DateStr] = []
+    # dates の代わりに期間で指定できる (YYYY-MM-DD, 両端を含む)
+    start_date: Optional[DateStr] = None
+    end_date: Optional[DateStr] = None
+    requests: List[LeaveRequest] = []
+    mode: str = "auto"
+    objective: str = "weighted"  # weighted / lexicographic
+    # 確定済みシフト(過去分・確定済みの未来分)。固定扱いで週上限や7連勤にも数える
+    fixed_shifts: List[Shift] = []
+    # この日付より前には新しいシフトを作らない (YYYY-MM-DD)
+    freeze_before: Optional[DateStr] = None
+    # テナント識別子 (未指定なら config の contract_id / organization_id)
+    contract_id: Optional[str] = None
+    # DB から読み込む・DB へ保存するときの店舗パスワード (contract_id と組で確認する)
+    shop_password: Optional[str] = None
+    # サーバー側の打ち切り期限 (秒)。未指定なら RAKUSHIFT_REQUEST_DEADLINE
+    deadline_seconds: Optional[float] = None
+    # solve() の後にルール監査・修復を行うか。未指定なら、Tier 3 の最適解で
+    # 不足がないとき以外 (時間切れ・緩和した段・不足あり) だけ行う
+    audit: Optional[bool] = None
+    # /audit で検査するシフト案
+    shifts: List[Shift] = []
+    # MILP の初期解に使う案。ai_hint=true ならエンジンが AI に案を作らせる
+    hint_shifts: List[Shift] = []
+    ai_hint: bool = False
+    # 生成結果をエンジンから shifts テーブルへ直接保存する (RAKUSHIFT_DATABASE_URL)。
+    # contract_id と shop_password が要る
+    persist: bool = False
+    organization_id: Optional[str] = None
+    # DB から読み込むとき、期間内の既存シフトを残して空き枠だけ埋める
+    keep_existing: bool = False
+    # 別解の数。最良解と alternatives_min_diff 件以上違い、目的関数が
+    # 最良値の alternatives_gap 以内のものを返す
+    alternatives: int = 0
+    alternatives_min_diff: Optional[int] = None
+    alternatives_gap: float = 0.05
+    # シフト作成エンジンの名前 (engines.py)。未指定なら RAKUSHIFT_ENGINE
+    engine: Optional[str] = None
+
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+
+    def tenant(self):
+        # キャッシュの名前分け用。本文の自己申告なので、ソルブ枠の割り当て
+        # (main._admission_key) には使わない
+        return str(self.contract_id or self.config.get("contract_id")
+                   or self.config.get("organization_id") or "anonymous")
+
+
+class ScenarioRequest(ShiftRequest):
+    # [{"name": "...", "deltas": [{"type": "add_staff", ...}, ...]}, ...]
+    scenarios: List[Dict[str, Any]] = []
+    # シナリオ1件あたりのソルバー時間 (秒)
+    budget_seconds: Optional[float] = None
+    # 差分なしの基準も解いて比較表の先頭に置く
+    include_base: bool = True
+
+
+class AnalyticsRequest(ShiftRequest):
+    # 「今日のシフト」パネル用の現在時刻 (YYYY-MM-DDTHH:MM, 店舗の現地時刻)
+    now: Optional[str] = None
+
+
+class MultiStoreRequest(BaseModel):
+    # 店舗ごとの設定・確定済みシフトと、店舗をまたいで共有するスタッフ
+    stores: List[Store] = []
+    staff_list: List[Staff] = []
+    dates: List[DateStr] = []
+    start_date: Optional[DateStr] = None
+    end_date: Optional[DateStr] = None
+    requests: List[LeaveRequest] = []
+    mode: str = "auto"
+    freeze_before: Optional[DateStr] = None
+    contract_id: Optional[str] = None
+    # ソルブ枠をテナント単位で数えるときの確認用 (なければ接続元の IP 単位)
+    shop_password: Optional[str] = None
+    deadline_seconds: Optional[float] = None
+    # 店舗1件あたりのソルバー時間 (秒)
+    budget_seconds: Optional[float] = None
+    # 店舗間の調整 (解き直し) の最大ラウンド数
+    max_rounds: Optional[int] = None
+
+    model_config = ConfigDict(coerce_numbers_to_str=True)
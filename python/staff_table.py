@@ -0,0 +1,96 @@
+# スタッフ表と勤務時間帯の選択肢カタログ
+#   - StaffRecord: staff_list の dict を一度だけ読み、数値・区分に変換した行
+#     (ループ内で s.get(...) と int()/float()/str() を繰り返さない)
+#   - OptionCatalog: 勤務時間帯の選択肢は「その日の営業時間」だけで決まるので、
+#     (開店, 閉店) ごとに一度だけ作って全スタッフで共有する。
+#     共有するので返した選択肢(tuple の中の dict)は書き換えないこと
+
+
+class StaffRecord:
+    __slots__ = ("index", "id", "name", "role", "rank", "hourly", "wage",
+                 "max_hours", "max_days", "ng", "mentor", "rookie",
+                 "manager", "monthly", "raw")
+
+    def __init__(self, index, staff, ng_dates):
+        self.index = index
+        self.id = staff["id"]
+        self.name = staff.get("name", "")
+        # null (DB の空欄) も省略と同じく既定値にする
+        self.role = str(staff.get("role") or "staff").lower()
+        self.rank = str(staff.get("evaluation") or "B").upper()
+        salary = str(staff.get("salary_type") or "hourly").lower()
+        self.hourly = salary == "hourly"
+        self.monthly = salary == "monthly"
+        wage = staff.get("hourly_wage", 1100)
+        self.wage = float(1100 if wage is None else wage)
+        self.max_hours = float(staff.get("max_hours_day") or 8)
+        self.max_days = int(staff.get("max_days_week") or 5)
+        self.ng = ng_dates
+        self.mentor = self.rookie = self.manager = False
+        self.raw = staff
+
+
+def ng_dates_by_staff(staff_list, requests):
+    # NG 日 = unavailable_dates (リストかカンマ区切り) + 承認済みの休み申請
+    approved = {}
+    for req in requests:
+        if (req.get("type") in ("off", "holiday")
+                and req.get("status") == "approved"):
+            rd = str(req.get("dates", ""))
+            if rd:
+                approved.setdefault(req.get("staff_id"), []).append(rd)
+    result = {}
+    for s in staff_list:
+        raw = s.get("unavailable_dates")
+        ng = []
+        if raw:
+            if isinstance(raw, list):
+                ng = [str(d).strip() for d in raw]
+            else:
+                ng = [str(d).strip() for d in str(raw).split(",")]
+        ng.extend(approved.get(s["id"], ()))
+        result[s["id"]] = frozenset(ng)
+    return result
+
+
+class OptionCatalog:
+
+    def __init__(self, patterns, from_minutes, to_minutes):
+        self._from_minutes = from_minutes
+        # パターンの時刻は一度だけ分に直しておく
+        self._patterns = [(to_minutes(p["start"]), to_minutes(p["end"]))
+                          for p in patterns]
+        self._by_window = {}
+
+    def options(self, open_min, close_min):
+        key = (open_min, close_min)
+        opts = self._by_window.get(key)
+        if opts is None:
+            opts = self._by_window[key] = self._build(open_min, close_min)
+        return opts
+
+    def _build(self, open_min, close_min):
+        if open_min >= close_min:
+            return ()
+        options = []
+        seen = set()
+        for start, end in self._patterns:
+            ps = max(start, open_min)
+            pe = min(end, close_min)
+            if ps >= pe:
+                continue
+            hrs = (pe - ps) / 60.0
+            if hrs < 1:
+                continue
+            if (ps, pe) in seen:
+                continue
+            seen.add((ps, pe))
+            options.append({
+                "start": self._from_minutes(ps),
+                "end": self._from_minutes(pe),
+                "start_min": ps, "end_min": pe, "hours": hrs,
+            })
+        return tuple(options)
+
+    def __len__(self):
+        return len(self._by_window)
@@ -0,0 +1,304 @@
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+import db
+
+# contract_id だけのリクエストのために、エンジンが staff / config / 承認済み requests を
+# DB から読み込んでテナントごとにキャッシュする。
+#   - config.data_version (staff / config / requests の変更でトリガーが +1) で鮮度を確認
+#   - 同じトリガーが NOTIFY rakushift_tenant, '<contract_id>' を送るので、
+#     LISTEN スレッドが動いている間は版の確認クエリも省く
+#   RAKUSHIFT_TENANT_LISTEN=0   LISTEN スレッドを起動しない
+#   RAKUSHIFT_TENANT_CACHE_MAX  キャッシュするテナント数 (既定 64)
+# 読み込みには contract_id と店舗パスワード (config.shop_password) の両方が要る。
+# パスワードは config に残さず、照合用のダイジェストだけをエントリに持つ
+
+NOTIFY_CHANNEL = "rakushift_tenant"
+CACHE_MAX = int(os.environ.get("RAKUSHIFT_TENANT_CACHE_MAX", "64"))
+RESULT_CACHE_MAX = 256
+# 確定済みシフトの文脈として読む開始日前の日数 (7連勤の判定用)
+CONTEXT_DAYS = 6
+
+# エンジンに渡さない列 (認証・課金・外部 API のキー)
+_SECRET_COLUMNS = ("shop_password", "admin_password", "stripe_customer_id",
+                   "stripe_subscription_id", "openai_api_key", "gemini_api_key")
+# api_key() で読んでよい列
+_KEY_COLUMNS = ("gemini_api_key", "openai_api_key")
+
+_STAFF_COLUMNS = ("id", "name", "role", "evaluation", "salary_type",
+                  "hourly_wage", "monthly_salary", "max_days_week",
+                  "max_hours_day", "unavailable_dates")
+
+
+class TenantNotFound(Exception):
+    pass
+
+
+class Unauthorized(Exception):
+    # 存在しない contract_id とパスワード違いは区別しない
+    def __init__(self):
+        super().__init__("invalid contract_id or shop_password")
+
+
+class TenantStore:
+
+    def __init__(self, max_entries=CACHE_MAX):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self._listener = None
+        self.listening = False
+        self.stats = {"hits": 0, "misses": 0, "version_checks": 0,
+                      "invalidations": 0, "result_hits": 0,
+                      "auth_failures": 0}
+
+    # ---------- テナントのスナップショット ----------
+
+    def snapshot(self, contract_id, password):
+        # {"version", "organization_id", "config", "staff_list", "requests"}
+        # password が店舗パスワードと合わなければ Unauthorized
+        if not db.enabled():
+            raise RuntimeError(
+                "contract_id only requests need RAKUSHIFT_DATABASE_URL")
+        if not contract_id or not password:
+            raise Unauthorized()
+        with self._lock:
+            entry = self._entries.get(contract_id)
+        if entry is not None and not _matches(entry, password):
+            # パスワードが変わった直後かもしれないので DB で確かめ直す
+            entry = None
+        if entry is not None and not self.listening:
+            # NOTIFY を受けられないときは版の列で確認する (1行の索引検索)
+            self.stats["version_checks"] += 1
+            if self._current_version(contract_id) != entry["version"]:
+                entry = None
+        if entry is not None:
+            self.stats["hits"] += 1
+            with self._lock:
+                self._entries.move_to_end(contract_id)
+            return entry
+
+        self.stats["misses"] += 1
+        entry = self._load(contract_id, password)
+        with self._lock:
+            self._entries[contract_id] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, contract_id=None):
+        with self._lock:
+            if contract_id is None:
+                self._entries.clear()
+                self._results.clear()
+            else:
+                self._entries.pop(contract_id, None)
+                for key in [k for k in self._results if k[0] == contract_id]:
+                    del self._results[key]
+        self.stats["invalidations"] += 1
+
+    def cached_result(self, key, compute):
+        # 同じ版・同じ入力の /check は計算し直さない (key[0] は contract_id)
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                self.stats["result_hits"] += 1
+                return self._results[key]
+        result = compute()
+        with self._lock:
+            self._results[key] = result
+            while len(self._results) > RESULT_CACHE_MAX:
+                self._results.popitem(last=False)
+        return result
+
+    def metrics(self):
+        with self._lock:
+            tenants = len(self._entries)
+        return {"tenants": tenants, "listening": self.listening, **self.stats}
+
+    def api_key(self, contract_id, password, column="gemini_api_key"):
+        # 外部 API のキーはキャッシュに載せず、使うときだけ読む
+        if column not in _KEY_COLUMNS:
+            raise ValueError("not an api key column: {}".format(column))
+        self.snapshot(contract_id, password)
+        with db.get_pool().connection() as conn:
+            row = conn.execute(
+                "SELECT {} FROM config WHERE contract_id = %s".format(column),
+                (contract_id,)).fetchone()
+        return row[0] if row else None
+
+    def _current_version(self, contract_id):
+        with db.get_pool().connection() as conn:
+            row = conn.execute(
+                "SELECT data_version FROM config WHERE contract_id = %s",
+                (contract_id,)).fetchone()
+        if row is None:
+            raise TenantNotFound("unknown contract_id: {}".format(contract_id))
+        return row[0]
+
+    def _load(self, contract_id, password):
+        started = time.perf_counter()
+        from psycopg.rows import dict_row
+        with db.get_pool().connection() as conn:
+            with conn.cursor(row_factory=dict_row) as cur:
+                cur.execute("SELECT * FROM config WHERE contract_id = %s",
+                            (contract_id,))
+                config = cur.fetchone()
+                # パスワードを確かめてからスタッフ・申請を読む
+                credential = _digest((config or {}).get("shop_password"))
+                if config is None or not _matches(
+                        {"credential": credential}, password):
+                    self.stats["auth_failures"] += 1
+                    raise Unauthorized()
+                cur.execute(
+                    "SELECT {} FROM staff WHERE contract_id = %s"
+                    " ORDER BY name, id".format(", ".join(_STAFF_COLUMNS)),
+                    (contract_id,))
+                staff = cur.fetchall()
+                cur.execute(
+                    "SELECT staff_id, type, dates, start_time, end_time, status"
+                    " FROM requests"
+                    " WHERE organization_id = %s AND status = 'approved'",
+                    (config["organization_id"],))
+                requests = cur.fetchall()
+
+        config = _plain(config)
+        for col in _SECRET_COLUMNS:
+            config.pop(col, None)
+        entry = {
+            "version": config.pop("data_version", None),
+            "credential": credential,
+            "organization_id": config.get("organization_id"),
+            "config": config,
+            "staff_list": [_compile_staff(_plain(s)) for s in staff],
+            "requests": [_plain(r) for r in requests],
+            "loaded_at": time.time(),
+        }
+        print("[Tenant] loaded {} v{} ({} staff, {} requests, {:.1f}ms)".format(
+            contract_id, entry["version"], len(entry["staff_list"]),
+            len(entry["requests"]), (time.perf_counter() - started) * 1000))
+        return entry
+
+    # ---------- 確定済みシフト ----------
+
+    def fixed_shifts(self, organization_id, dates, freeze_before,
+                     keep_existing=False):
+        # クライアントの runAutoFill と同じ範囲を固定扱いにする
+        #   開始日前 CONTEXT_DAYS 日分 / 期間内で freeze_before より前 /
+        #   keep_existing (空き枠のみ) なら期間内の既存分すべて
+        first, last = min(dates), max(dates)
+        context = (datetime.strptime(first, "%Y-%m-%d")
+                   - timedelta(days=CONTEXT_DAYS)).strftime("%Y-%m-%d")
+        with db.get_pool().connection() as conn:
+            rows = conn.execute(
+                "SELECT staff_id::text, date, start_time, end_time,"
+                "       COALESCE(break_minutes, 0)"
+                " FROM shifts"
+                " WHERE organization_id = %s AND date BETWEEN %s AND %s",
+                (organization_id, context, last)).fetchall()
+        fixed = []
+        for sid, d, st, en, brk in rows:
+            if d >= first and not (keep_existing or d < freeze_before):
+                continue
+            fixed.append({"staff_id": sid, "date": d, "start_time": st,
+                          "end_time": en, "break_minutes": brk})
+        fixed.sort(key=lambda s: (s["date"], s["staff_id"]))
+        return fixed
+
+    def shifts_between(self, organization_id, first, last):
+        # 集計用に期間内のシフトをそのまま読む (break_minutes が NULL なら None のまま)
+        with db.get_pool().connection() as conn:
+            rows = conn.execute(
+                "SELECT staff_id::text, date, start_time, end_time, break_minutes"
+                " FROM shifts"
+                " WHERE organization_id = %s AND date BETWEEN %s AND %s",
+                (organization_id, first, last)).fetchall()
+        return [{"staff_id": sid, "date": d, "start_time": st,
+                 "end_time": en, "break_minutes": brk}
+                for sid, d, st, en, brk in rows]
+
+    # ---------- 変更通知 ----------
+
+    def start_listener(self):
+        if self._listener is not None or not db.enabled():
+            return
+        self._listener = threading.Thread(target=self._listen, daemon=True,
+                                          name="tenant-listener")
+        self._listener.start()
+
+    def _listen(self):
+        # プールとは別の専用接続で LISTEN する。切れたら全消しして再接続
+        import psycopg
+        while True:
+            try:
+                with psycopg.connect(db.database_url(), autocommit=True,
+                                     prepare_threshold=None) as conn:
+                    conn.execute("LISTEN {}".format(NOTIFY_CHANNEL))
+                    # 接続前に起きた変更は取りこぼしているので捨てる
+                    self.invalidate()
+                    self.listening = True
+                    print("[Tenant] listening on {}".format(NOTIFY_CHANNEL))
+                    for note in conn.notifies():
+                        self.invalidate(note.payload or None)
+            except Exception as e:
+                print("[Tenant] listener error: {}".format(e))
+            self.listening = False
+            time.sleep(5)
+
+
+def _digest(password):
+    if not password:
+        return None
+    return hashlib.sha256(str(password).encode("utf-8")).hexdigest()
+
+
+def _matches(entry, password):
+    expected = entry.get("credential")
+    given = _digest(password)
+    return bool(expected and given) and hmac.compare_digest(expected, given)
+
+
+def _plain(row):
+    # UUID などを JSON にそのまま載る値へ
+    out = {}
+    for k, v in row.items():
+        if v is None or isinstance(v, (str, int, float, bool, list, dict)):
+            out[k] = v
+        elif isinstance(v, date):
+            out[k] = v.isoformat()
+        else:
+            out[k] = str(v)
+    return out
+
+
+def _compile_staff(staff):
+    # カンマ区切りの NG 日を毎回分割しなくて済むようにリストにしておく
+    raw = staff.get("unavailable_dates")
+    if raw and not isinstance(raw, list):
+        staff["unavailable_dates"] = [d.strip() for d in str(raw).split(",")
+                                      if d.strip()]
+    return staff
+
+
+def date_range(start_date, end_date):
+    start = datetime.strptime(start_date, "%Y-%m-%d")
+    end = datetime.strptime(end_date, "%Y-%m-%d")
+    if end < start:
+        raise ValueError("end_date is before start_date")
+    return [(start + timedelta(days=i)).strftime("%Y-%m-%d")
+            for i in range((end - start).days + 1)]
+
+
+def fingerprint(*parts):
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+store = TenantStore()
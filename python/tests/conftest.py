@@ -0,0 +1,27 @@
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+# サーバーと同じく python/ 直下のモジュールをそのまま import する
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class _Manager:
+    # プロセスをまたがないテスト用 (Event は threading のもので足りる)
+    Event = threading.Event
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    # scenarios のプロセスプールをスレッドに置き換える (spawn の起動を待たない)
+    import scenarios
+    executor = ThreadPoolExecutor(max_workers=4)
+    monkeypatch.setattr(scenarios, "_pool", executor)
+    monkeypatch.setattr(scenarios, "_manager", _Manager())
+    monkeypatch.setattr(scenarios, "workers", lambda: 4)
+    monkeypatch.setattr(scenarios, "BORROW_POLL_SECONDS", 0.05)
+    yield executor
+    executor.shutdown(wait=True)
@@ -0,0 +1,79 @@
+import contextlib
+
+# db.get_pool() の代わり。実行した SQL を記録し、結果は answer(sql, params) で決める
+
+
+class FakeCursor:
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = 0
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.conn.log.append((" ".join(sql.split()), params))
+        rows = self.conn.answer(sql, params)
+        self._rows = list(rows or [])
+        self.rowcount = len(self._rows)
+        if "DELETE" in sql:
+            self.rowcount = self.conn.deleted
+        return self
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return self._rows
+
+    @contextlib.contextmanager
+    def copy(self, sql):
+        self.conn.log.append((" ".join(sql.split()), None))
+        yield self
+
+    def write_row(self, row):
+        self.conn.copied.append(row)
+
+
+class FakeConn:
+
+    def __init__(self, answer=None, deleted=0):
+        self.answer = answer or (lambda sql, params: [])
+        self.deleted = deleted
+        self.log = []
+        self.copied = []
+        self.committed = False
+        self.rolled_back = False
+
+    def cursor(self, row_factory=None):
+        return FakeCursor(self)
+
+    def execute(self, sql, params=None):
+        return self.cursor().execute(sql, params)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        try:
+            yield
+        except BaseException:
+            self.rolled_back = True
+            raise
+        self.committed = True
+
+    def statements(self):
+        return [sql for sql, _ in self.log]
+
+
+class FakePool:
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    @contextlib.contextmanager
+    def connection(self):
+        yield self.conn
@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import db
+import main
+import tenants
+from admission import AdmissionController
+from cancel import CancelToken, Cancelled
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = tenants.TenantStore()
+    store.listening = True
+    store._entries["c1"] = {"version": 1, "organization_id": "org-1",
+                            "credential": tenants._digest("open-sesame"),
+                            "config": {}, "staff_list": [], "requests": []}
+
+    def load(contract_id, password):
+        # DB に問い合わせても合わなかった場合
+        raise tenants.Unauthorized()
+
+    monkeypatch.setattr(store, "_load", load)
+    monkeypatch.setattr(db, "enabled", lambda: True)
+    monkeypatch.setattr(tenants, "store", store)
+    return store
+
+
+def test_busy_tenant_and_full_queue_are_rejected_over_http(monkeypatch, store):
+    admission = AdmissionController(max_solvers=1, per_tenant=1, max_queue=1)
+    monkeypatch.setattr(main, "admission", admission)
+    admission._take("ip:testclient")              # この接続元は1件実行中
+    admission.waiting["tenant:c2"] = [object()]   # 1件待ちで列が満杯
+    client = TestClient(main.app)
+
+    # 本文のテナント名を変えても、確かめられない限り接続元で数える
+    for body in ({}, {"config": {"organization_id": "org-z"}},
+                 {"contract_id": "c9"}):
+        res = client.post("/generate", json=body)
+        assert res.status_code == 429
+        assert int(res.headers["Retry-After"]) >= 1
+
+    # パスワードを確かめたテナントは自分の枠で数える
+    res = client.post("/generate", json={"contract_id": "c1",
+                                         "shop_password": "open-sesame"})
+    assert res.status_code == 503
+    assert res.json()["retry_after"] == int(res.headers["Retry-After"])
+    assert admission.counters["rejected_tenant_quota"] == 3
+    assert admission.counters["rejected_queue_full"] == 1
+
+    # パスワード違いは枠を取る前に断る
+    for path in ("/generate", "/scenarios", "/multi_store"):
+        res = client.post(path, json={"contract_id": "c1",
+                                      "shop_password": "guess"})
+        assert res.status_code == 401, path
+
+
+def test_waiting_tenants_take_turns():
+    admission = AdmissionController(max_solvers=1, per_tenant=3, max_queue=8)
+    order = []
+
+    async def solve(tenant, hold):
+        async with admission.solve_slot(tenant):
+            order.append(tenant)
+            await hold.wait()
+
+    async def main_():
+        hold = asyncio.Event()
+        first = asyncio.create_task(solve("big", hold))
+        await asyncio.sleep(0)
+        tasks = [asyncio.create_task(solve(t, hold))
+                 for t in ("big", "big", "small")]
+        await asyncio.sleep(0)
+        assert admission.queue_depth() == 3
+        hold.set()
+        await asyncio.gather(first, *tasks)
+
+    asyncio.run(main_())
+    # 大口テナントが続けて枠を取らず、小口テナントが2番目に入る
+    assert order == ["big", "big", "small", "big"]
+    assert admission.running == 0
+
+
+def test_cancel_while_queued_leaves_the_queue():
+    admission = AdmissionController(max_solvers=1, per_tenant=2, max_queue=8)
+    admission._take("t1")
+    token = CancelToken()
+
+    async def main_():
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.05, token.cancel, "disconnect")
+        async with admission.solve_slot("t2", token):
+            pass
+
+    with pytest.raises(Cancelled):
+        asyncio.run(main_())
+    assert admission.queue_depth() == 0 and admission.running == 1
+    assert admission.counters["cancelled_in_queue"] == 1
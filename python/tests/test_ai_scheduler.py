@@ -0,0 +1,104 @@
+import json
+import urllib.request
+from collections import OrderedDict
+
+import pytest
+
+import ai_scheduler
+import ai_stub_server
+from ai_scheduler import AIShiftScheduler
+
+DATES = ["2026-11-02", "2026-11-03", "2026-11-04", "2026-11-05"]
+
+
+def test_draft_ng_dates_match_the_engine():
+    staff = [{"id": "s0"}, {"id": "s1", "unavailable_dates": "2026-11-04"}]
+    requests = [
+        {"staff_id": "s0", "type": "off", "status": "approved", "dates": DATES[0]},
+        {"staff_id": "s0", "type": "holiday", "status": "approved", "dates": DATES[1]},
+        {"staff_id": "s0", "type": "off", "status": "pending", "dates": DATES[2]},
+        {"staff_id": "s1", "type": "work", "status": "approved", "dates": DATES[3]},
+    ]
+    draft = [{"staff_id": sid, "date": d, "start_time": "09:00", "end_time": "15:00"}
+             for sid in ("s0", "s1") for d in DATES]
+    ai = AIShiftScheduler("dummy", base_url="http://127.0.0.1:1")
+    shifts, dropped = ai._validate(draft, staff, {}, DATES, requests)
+    kept = {(s["staff_id"], s["date"]) for s in shifts}
+    # 承認済みの off/holiday と unavailable_dates は落とし、未承認の申請は NG にしない
+    assert kept == {("s0", DATES[2]), ("s0", DATES[3]),
+                    ("s1", DATES[0]), ("s1", DATES[1]), ("s1", DATES[3])}
+    assert dropped["off_request"] == 3
+
+
+# ---------- スタブサーバーを相手にした呼び出し ----------
+
+# 11/2 (月) から3週間 = ISO 週で3つのチャンク
+WEEKS = ["2026-11-{:02d}".format(d) for d in range(2, 23)]
+STAFF = [{"id": "s{}".format(i), "max_days_week": 5} for i in range(4)]
+CONFIG = {"staff_req": {"min_weekday": 2, "min_weekend": 2, "min_manager": 0}}
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    # スタブサーバーを起動して URL を返す関数。メモリのキャッシュと STATS は空から
+    monkeypatch.setattr(ai_scheduler, "_CACHE", OrderedDict())
+    monkeypatch.setattr(ai_stub_server, "STATS", {
+        "requests": 0, "failures": 0, "in_flight": 0, "max_in_flight": 0})
+    servers = []
+
+    def start(delay=0.0, fail_rate=0.0):
+        server, url = ai_stub_server.serve(delay=delay, fail_rate=fail_rate)
+        servers.append(server)
+        return url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _stats(url):
+    with urllib.request.urlopen(url + "/stats", timeout=5) as res:
+        return json.loads(res.read())
+
+
+def test_weeks_are_requested_concurrently(stub):
+    url = stub(delay=0.3)
+    ai = AIShiftScheduler("dummy", base_url=url, concurrency=3)
+    shifts = ai.generate(STAFF, CONFIG, WEEKS, [], chunked=True)
+    stats = _stats(url)
+    assert ai.last_report["chunks"] == 3 and ai.last_report["failed_weeks"] == []
+    assert stats["requests"] == 3 and stats["max_in_flight"] > 1
+    assert {s["date"] for s in shifts} == set(WEEKS)
+
+
+def test_repeat_calls_hit_the_prompt_cache(stub, tmp_path):
+    url = stub()
+    first = AIShiftScheduler("dummy", base_url=url, cache_dir=str(tmp_path))
+    shifts = first.generate(STAFF, CONFIG, WEEKS, [], chunked=True)
+    assert _stats(url)["requests"] == 3 and len(list(tmp_path.iterdir())) == 3
+
+    # 同じプロセス: メモリのキャッシュから返り、HTTP は飛ばない
+    again = AIShiftScheduler("dummy", base_url=url, cache_dir=str(tmp_path))
+    assert again.generate(STAFF, CONFIG, WEEKS, [], chunked=True) == shifts
+    assert again.stats == {"calls": 0, "cache_hits": 3, "retries": 0}
+
+    # 再起動後 (メモリが空): ディスクのキャッシュから返る
+    ai_scheduler._CACHE.clear()
+    restarted = AIShiftScheduler("dummy", base_url=url, cache_dir=str(tmp_path))
+    assert restarted.generate(STAFF, CONFIG, WEEKS, [], chunked=True) == shifts
+    assert restarted.stats["cache_hits"] == 3
+    assert _stats(url)["requests"] == 3
+
+
+def test_failed_chunk_is_retried(stub, monkeypatch):
+    url = stub(fail_rate=0.5)
+    # 最初のリクエストだけ失敗させる
+    draws = iter([0.0])
+    monkeypatch.setattr(ai_stub_server.random, "random", lambda: next(draws, 1.0))
+    ai = AIShiftScheduler("dummy", base_url=url, retries=2)
+    shifts = ai.generate(STAFF, CONFIG, WEEKS[:7], [], chunked=True)
+    stats = _stats(url)
+    assert (stats["requests"], stats["failures"]) == (2, 1)
+    assert ai.stats["retries"] == 1 and ai.last_report["failed_weeks"] == []
+    assert {s["date"] for s in shifts} == set(WEEKS[:7])
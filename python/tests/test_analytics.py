@@ -0,0 +1,49 @@
+from fastapi.testclient import TestClient
+
+import analytics
+import main
+
+STAFF = [{"id": "a", "hourly_wage": 1000, "max_hours_day": 8},
+         {"id": "b", "salary_type": "monthly", "monthly_salary": 300000}]
+CONFIG = {"opening_time": "09:00", "closing_time": "17:00",
+          "staff_req": {"min_weekday": 2, "min_weekend": 2, "min_holiday": 2}}
+# 11/3 は文化の日 (祝日割増 1.25倍)
+SHIFTS = [
+    {"staff_id": "a", "date": "2026-11-02", "start_time": "09:00",
+     "end_time": "18:00", "break_minutes": 60},
+    {"staff_id": "b", "date": "2026-11-02", "start_time": "09:00",
+     "end_time": "17:00", "break_minutes": 60},
+    {"staff_id": "a", "date": "2026-11-03", "start_time": "09:00",
+     "end_time": "13:00", "break_minutes": 0},
+]
+
+
+def test_cost_hours_coverage_and_overtime():
+    result = analytics.compute(STAFF, CONFIG, SHIFTS, "2026-11-02", "2026-11-03")
+    assert result["holiday_premium"] is True
+    day1, day2 = result["daily"]
+    assert (day1["hourly_cost"], day1["staff_hours"], day1["overtime_hours"]) == (
+        8000, 15.0, 1.0)
+    assert (day2["hourly_cost"], day2["staff_hours"]) == (5000, 4.0)
+    # 09:00-17:00 に2人ずつ必要: 1日目は満たし、2日目は 4h x 1人 だけ
+    assert (day1["coverage_ratio"], day2["coverage_ratio"]) == (1.0, 0.25)
+    total = result["total"]
+    assert total["hourly_cost"] == 13000 and total["coverage_ratio"] == 0.625
+    assert total["labor_cost"] == 13000 + 300000
+    assert [w["label"] for w in result["weekly"]] == ["2026-W45"]
+
+
+def test_endpoint_caches_by_input(monkeypatch):
+    monkeypatch.setattr(analytics, "cache", analytics.AnalyticsCache())
+    body = {"staff_list": STAFF, "config": CONFIG, "shifts": SHIFTS,
+            "start_date": "2026-11-02", "end_date": "2026-11-03",
+            "now": "2026-11-03T10:30"}
+    client = TestClient(main.app)
+    first = client.post("/analytics", json=body).json()
+    second = client.post("/analytics", json=body).json()
+    assert first["status"] == "success" and first["cached"] is False
+    assert second["cached"] is True and second["analytics"] == first["analytics"]
+    assert first["today"]["working"] == 1 and first["today"]["total"] == 1
+
+    body["shifts"] = SHIFTS[:2]
+    assert client.post("/analytics", json=body).json()["cached"] is False
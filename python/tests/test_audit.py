@@ -0,0 +1,55 @@
+import contextlib
+import io
+
+from fastapi.testclient import TestClient
+
+import main
+from audit import audit_and_repair
+from scheduler import ShiftScheduler
+
+DATES = ["2026-11-02", "2026-11-03"]
+CONFIG = {"opening_time": "09:00", "closing_time": "17:00",
+          "custom_shifts": [{"start": "09:00", "end": "17:00"}],
+          "staff_req": {"min_weekday": 2, "min_manager": 1},
+          "solver_time_limit": 10}
+
+
+def _staff():
+    return [{"id": "m1", "role": "manager", "unavailable_dates": [DATES[1]]},
+            {"id": "s1", "role": "staff"}, {"id": "s2", "role": "staff"}]
+
+
+def test_manager_gap_without_any_manager_is_infeasible_not_a_violation():
+    with contextlib.redirect_stdout(io.StringIO()):
+        sch = ShiftScheduler(_staff(), dict(CONFIG), DATES, [])
+        shifts = sch.solve()
+        summary = sch.solution_summary()
+        _, report = audit_and_repair(sch, shifts)
+    # MILP も監査も、店長が入れない 11/3 の責任者不足は数えない
+    assert summary["manager_shortage_hours"] == 0
+    assert "manager" not in report["violations_before"]
+    assert "manager" not in report["violations_after"]
+    assert report["infeasible"] == [{"rule": "manager", "date": DATES[1],
+                                     "start": "09:00", "end": "17:00",
+                                     "shortage": 1}]
+    assert report["diff"] == []
+
+
+def _generate(**extra):
+    body = dict({"staff_list": _staff(), "config": CONFIG, "dates": DATES}, **extra)
+    return TestClient(main.app).post("/generate", json=body).json()
+
+
+def test_audit_is_skipped_for_proven_optimal_solutions():
+    res = _generate()
+    assert res["status"] == "success" and res["summary"]["coverage_shortage_hours"] == 0
+    assert "audit" not in res
+    assert "audit" in _generate(audit=True)
+
+
+def test_audit_runs_when_the_solver_left_a_shortage():
+    staff = _staff()[:2]
+    res = _generate(staff_list=staff)
+    assert res["summary"]["coverage_shortage_hours"] > 0
+    assert "audit" in res
+    assert "audit" not in _generate(staff_list=staff, audit=False)
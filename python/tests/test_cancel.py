@@ -0,0 +1,82 @@
+import asyncio
+import contextlib
+import io
+import random
+import threading
+import time
+
+import main
+from cancel import CancelToken, Cancelled
+from scheduler import _load_pulp
+
+
+def _hard_problem(seed=1, m=4, n=36):
+    # market split: CBC は時間上限まで粘るので、打ち切りの確認に使える。
+    # _load_pulp が CBC の起動をトークンに登録するよう差し替える
+    pulp = _load_pulp()
+    rnd = random.Random(seed)
+    prob = pulp.LpProblem("market_split", pulp.LpMinimize)
+    x = [pulp.LpVariable("x{}".format(j), cat="Binary") for j in range(n)]
+    over = [pulp.LpVariable("o{}".format(i), lowBound=0) for i in range(m)]
+    under = [pulp.LpVariable("u{}".format(i), lowBound=0) for i in range(m)]
+    prob += pulp.lpSum(over) + pulp.lpSum(under)
+    for i in range(m):
+        a = [rnd.randint(0, 99) for _ in range(n)]
+        prob += (pulp.lpSum(a[j] * x[j] for j in range(n)) + over[i] - under[i]
+                 == sum(a) // 2)
+    return prob, pulp.PULP_CBC_CMD(msg=0, timeLimit=60)
+
+
+def _solve_in_thread(token):
+    prob, solver = _hard_problem()
+    outcome = {}
+
+    def run():
+        try:
+            token.solve(prob, solver)
+        except Cancelled as e:
+            outcome["reason"] = e.reason
+        outcome["procs"] = list(token._procs)
+
+    worker = threading.Thread(target=run, daemon=True)
+    worker.start()
+    return worker, outcome
+
+
+def _wait_for_cbc(token, timeout=10):
+    deadline = time.perf_counter() + timeout
+    while not token._procs and time.perf_counter() < deadline:
+        time.sleep(0.02)
+    assert token._procs, "CBC did not start"
+    return next(iter(token._procs))
+
+
+def test_cancel_kills_the_running_cbc_process():
+    token = CancelToken()
+    worker, outcome = _solve_in_thread(token)
+    proc = _wait_for_cbc(token)
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        token.cancel("disconnect")
+    worker.join(5)
+    assert not worker.is_alive() and time.perf_counter() - started < 5
+    assert proc.poll() is not None
+    assert outcome == {"reason": "disconnect", "procs": []}
+
+
+def test_watcher_stops_the_solve_at_the_deadline(monkeypatch):
+    monkeypatch.setattr(main, "DISCONNECT_POLL_SECONDS", 0.05)
+
+    class Request:
+        async def is_disconnected(self):
+            return False
+
+    token = CancelToken(1.0)
+    worker, outcome = _solve_in_thread(token)
+    proc = _wait_for_cbc(token)
+    with contextlib.redirect_stdout(io.StringIO()):
+        asyncio.run(asyncio.wait_for(main._watch(Request(), token), 5))
+    worker.join(5)
+    assert outcome["reason"] == "deadline"
+    assert proc.poll() is not None and token.elapsed() < 5
+
@@ -0,0 +1,56 @@
+import gzip
+import json
+
+import capture
+
+
+def _body():
+    return {
+        "staff_list": [{"id": "s1", "name": "山田", "email": "a@example.com",
+                        "role": "staff", "hourly_wage": 1200}],
+        "config": {"opening_time": "09:00", "staff_req": {"min_weekday": 2},
+                   "contract_id": "demo", "organization_id": "org-1",
+                   "shop_password": "pw", "admin_password": "1234",
+                   "gemini_api_key": "AIzaSECRET", "openai_api_key": "sk-x",
+                   "stripe_customer_id": "cus_1", "shop_rules_text": "店の決まり"},
+        "requests": [{"staff_id": "s1", "type": "off", "status": "approved",
+                      "dates": "2026-11-02", "reason": "通院"}],
+        "fixed_shifts": [{"staff_id": "s1", "date": "2026-11-01",
+                          "start_time": "09:00", "end_time": "17:00"}],
+        "contract_id": "demo", "shop_password": "pw",
+        "persist": True, "ai_hint": True,
+    }
+
+
+def test_no_password_or_api_key_survives():
+    out = capture.anonymize(_body())
+    leaked = [k for k in list(out["config"]) + list(out)
+              if k.endswith("_password") or k.endswith("_api_key")]
+    assert leaked == []
+    assert set(out["config"]) <= set(capture.CONFIG_KEYS)
+    assert out["config"] == {"opening_time": "09:00",
+                             "staff_req": {"min_weekday": 2}}
+    raw = json.dumps(out, ensure_ascii=False)
+    for secret in ("AIzaSECRET", "sk-x", "1234", "cus_1", "demo", "山田",
+                   "a@example.com", "通院", "店の決まり"):
+        assert secret not in raw
+
+
+def test_ids_are_hashed_consistently():
+    out = capture.anonymize(_body())
+    sid = out["staff_list"][0]["id"]
+    assert sid != "s1"
+    assert out["requests"][0]["staff_id"] == sid
+    assert out["fixed_shifts"][0]["staff_id"] == sid
+    assert out["persist"] is False and out["ai_hint"] is False
+
+
+def test_written_file_loads_back(tmp_path):
+    path = capture.write(_body(), {"status": "ok", "elapsed_sec": 1.0},
+                         directory=str(tmp_path))
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        assert "AIzaSECRET" not in f.read()
+    records = capture.load(str(tmp_path))
+    assert len(records) == 1
+    assert records[0]["meta"]["status"] == "ok"
+    assert records[0]["request"]["config"]["opening_time"] == "09:00"
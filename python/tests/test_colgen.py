@@ -0,0 +1,60 @@
+import contextlib
+import io
+import time
+
+from colgen import ColumnGenerator
+from scheduler import ShiftScheduler, _load_pulp
+
+DATES = ["2026-11-02", "2026-11-03"]
+
+
+def _scheduler(slot_minutes=15, flex=None, staff=None):
+    config = {"opening_time": "09:00", "closing_time": "21:00",
+              "custom_shifts": [{"start": "09:00", "end": "15:00"},
+                                {"start": "15:00", "end": "21:00"}],
+              "staff_req": {"min_weekday": 2, "min_manager": 0},
+              "slot_minutes": slot_minutes,
+              "flex_shifts": dict({"enabled": True, "grid_minutes": 30}, **(flex or {}))}
+    if staff is None:
+        staff = [{"id": "s{}".format(i), "role": "staff", "max_days_week": 5,
+                  "max_hours_day": 8} for i in range(3)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        return ShiftScheduler(staff, config, DATES, [])
+
+
+def _master_duals(slot_minutes):
+    # 誰も入れないとき、カバレッジ行の双対はスラックの重みそのもの
+    staff = [{"id": "s0", "unavailable_dates": DATES}]
+    sch = _scheduler(slot_minutes, staff=staff)
+    cg = ColumnGenerator(sch)
+    cg.weeks = sch._group_dates_by_week()
+    cg.windows = []
+    week_of = {d: i for i, w in enumerate(cg.weeks) for d in w}
+    slot_reqs = {d: sch._open_slot_requirements(d) for d in DATES}
+    with contextlib.redirect_stdout(io.StringIO()):
+        _, duals = cg._solve_master(_load_pulp(), {}, slot_reqs, week_of)
+    return set(duals[0].values())
+
+
+def test_master_slack_weight_scales_with_slot_length():
+    weight = ShiftScheduler.OBJECTIVE_WEIGHTS["coverage"]
+    assert _master_duals(15) == {weight}
+    assert _master_duals(30) == {weight * 2}
+
+
+def test_pricing_stops_at_the_time_budget():
+    sch = _scheduler(flex={"time_budget": 0, "max_iterations": 50})
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        pool = ColumnGenerator(sch).run()
+    # 予算切れで価格付けを始めないので、初期列 (パターン) のままになる
+    assert all(len(opts) == 2 for opts in pool.values())
+    assert time.perf_counter() - started < 5
+
+
+def test_generated_columns_respect_hour_limits():
+    sch = _scheduler(flex={"min_hours": 4})
+    with contextlib.redirect_stdout(io.StringIO()):
+        pool = ColumnGenerator(sch).run()
+    hours = [o["hours"] for opts in pool.values() for o in opts]
+    assert hours and all(4 <= h <= 8 for h in hours)
@@ -0,0 +1,86 @@
+import contextlib
+import io
+import random
+from types import SimpleNamespace
+
+import pytest
+
+import diagnose
+from cancel import CancelToken, Cancelled
+from scheduler import ShiftScheduler, _load_pulp
+
+DATES = ["2026-11-02", "2026-11-03", "2026-11-04"]
+CONFIG = {"opening_time": "09:00", "closing_time": "17:00",
+          "custom_shifts": [{"start": "09:00", "end": "17:00"}],
+          "staff_req": {"min_weekday": 3, "min_manager": 0},
+          "solver_time_limit": 10}
+
+
+def _solve(staff, config=CONFIG, dates=DATES):
+    with contextlib.redirect_stdout(io.StringIO()):
+        sch = ShiftScheduler(staff, dict(config), dates, [])
+        sch.solve()
+    return sch
+
+
+def test_shortage_names_who_could_not_work_and_why():
+    staff = [{"id": "a", "name": "A", "unavailable_dates": [DATES[0]]},
+             {"id": "b", "name": "B", "max_days_week": 1},
+             {"id": "c", "name": "C"}]
+    sch = _solve(staff)
+    report = sch.shortages
+    assert report["short_hours"] == {"coverage": 24.0}
+    assert report["blocked_totals"] == {"unavailable": 1, "weekly_limit": 2}
+    assert report["top_reason"] == "weekly_limit"
+    first, second, _ = report["conflicts"]
+    assert first["date"] == DATES[0] and first["blocked"] == {"unavailable": ["A"]}
+    assert second["ranges"] == [{"start": "09:00", "end": "17:00", "shortage": 1}]
+    assert second["blocked"] == {"weekly_limit": ["B"]}
+
+
+def test_demand_nobody_can_cover_is_still_reported():
+    # 全員 NG の日は変数も不足の行もないが、不足には数えて理由を返す
+    staff = [{"id": "a", "name": "A", "unavailable_dates": [DATES[1]]},
+             {"id": "b", "name": "B", "unavailable_dates": [DATES[1]]}]
+    config = dict(CONFIG, staff_req={"min_weekday": 2, "min_manager": 0})
+    sch = _solve(staff, config)
+    assert sch.solution_summary()["coverage_shortage_hours"] == 16.0
+    assert sch.bound["lower_bound_hours"] == 16.0
+    [conflict] = sch.shortages["conflicts"]
+    assert conflict["date"] == DATES[1] and conflict["short_hours"] == 16.0
+    assert conflict["blocked"] == {"unavailable": ["A", "B"]}
+
+
+def test_flow_bound_never_exceeds_the_milp_shortage():
+    rnd = random.Random(7)
+    dates = ["2026-11-{:02d}".format(d) for d in range(2, 16)]
+    config = dict(CONFIG, custom_shifts=[{"start": "09:00", "end": "13:00"},
+                                         {"start": "13:00", "end": "17:00"},
+                                         {"start": "09:00", "end": "17:00"}])
+    for _ in range(5):
+        staff = [{"id": "s{}".format(i), "max_days_week": rnd.randint(1, 5),
+                  "unavailable_dates": rnd.sample(dates, rnd.randint(0, 6))}
+                 for i in range(rnd.randint(2, 5))]
+        config["staff_req"] = {"min_weekday": rnd.randint(1, 4),
+                               "min_weekend": rnd.randint(1, 4),
+                               "min_manager": 0}
+        sch = _solve(staff, config, dates)
+        bound = sch.bound["lower_bound_hours"]
+        assert 0 < bound <= sch.solution_summary()["coverage_shortage_hours"] + 1e-6
+
+
+def test_elastic_diagnosis_runs_under_the_cancel_token():
+    pulp = _load_pulp()
+    prob = pulp.LpProblem("conflict", pulp.LpMinimize)
+    x = pulp.LpVariable("x", 0, 1)
+    prob += x
+    prob += x >= 2, "weekly_a"
+    model = {"prob": prob, "rows": {"weekly_a": {"rule": "weekly_limit"}}}
+
+    sch = SimpleNamespace(cancel=CancelToken(deadline_seconds=30))
+    [conflict] = diagnose.elastic_conflicts(sch, model)
+    assert conflict["row"] == "weekly_a" and conflict["violation"] == 1.0
+
+    sch.cancel.cancel("disconnect")
+    with pytest.raises(Cancelled):
+        diagnose.elastic_conflicts(sch, model)
@@ -0,0 +1,49 @@
+from fastapi.testclient import TestClient
+
+import compare_engines
+import engines
+import main
+
+DATES = ["2026-11-02", "2026-11-03"]
+INPUTS = {
+    "staff_list": [{"id": "m", "role": "manager", "unavailable_dates": [DATES[1]]},
+                   {"id": "s1"}, {"id": "s2"}],
+    "config": {"opening_time": "09:00", "closing_time": "17:00",
+               "custom_shifts": [{"start": "09:00", "end": "17:00"}],
+               "staff_req": {"min_weekday": 2, "min_manager": 1}},
+    "dates": DATES, "requests": [], "fixed_shifts": [], "freeze_before": None,
+}
+
+
+def _everyone_every_day(inputs, sch, force, objective):
+    return [{"staff_id": s["id"], "date": d, "start_time": "09:00",
+             "end_time": "17:00", "break_minutes": 60}
+            for s in inputs["staff_list"] for d in inputs["dates"]]
+
+
+def test_registered_engine_is_selectable_and_audited(monkeypatch):
+    monkeypatch.setitem(engines._ENGINES, "naive", None)
+    engines.register("naive", _everyone_every_day, "test")
+    client = TestClient(main.app)
+    assert "naive" in [e["name"] for e in client.get("/engines").json()["engines"]]
+
+    res = client.post("/generate", json=dict(INPUTS, engine="naive")).json()
+    assert res["engine"] == "naive" and res["mode"] == "math"
+    # 他のエンジンの結果も tiered のルールで監査する (NG 日の店長は外す)
+    assert ("m", DATES[1]) not in {(s["staff_id"], s["date"]) for s in res["shifts"]}
+    assert res["audit"]["violations_before"]["ng_date"] == 1
+
+    res = client.post("/generate", json=dict(INPUTS, engine="nope")).json()
+    assert res["status"] == "error" and "naive" in res["message"]
+
+
+def test_comparison_ranks_engines_on_the_same_rules():
+    rows = [compare_engines.run_task("tiny", name, INPUTS, "auto", 10)
+            for name in ("tiered", "greedy")]
+    assert [r["status"] for r in rows] == ["ok", "ok"]
+    assert all(r["hard_violations"] == 0 for r in rows)
+    summary = {s["engine"]: s for s in
+               compare_engines.summarize(rows, ["tiered", "greedy"])}
+    assert summary["tiered"]["wins"] == 1
+    assert summary["tiered"]["shortage_hours"] <= summary["greedy"]["shortage_hours"]
+    assert summary["tiered"]["solved"] == summary["tiered"]["instances"] == 1
@@ -0,0 +1,54 @@
+from collections import Counter
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import multi_store
+
+DATES = ["2026-11-{:02d}".format(d) for d in range(2, 9)]   # 月〜日
+CONFIG = {"opening_time": "09:00", "closing_time": "17:00",
+          "custom_shifts": [{"start": "09:00", "end": "17:00"}],
+          "staff_req": {"min_weekday": 2, "min_weekend": 2, "min_holiday": 2,
+                        "min_manager": 0},
+          "solver_time_limit": 10}
+STORES = [{"id": "east", "config": CONFIG}, {"id": "west", "config": CONFIG}]
+# 共有スタッフ4人 (週3日まで) と各店舗の専属1人
+STAFF = ([{"id": "p{}".format(i), "stores": ["east", "west"], "max_days_week": 3}
+          for i in range(4)]
+         + [{"id": "e0", "home_store": "east", "max_days_week": 5},
+            {"id": "w0", "home_store": "west", "max_days_week": 5}])
+
+
+def test_shared_staff_are_never_double_booked(pool):
+    res = TestClient(main.app).post("/multi_store", json={
+        "stores": STORES, "staff_list": STAFF, "dates": DATES}).json()
+    assert res["status"] == "success"
+    shifts = res["shifts"]
+    # 共有スタッフは両方の店舗で使われている
+    assert {s["store_id"] for s in shifts if s["staff_id"].startswith("p")} == {
+        "east", "west"}
+
+    # 同じ人が同じ日に2店舗 (または同じ店舗で2本) 入っていない
+    per_day = Counter((s["staff_id"], s["date"]) for s in shifts)
+    assert max(per_day.values()) == 1
+    # 店舗をまたいでも週上限を超えない
+    limits = {st["id"]: st["max_days_week"] for st in STAFF}
+    per_week = Counter((s["staff_id"],
+                        datetime.strptime(s["date"], "%Y-%m-%d").isocalendar()[1])
+                       for s in shifts)
+    assert all(n <= limits[sid] for (sid, _), n in per_week.items())
+    # 専属スタッフは自分の店舗だけ
+    assert all(s["store_id"] == "east" for s in shifts if s["staff_id"] == "e0")
+    assert all(s["store_id"] == "west" for s in shifts if s["staff_id"] == "w0")
+    assert res["linking"]["double_bookings"] == 0
+    assert res["linking"]["weekly_over"] == 0
+    assert res["linking"]["shared_staff"] == 4
+
+
+def test_unknown_store_references_are_rejected():
+    with pytest.raises(ValueError):
+        multi_store.validate(STORES, [{"id": "x", "stores": ["north"]}])
+    with pytest.raises(ValueError):
+        multi_store.validate(STORES + [{"id": "east"}], STAFF)
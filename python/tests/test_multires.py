@@ -0,0 +1,45 @@
+import contextlib
+import io
+
+import pytest
+
+from scheduler import ShiftScheduler
+
+DATES = ["2026-11-{:02d}".format(d) for d in range(2, 7)]   # 月〜金
+CONFIG = {"opening_time": "09:00", "closing_time": "17:00",
+          "custom_shifts": [{"start": "09:00", "end": "13:30"},
+                            {"start": "13:30", "end": "17:00"},
+                            {"start": "09:00", "end": "17:00"},
+                            {"start": "11:00", "end": "15:00"}],
+          # 月曜 (JS の曜日 1) だけ 11:00-14:30 に3人。14:00 の粗いスロットの途中で変わる
+          "time_staff_req": [{"days": [1], "start": "11:00", "end": "14:30",
+                              "count": 3}],
+          "staff_req": {"min_weekday": 2, "min_manager": 0},
+          "solver_time_limit": 20}
+STAFF = [{"id": "s{}".format(i), "hourly_wage": 1000 + 10 * i, "max_days_week": 4}
+         for i in range(6)]
+
+
+def _solve(**config):
+    with contextlib.redirect_stdout(io.StringIO()):
+        sch = ShiftScheduler(STAFF, dict(CONFIG, **config), DATES, [])
+        result = sch.solve()
+    return sch, result
+
+
+def test_coarse_to_fine_only_reopens_boundary_days():
+    direct, _ = _solve()
+    sch, result = _solve(coarse_slot_minutes=60)
+    report = sch.multires_report
+    assert report["status"] == "ok" and result
+    # 境目は月曜の 14:00 の1区間だけ。月曜の6人日だけ解き直し、残りは粗い解のまま
+    assert report["boundary_segments"] == 1
+    assert (report["free_staff_days"], report["fixed_staff_days"]) == (6, 24)
+    assert sch.solution_summary() == direct.solution_summary()
+
+
+def test_coarse_slots_must_be_a_multiple_of_the_fine_slots():
+    with pytest.raises(ValueError):
+        _solve(slot_minutes=20, coarse_slot_minutes=30)
+    with pytest.raises(ValueError):
+        _solve(coarse_slot_minutes=15)
@@ -0,0 +1,43 @@
+import contextlib
+import io
+
+from scheduler import ShiftScheduler
+
+DATES = ["2026-11-02", "2026-11-03", "2026-11-04"]
+CONFIG = {"opening_time": "09:00", "closing_time": "17:00",
+          "custom_shifts": [{"start": "09:00", "end": "13:00"},
+                            {"start": "09:00", "end": "17:00"},
+                            {"start": "13:00", "end": "17:00"}],
+          "staff_req": {"min_weekday": 2, "min_manager": 1},
+          "solver_time_limit": 10}
+STAFF = [{"id": "m", "role": "manager", "salary_type": "monthly", "max_days_week": 2},
+         {"id": "a", "hourly_wage": 1000},
+         {"id": "b", "hourly_wage": 1100, "max_days_week": 1}]
+# b は同じ週の木曜に確定済みで、週上限を使い切っている
+FIXED = [{"staff_id": "b", "date": "2026-11-05", "start_time": "09:00",
+          "end_time": "17:00"}]
+
+
+def _solve(presolve):
+    with contextlib.redirect_stdout(io.StringIO()):
+        sch = ShiftScheduler(STAFF, dict(CONFIG, presolve=presolve), DATES, [],
+                             fixed_shifts=FIXED)
+        result = sch.solve()
+    return sch, result
+
+
+def test_presolve_shrinks_the_model_without_changing_the_optimum():
+    on, shifts_on = _solve(True)
+    off, shifts_off = _solve(False)
+    # 同点の別解はありうるので、比べるのは目的関数の各項
+    assert on.solution_summary() == off.solution_summary()
+    report = on.presolve_report
+    # b の週の選択肢は全部禁止、月給の店長は 09-17 が 09-13 / 13-17 を支配する
+    assert report["forbidden"] > 0 and report["dominated"] > 0
+    assert report["options_after"] < report["options_before"]
+    assert not any(k[0] == "b" for k in on._model["x"])
+    assert len(on._model["x"]) == report["options_after"]
+    assert len(on._model["x"]) < len(off._model["x"])
+    assert (len(on._model["prob"].constraints)
+            < len(off._model["prob"].constraints))
+    assert len(shifts_on) == len(shifts_off)
@@ -0,0 +1,98 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import scenarios
+from admission import AdmissionController
+from cancel import CancelToken, Cancelled
+
+
+class _Gauge:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.now = self.peak = 0
+
+    def work(self, n, stop=None):
+        with self.lock:
+            self.now += 1
+            self.peak = max(self.peak, self.now)
+        time.sleep(0.05)
+        with self.lock:
+            self.now -= 1
+        return n * 10
+
+
+def _fan_out(fn, calls, token, slots):
+    return asyncio.run(scenarios.fan_out(fn, calls, token, slots))
+
+
+def test_borrowed_slots_follow_admission_capacity(pool):
+    admission = AdmissionController(max_solvers=2, per_tenant=2)
+    admission._take("t1")    # リクエスト自身の枠
+    gauge = _Gauge()
+    results = _fan_out(gauge.work, [(n,) for n in range(6)], CancelToken(),
+                       admission.borrow("t1"))
+    assert results == [0, 10, 20, 30, 40, 50]
+    assert gauge.peak == 2
+    assert admission.running == 1
+    assert admission.counters["borrowed"] >= 1
+
+
+def test_no_borrowing_while_others_wait(pool):
+    admission = AdmissionController(max_solvers=4, per_tenant=2)
+    admission._take("t1")
+    slots = admission.borrow("t1")
+    admission.waiting["t2"] = [object()]
+    assert slots.try_take() is False
+    admission.waiting.clear()
+    assert slots.try_take() is True
+    assert admission.running_by_tenant["t1"] == 2
+    slots.release()
+    assert admission.running == 1
+
+
+def test_cancel_reaches_running_workers(pool):
+    stopped = []
+
+    def solve(n, stop=None):
+        token = CancelToken(30)
+        with scenarios.stop_watch(stop, token):
+            while not token.cancelled:
+                time.sleep(0.01)
+        stopped.append(token.reason)
+
+    async def main():
+        token = CancelToken()
+        asyncio.get_running_loop().call_later(0.2, token.cancel, "disconnect")
+        await scenarios.fan_out(solve, [(n,) for n in range(3)], token)
+
+    started = time.perf_counter()
+    with pytest.raises(Cancelled):
+        asyncio.run(main())
+    deadline = time.perf_counter() + 2
+    while len(stopped) < 3 and time.perf_counter() < deadline:
+        time.sleep(0.02)
+    assert stopped == ["cancelled"] * 3
+    assert time.perf_counter() - started < 2
+
+
+def test_deltas_are_validated_with_the_request_schema():
+    runs = [{"name": "x", "deltas": [
+        {"type": "add_staff", "staff": {"role": " Leader ", "max_days_week": "3"}},
+        {"type": "update_staff", "staff_id": "s1", "values": {"evaluation": "a"}},
+        {"type": "staff_req", "values": {"min_weekend": "4"}},
+    ]}]
+    scenarios.validate(runs)
+    deltas = runs[0]["deltas"]
+    assert deltas[0]["staff"] == {"role": "leader", "max_days_week": 3}
+    assert deltas[1]["values"] == {"evaluation": "A"}
+    assert deltas[2]["values"] == {"min_weekend": 4}
+
+    for bad in ({"type": "add_staff", "staff": {"max_days_week": "many"}},
+                {"type": "opening_hours", "start": "10時", "end": "20:00"},
+                {"type": "bogus"}):
+        with pytest.raises(ValueError):
+            scenarios.validate([{"deltas": [bad]}])
@@ -0,0 +1,179 @@
+import contextlib
+import io
+
+import pytest
+
+from scheduler import ShiftScheduler
+
+DATES = ["2026-11-02", "2026-11-03"]
+CONFIG = {"opening_time": "09:00", "closing_time": "17:00",
+          "custom_shifts": [{"start": "09:00", "end": "17:00"}],
+          "staff_req": {"min_weekday": 2, "min_weekend": 2, "min_manager": 1},
+          "solver_time_limit": 10}
+
+
+def _staff(n=3):
+    roles = ["manager", "staff", "staff"]
+    return [{"id": "s{}".format(i), "name": "S{}".format(i), "role": roles[i % 3],
+             "evaluation": "B", "salary_type": "hourly", "hourly_wage": 1100,
+             "max_days_week": 5, "max_hours_day": 8} for i in range(n)]
+
+
+def _solve(staff, fixed=(), requests=(), config=CONFIG, force=False):
+    with contextlib.redirect_stdout(io.StringIO()):
+        sch = ShiftScheduler(staff, dict(config), DATES, list(requests),
+                             fixed_shifts=list(fixed))
+        result = sch.solve(force=force)
+    return sch, result
+
+
+def test_fully_fixed_period_is_nothing_to_do():
+    fixed = [{"staff_id": sid, "date": d, "start_time": "09:00", "end_time": "17:00"}
+             for d in DATES for sid in ("s0", "s1")]
+    sch, result = _solve(_staff(), fixed)
+    assert result == []
+    assert sch.solved_with == {"tier": 3, "force": False, "nothing_to_do": True}
+    assert sch.diagnosis is None
+
+
+def test_manager_gap_is_still_solved():
+    # 人数は足りているが店長がいない -> 店長のシフトを作る
+    fixed = [{"staff_id": sid, "date": d, "start_time": "09:00", "end_time": "17:00"}
+             for d in DATES for sid in ("s1", "s2")]
+    sch, result = _solve(_staff(), fixed)
+    assert not (sch.solved_with or {}).get("nothing_to_do")
+    assert {(s["staff_id"], s["date"]) for s in result} == {("s0", d) for d in DATES}
+
+
+def test_residual_demand_without_staff_is_diagnosed():
+    requests = [{"staff_id": "s{}".format(i), "type": "off", "status": "approved",
+                 "dates": d} for i in range(3) for d in DATES]
+    sch, result = _solve(_staff(), requests=requests)
+    assert sch.bound["assignable_staff_days"] == 0
+    assert sch.bound["lower_bound_hours"] > 0
+    assert sch.diagnosis is not None
+    assert not result
+
+
+def test_hint_keeps_only_rule_abiding_draft_shifts():
+    staff = _staff()
+    staff[1]["max_days_week"] = 1
+    requests = [{"staff_id": "s2", "type": "off", "status": "approved",
+                 "dates": DATES[1]}]
+    draft = [{"staff_id": sid, "date": d, "start_time": "10:00", "end_time": "15:00"}
+             for sid, d in (("s0", DATES[0]), ("s1", DATES[0]), ("s1", DATES[1]),
+                            ("s2", DATES[1]))]
+    with contextlib.redirect_stdout(io.StringIO()):
+        sch = ShiftScheduler(staff, dict(CONFIG), DATES, requests, hint_shifts=draft)
+        sch._prepare_hint(force=False)
+    report = sch.hint_report
+    assert report["received"] == 4 and report["validated"] == 2
+    assert report["dropped"] == {"ng_date": 1, "weekly_limit": 1}
+    assert report["survived"] == 0.5
+    # 外すだけで、足したり時間帯を動かしたりはしない
+    kept = set(sch._hint)
+    assert ("s0", DATES[0]) in kept and ("s2", DATES[1]) not in kept
+    assert set(sch._hint.values()) == {(600, 900)}
+
+
+
+def test_hint_is_used_as_the_mip_start():
+    # 2週間・4種類のシフトで、最適解をそのまま案として渡す
+    dates = ["2026-11-{:02d}".format(d) for d in range(2, 16)]
+    config = dict(CONFIG, closing_time="21:00",
+                  custom_shifts=[{"start": "09:00", "end": "15:00"},
+                                 {"start": "15:00", "end": "21:00"},
+                                 {"start": "09:00", "end": "13:00"},
+                                 {"start": "13:00", "end": "21:00"}],
+                  staff_req={"min_weekday": 2, "min_weekend": 3, "min_manager": 0})
+    staff = [{"id": "s{}".format(i), "hourly_wage": 1000 + 37 * i,
+              "max_days_week": 4} for i in range(8)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        plain = ShiftScheduler(staff, dict(config), dates, [])
+        draft = plain.solve()
+        sch = ShiftScheduler(staff, dict(config, hint_benchmark=True), dates, [],
+                             hint_shifts=draft)
+        sch.solve()
+    report = sch.hint_report
+    assert report["validated"] == len(draft) and report["mapped_exact"] == len(draft)
+    # CBC が MIP start を受け取り、初期解までの時間を測れている
+    incumbent = report["incumbent"]
+    assert incumbent["mipstart_used"] is True
+    assert incumbent["seconds"] is not None and "total_seconds" in incumbent
+    assert incumbent["objective"] == pytest.approx(report["hint_objective"], abs=0.01)
+    assert report["baseline"]["mipstart_used"] is False
+    assert "time_to_incumbent_saved" in report
+    assert sch.solution_summary() == plain.solution_summary()
+
+
+def test_lexicographic_mode_puts_coverage_before_cost():
+    # 重み付き和では、極端に高い時給のコストが不足の重みを上回って不足を残す
+    config = dict(CONFIG, staff_req={"min_weekday": 2, "min_manager": 0})
+    staff = [{"id": "a", "hourly_wage": 1000}, {"id": "b", "hourly_wage": 1200},
+             {"id": "x", "hourly_wage": 500000000}]
+
+    def picked(staff, objective):
+        with contextlib.redirect_stdout(io.StringIO()):
+            sch = ShiftScheduler(staff, dict(config), DATES[:1], [])
+            result = sch.solve(objective=objective)
+        return sorted(s["staff_id"] for s in result), sch.solution_summary()
+
+    ids, summary = picked([staff[0], staff[2]], "weighted")
+    assert ids == ["a"] and summary["coverage_shortage_hours"] == 8
+    ids, summary = picked([staff[0], staff[2]], "lexicographic")
+    assert ids == ["a", "x"] and summary["coverage_shortage_hours"] == 0
+    # 不足の段を固定したうえで、最後の段で安い人を選ぶ
+    assert picked(staff, "lexicographic")[0] == ["a", "b"]
+
+
+def _shift(sid, d):
+    return {"staff_id": sid, "date": d, "start_time": "09:00", "end_time": "17:00"}
+
+
+def test_fixed_shifts_cover_demand_and_count_toward_limits():
+    config = dict(CONFIG, staff_req={"min_weekday": 1, "min_manager": 0})
+    staff = [{"id": "s0", "hourly_wage": 900, "max_days_week": 7},
+             {"id": "s1", "hourly_wage": 1500}]
+    # 期間直前の6日連勤 (10/27-11/1) は7連勤の判定に入る
+    before = [_shift("s0", "2026-{}".format(d)) for d in
+              ("10-27", "10-28", "10-29", "10-30", "10-31", "11-01")]
+    sch, result = _solve(staff, fixed=before, config=config)
+    assert {(s["staff_id"], s["date"]) for s in result} == {
+        ("s1", DATES[0]), ("s0", DATES[1])}
+
+    # 固定したスタッフ日には変数を作らず、その分の必要人数も差し引く
+    sch, result = _solve(staff, fixed=[_shift("s1", DATES[0])], config=config)
+    assert ("s1", DATES[0]) not in {k[:2] for k in sch._model["x"]}
+    assert [(s["staff_id"], s["date"]) for s in result] == [("s0", DATES[1])]
+    assert sch.solution_summary()["coverage_shortage_hours"] == 0
+
+
+def test_dates_before_freeze_are_left_alone():
+    with contextlib.redirect_stdout(io.StringIO()):
+        sch = ShiftScheduler(_staff(), dict(CONFIG), DATES, [],
+                             freeze_before=DATES[1])
+        result = sch.solve()
+    assert result and {s["date"] for s in result} == {DATES[1]}
+    assert all(k[1] == DATES[1] for k in sch._model["x"])
+
+
+def test_alternatives_differ_and_stay_within_the_gap():
+    staff = [{"id": "s{}".format(i), "hourly_wage": 1000 + i} for i in range(4)]
+    config = dict(CONFIG, staff_req={"min_weekday": 2, "min_manager": 0})
+    with contextlib.redirect_stdout(io.StringIO()):
+        sch = ShiftScheduler(staff, dict(config), DATES, [])
+        best = sch.solve()
+        summary = sch.solution_summary()
+        alternatives = sch.solve_alternatives(3, min_diff=2, gap=0.05)
+
+    def keys(shifts):
+        return frozenset((s["staff_id"], s["date"]) for s in shifts)
+
+    assert len(alternatives) == 3
+    seen = {keys(best)}
+    for alt in alternatives:
+        assert alt["differs_from_best"] >= 2
+        assert alt["summary"]["coverage_shortage_hours"] == 0
+        assert alt["summary"]["objective"] <= summary["objective"] * 1.05 + 1e-6
+        assert keys(alt["shifts"]) not in seen
+        seen.add(keys(alt["shifts"]))
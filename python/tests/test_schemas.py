@@ -0,0 +1,36 @@
+import pytest
+from pydantic import ValidationError
+
+from schemas import ShiftRequest
+from staff_table import StaffRecord
+
+
+def _staff(**row):
+    req = ShiftRequest.model_validate({"staff_list": [dict({"id": 7}, **row)]})
+    return req.staff_list[0]
+
+
+def test_null_and_blank_categories_use_engine_defaults():
+    for value in (None, ""):
+        st = _staff(role=value, evaluation=value, salary_type=value)
+        assert st["role"] is None and st["evaluation"] is None
+        rec = StaffRecord(0, st, frozenset())
+        assert (rec.role, rec.rank, rec.hourly) == ("staff", "B", True)
+
+
+def test_rows_are_coerced_once_at_the_edge():
+    st = _staff(role=" Manager ", evaluation="a", salary_type="MONTHLY",
+                max_days_week="4", unavailable_dates="2026-11-02, 2026-11-03",
+                email="a@example.com")
+    assert st == {"id": "7", "role": "manager", "evaluation": "A",
+                  "salary_type": "monthly", "max_days_week": 4,
+                  "unavailable_dates": ["2026-11-02", "2026-11-03"],
+                  "email": "a@example.com"}
+    assert "hourly_wage" not in st
+
+
+def test_bad_values_are_rejected():
+    with pytest.raises(ValidationError):
+        _staff(max_days_week="five")
+    with pytest.raises(ValidationError):
+        ShiftRequest.model_validate({"dates": ["11/02/2026"]})
@@ -0,0 +1,46 @@
+import contextlib
+import io
+
+from scheduler import ShiftScheduler
+from staff_table import StaffRecord, ng_dates_by_staff
+
+WEEK = ["2026-11-0{}".format(d) for d in range(2, 9)]   # 月〜日
+CONFIG = {"opening_time": "09:00", "closing_time": "21:00",
+          "opening_times": {"weekday": {"start": "09:00", "end": "17:00"},
+                            "weekend": {"start": "10:00", "end": "18:00"}},
+          "custom_shifts": [{"start": "08:00", "end": "13:00"},
+                            {"start": "13:00", "end": "21:00"}],
+          "staff_req": {"min_weekday": 1, "min_manager": 0}}
+
+
+def test_options_are_shared_per_opening_window():
+    staff = [{"id": "s{}".format(i), "max_hours_day": 8} for i in range(20)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        sch = ShiftScheduler(staff, dict(CONFIG), WEEK, [])
+    by_day = {}
+    for st in sch.staff_table:
+        for d in WEEK:
+            opts = sch._build_shift_options(st, d)
+            # 同じ日のスタッフは同じ tuple を共有する
+            assert by_day.setdefault(d, opts) is opts
+    assert len(sch.option_catalog) == len({sch._day_window(d) for d in WEEK})
+    # パターンは営業時間で切り詰める
+    assert [(o["start"], o["end"]) for o in by_day[WEEK[0]]] == [
+        ("09:00", "13:00"), ("13:00", "17:00")]
+    assert [(o["start"], o["end"]) for o in by_day[WEEK[5]]] == [
+        ("10:00", "13:00"), ("13:00", "18:00")]
+
+
+def test_staff_rows_parse_each_field_once():
+    staff = [{"id": "s1", "role": "Manager", "evaluation": "a",
+              "hourly_wage": None, "max_days_week": "3",
+              "unavailable_dates": "2026-11-02, 2026-11-03"}]
+    requests = [{"staff_id": "s1", "type": "off", "status": "approved",
+                 "dates": "2026-11-05"},
+                {"staff_id": "s1", "type": "off", "status": "pending",
+                 "dates": "2026-11-06"}]
+    ng = ng_dates_by_staff(staff, requests)
+    assert ng == {"s1": frozenset({"2026-11-02", "2026-11-03", "2026-11-05"})}
+    st = StaffRecord(0, staff[0], ng["s1"])
+    assert (st.role, st.rank, st.wage, st.max_days, st.max_hours) == (
+        "manager", "A", 1100.0, 3, 8.0)
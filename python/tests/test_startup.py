@@ -0,0 +1,29 @@
+import json
+import os
+import subprocess
+import sys
+
+from fastapi.testclient import TestClient
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_importing_the_app_leaves_heavy_modules_unloaded():
+    code = ("import sys, json, main; print(json.dumps([m for m in "
+            "('pulp', 'google.generativeai', 'pandas') if m in sys.modules]))")
+    out = subprocess.run([sys.executable, "-c", code], cwd=HERE, check=True,
+                         capture_output=True, text=True).stdout
+    assert json.loads(out.strip().splitlines()[-1]) == []
+
+
+def test_warm_up_runs_before_the_first_request(monkeypatch):
+    import main
+    import warmup
+    monkeypatch.setenv("RAKUSHIFT_WARMUP", "1")
+    monkeypatch.setitem(warmup.STATS, "first_solve_ms", None)
+    with TestClient(main.app) as client:
+        # lifespan の中で温め終わってからリクエストを受ける
+        startup = client.get("/").json()["startup"]
+    assert startup["cbc_available"] is True
+    assert startup["first_solve_ms"] is not None
+    assert "pulp" in sys.modules
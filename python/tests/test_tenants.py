@@ -0,0 +1,117 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import db
+import main
+import tenants
+from fakedb import FakeConn, FakePool
+
+CONFIG_ROW = {"contract_id": "c1", "organization_id": "org-1", "data_version": 3,
+              "shop_password": "open-sesame", "admin_password": "root",
+              "gemini_api_key": "AIzaSECRET", "openai_api_key": "sk-x",
+              "opening_time": "09:00"}
+
+
+@pytest.fixture
+def conn(monkeypatch):
+    def answer(sql, params):
+        if "FROM config" in sql and "SELECT *" in sql:
+            return [dict(CONFIG_ROW)] if params == ("c1",) else []
+        if "gemini_api_key FROM config" in sql:
+            return [(CONFIG_ROW["gemini_api_key"],)]
+        if "FROM staff" in sql:
+            return [{"id": "s1", "name": "山田", "unavailable_dates": "2026-11-03"}]
+        return []
+
+    fake = FakeConn(answer)
+    monkeypatch.setattr(db, "enabled", lambda: True)
+    monkeypatch.setattr(db, "get_pool", lambda: FakePool(fake))
+    return fake
+
+
+def _store():
+    store = tenants.TenantStore()
+    store.listening = True
+    return store
+
+
+def test_snapshot_needs_password_before_any_query(conn):
+    store = _store()
+    for password in (None, ""):
+        with pytest.raises(tenants.Unauthorized):
+            store.snapshot("c1", password)
+    assert conn.log == []
+
+
+def test_wrong_password_never_reads_staff(conn):
+    pytest.importorskip("psycopg")
+    store = _store()
+    with pytest.raises(tenants.Unauthorized):
+        store.snapshot("c1", "guess")
+    with pytest.raises(tenants.Unauthorized):
+        store.snapshot("unknown", "guess")
+    assert not any("FROM staff" in sql for sql in conn.statements())
+    assert store.metrics()["tenants"] == 0
+
+
+def test_snapshot_strips_secrets_and_checks_cached_password(conn):
+    pytest.importorskip("psycopg")
+    store = _store()
+    snap = store.snapshot("c1", "open-sesame")
+    assert not any(k.endswith("_password") or k.endswith("_api_key")
+                   for k in snap["config"])
+    assert snap["staff_list"][0]["unavailable_dates"] == ["2026-11-03"]
+    with pytest.raises(tenants.Unauthorized):
+        store.snapshot("c1", "guess")
+    assert store.snapshot("c1", "open-sesame")["version"] == 3
+    assert store.api_key("c1", "open-sesame") == "AIzaSECRET"
+
+
+def test_cached_entry_is_not_served_without_password(conn):
+    store = _store()
+    store._entries["c1"] = {"version": 3, "organization_id": "org-1",
+                            "credential": tenants._digest("open-sesame"),
+                            "config": {}, "staff_list": [], "requests": []}
+    assert store.snapshot("c1", "open-sesame")["organization_id"] == "org-1"
+    with pytest.raises(tenants.Unauthorized):
+        store.snapshot("c1", None)
+
+
+def test_contract_id_without_password_is_401(monkeypatch):
+    monkeypatch.setattr(db, "enabled", lambda: True)
+    monkeypatch.setattr(tenants, "store", _store())
+    client = TestClient(main.app)
+    body = {"contract_id": "c1", "start_date": "2026-11-02",
+            "end_date": "2026-11-08"}
+    for path in ("/check", "/analytics", "/generate"):
+        res = client.post(path, json=body)
+        assert res.status_code == 401, path
+        assert "staff_list" not in res.json()
+
+
+def test_lean_client_payload_is_accepted(monkeypatch):
+    # runAutoFill が engine_load のときに組み立てる本文そのまま
+    store = _store()
+    store._entries["c1"] = {
+        "version": 3, "organization_id": "org-1",
+        "credential": tenants._digest("open-sesame"),
+        "config": {"opening_time": "09:00", "closing_time": "17:00",
+                   "custom_shifts": [{"start": "09:00", "end": "17:00"}],
+                   "staff_req": {"min_weekday": 1, "min_weekend": 1,
+                                 "min_holiday": 1, "min_manager": 0}},
+        "staff_list": [{"id": "s1", "name": "山田"}, {"id": "s2", "name": "佐藤"}],
+        "requests": []}
+    monkeypatch.setattr(db, "enabled", lambda: True)
+    monkeypatch.setattr(db, "get_pool", lambda: FakePool(FakeConn()))
+    monkeypatch.setattr(tenants, "store", store)
+    body = {"contract_id": "c1", "shop_password": "open-sesame",
+            "start_date": "2026-11-02", "end_date": "2026-11-03",
+            "keep_existing": False, "mode": "auto",
+            "freeze_before": "2026-11-01", "persist": False,
+            "organization_id": "org-1"}
+    client = TestClient(main.app)
+    res = client.post("/check", json=body)
+    assert res.status_code == 200 and res.json()["status"] == "success"
+    res = client.post("/generate", json=body)
+    assert res.status_code == 200
+    assert {s["date"] for s in res.json()["shifts"]} == {"2026-11-02", "2026-11-03"}
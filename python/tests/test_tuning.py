@@ -0,0 +1,68 @@
+import contextlib
+import io
+
+import pytest
+
+import tuning
+from scheduler import ShiftScheduler
+
+TABLE = {
+    "buckets": [
+        {"max_options": 50, "threads": 1, "time_limit": 7, "gap": 0.02},
+        {"max_options": None, "threads": 64, "time_limit": 90, "gap": None},
+    ],
+    "model": {"intercept": -2.0, "coef": {"log_options": 1.0},
+              "residual_std": 0.5},
+}
+CONFIG = {"opening_time": "09:00", "closing_time": "17:00",
+          "custom_shifts": [{"start": "09:00", "end": "13:00"},
+                            {"start": "13:00", "end": "17:00"}],
+          "staff_req": {"min_weekday": 1, "min_manager": 0}}
+
+
+@pytest.fixture(autouse=True)
+def table(monkeypatch):
+    monkeypatch.setattr(tuning, "_table", TABLE)
+
+
+def _scheduler(n_staff, days, **config):
+    dates = ["2026-11-{:02d}".format(d) for d in range(2, 2 + days)]
+    staff = [{"id": "s{}".format(i)} for i in range(n_staff)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        return ShiftScheduler(staff, dict(CONFIG, **config), dates, [])
+
+
+def test_bucket_follows_the_number_of_options():
+    small = tuning.plan(_scheduler(2, 5))
+    assert small["features"]["options"] == 2 * 5 * 2
+    assert (small["time_limit"], small["threads"], small["gap"]) == (7.0, 1, 0.02)
+
+    large = tuning.plan(_scheduler(10, 14))
+    assert large["time_limit"] == 90.0 and large["gap"] is None
+    # スレッド数はコア数で頭打ち
+    assert 1 <= large["threads"] <= 64
+
+    # 予想時間は選択肢が多いほど長く、時間上限で頭打ち
+    assert small["predicted"]["seconds"] < large["predicted"]["seconds"] <= 90
+    assert small["predicted"]["low"] <= small["predicted"]["seconds"] <= \
+        small["predicted"]["high"]
+
+
+def test_explicit_settings_win_and_tune_applies_them():
+    sch = _scheduler(2, 5, solver_time_limit=3, solver_threads=1)
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = tuning.tune(sch)
+    assert result["time_limit"] == 3.0
+    assert (sch.time_limit, sch.solver_threads, sch.solver_gap) == (3.0, 1, 0.02)
+
+
+def test_solve_uses_the_tuned_settings_unless_disabled():
+    sch = _scheduler(2, 5)
+    with contextlib.redirect_stdout(io.StringIO()):
+        sch.solve()
+    assert sch.tuning["time_limit"] == 7.0 and sch.solver_gap == 0.02
+
+    sch = _scheduler(2, 5, auto_tune=False)
+    with contextlib.redirect_stdout(io.StringIO()):
+        sch.solve()
+    assert sch.tuning is None and sch.solver_gap is None
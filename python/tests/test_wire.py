@@ -0,0 +1,82 @@
+import gzip
+import json
+
+from fastapi.testclient import TestClient
+
+import main
+import wire
+
+DATES = ["2026-11-02", "2026-11-03"]
+STAFF = [{"id": "s0", "name": "S0", "role": "manager"},
+         {"id": "s1", "name": "S1", "role": "staff"},
+         {"id": "s2", "name": "S2", "role": "staff"}]
+CONFIG = {"opening_time": "09:00", "closing_time": "17:00",
+          "custom_shifts": [{"start": "09:00", "end": "13:00"},
+                            {"start": "13:00", "end": "17:00"}],
+          "staff_req": {"min_weekday": 2, "min_manager": 1}}
+
+
+def test_columnar_shifts_round_trip():
+    shifts = [
+        {"staff_id": "s0", "date": DATES[0], "start_time": "09:00",
+         "end_time": "17:30", "break_minutes": 60},
+        {"staff_id": "s1", "date": DATES[0], "start_time": "13:15",
+         "end_time": "22:00", "break_minutes": 0,
+         "overtime": True, "overtime_hours": 0.5},
+        {"staff_id": "s0", "date": DATES[1], "start_time": "09:00",
+         "end_time": "13:00", "break_minutes": 0},
+    ]
+    block = wire.encode_shifts(shifts)
+    assert block["staff_ids"] == ["s0", "s1"] and block["staff"] == [0, 1, 0]
+    assert wire.decode_shifts(json.loads(wire.dumps(block))) == shifts
+
+
+def _post(headers, body):
+    return TestClient(main.app).post("/generate", content=body, headers=headers)
+
+
+def test_columnar_request_and_response_match_json():
+    plain = {"staff_list": STAFF, "config": CONFIG, "dates": DATES}
+    expected = _post({"Content-Type": wire.JSON}, json.dumps(plain)).json()
+    assert expected["status"] == "success" and expected["shifts"]
+
+    columnar = {"staff": {"columns": ["id", "name", "role"],
+                          "rows": [[s["id"], s["name"], s["role"]] for s in STAFF]},
+                "config": CONFIG, "dates": DATES}
+    res = _post({"Content-Type": wire.COLUMNAR, "Accept": wire.COLUMNAR},
+                json.dumps(columnar))
+    assert res.headers["content-type"] == wire.COLUMNAR
+    got = res.json()
+    assert isinstance(got["shifts"], dict)
+    assert wire.decode_shifts(got["shifts"]) == expected["shifts"]
+
+
+class _Request:
+
+    def __init__(self, headers):
+        self.headers = headers
+
+
+def test_large_responses_are_compressed():
+    payload = {"status": "success", "shifts": [
+        {"staff_id": "s{}".format(i % 9), "date": DATES[i % 2],
+         "start_time": "09:00", "end_time": "17:00", "break_minutes": 60}
+        for i in range(200)]}
+    res = wire.respond(_Request({"accept-encoding": "gzip, deflate"}), payload)
+    assert res.headers["content-encoding"] == "gzip"
+    assert json.loads(gzip.decompress(res.body)) == payload
+
+    res = wire.respond(_Request({"accept-encoding": "gzip"}), {"status": "ok"})
+    assert "content-encoding" not in res.headers
+
+
+def test_encoding_follows_q_values():
+    body = b"x" * 2048
+    for header, expected in [("br;q=0, gzip", "gzip"),
+                             ("gzip;q=0", None),
+                             ("gzip;q=1.0, br;q=0.5", "gzip"),
+                             ("gzip, br", "br"),
+                             ("*;q=0.5, br;q=0", "gzip"),
+                             ("identity", None),
+                             ("", None)]:
+        assert wire._compress(body, header)[1] == expected, header
@@ -0,0 +1,145 @@
+import json
+import math
+import os
+import time
+
+# インスタンスの特徴量からソルバー設定 (スレッド数・時間上限・ギャップ) と
+# 予想ソルブ時間を決める。
+#   - 特徴量: スタッフ数, 期間, 勤務パターン数, 変数の数 (選択肢の数),
+#     1スロットあたりの必要人数, 新人の割合, 需要 / 供給 (人時), 下界の不足率
+#   - 設定は tuning_table.json (bench_tuning.py で計測して作る表) の
+#     変数の数の区分から選ぶ。表がなければ DEFAULT_TABLE
+#   - 予想時間は log(秒) の線形回帰。UI が長い計算の前に警告を出すのに使う
+# config の solver_time_limit / solver_threads が指定されていればそちらを優先する。
+# auto_tune: false で無効 (従来どおり 120 秒・スレッド指定なし)
+
+TABLE_PATH = os.environ.get(
+    "RAKUSHIFT_TUNING_TABLE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "tuning_table.json"))
+
+# 予想時間がこれを超えたら warn=True (UI で確認を出す)
+WARN_SECONDS = float(os.environ.get("RAKUSHIFT_TUNING_WARN_SECONDS", "20"))
+
+FEATURES = ("log_options", "log_work_days", "tightness", "rookie_ratio",
+            "slot_density", "shortage_ratio")
+
+DEFAULT_TABLE = {
+    "buckets": [
+        {"max_options": 3000, "threads": 1, "time_limit": 30, "gap": None},
+        {"max_options": 15000, "threads": 2, "time_limit": 60, "gap": None},
+        {"max_options": None, "threads": 4, "time_limit": 120, "gap": None},
+    ],
+    # log(秒) = intercept + Σ coef * 特徴量
+    "model": {"intercept": -6.0,
+              "coef": {"log_options": 0.9, "tightness": 1.0},
+              "residual_std": 0.8},
+}
+
+_table = None
+
+
+def load_table():
+    global _table
+    if _table is None:
+        try:
+            with open(TABLE_PATH, encoding="utf-8") as f:
+                _table = json.load(f)
+        except (OSError, ValueError):
+            _table = DEFAULT_TABLE
+    return _table
+
+
+def features(sch, bound=None):
+    started = time.perf_counter()
+    work = [d for d in sch.dates if sch._get_day_type(d) != "closed"]
+    usable = [st for st in sch.staff_table if st.max_days > 0 and st.max_hours > 0]
+    options = 0
+    demand = 0.0
+    open_slots = 0
+    for d in work:
+        # 変数の数の見積もり (presolve 前・確定済みの日も含む)
+        per_staff = len(sch.option_catalog.options(*sch._day_window(d)))
+        options += per_staff * sum(1 for st in usable if d not in st.ng)
+        reqs = sch._build_slot_requirements(d)
+        demand += sum(reqs.values()) * sch.slot_hours
+        open_slots += len(reqs)
+    weeks = max(1.0, len(sch.dates) / 7.0)
+    supply = sum(min(st.max_days * weeks, len(work)) * st.max_hours
+                 for st in usable)
+    staff = len(sch.staff_table)
+    shortage = (bound or {}).get("lower_bound_hours") or 0.0
+    return {
+        "staff": staff,
+        "usable_staff": len(usable),
+        "days": len(sch.dates),
+        "work_days": len(work),
+        "patterns": len(sch.shift_patterns),
+        "options": options,
+        "log_options": math.log1p(options),
+        "log_work_days": math.log1p(len(work)),
+        "slot_density": (round(demand / (open_slots * sch.slot_hours), 3)
+                         if open_slots else 0.0),
+        "rookie_ratio": round(len(sch._rookie_ids) / staff, 3) if staff else 0.0,
+        "tightness": round(demand / supply, 3) if supply else 0.0,
+        "shortage_ratio": round(shortage / demand, 3) if demand else 0.0,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def predict_seconds(feats, table=None):
+    model = (table or load_table())["model"]
+    log_t = model["intercept"] + sum(
+        c * feats.get(name, 0.0) for name, c in model["coef"].items())
+    spread = model.get("residual_std", 0.0)
+    return {
+        "seconds": round(math.exp(log_t), 1),
+        # 回帰の残差から 1σ の幅
+        "low": round(math.exp(log_t - spread), 1),
+        "high": round(math.exp(log_t + spread), 1),
+    }
+
+
+def choose(feats, table=None):
+    table = table or load_table()
+    for bucket in table["buckets"]:
+        if bucket["max_options"] is None or feats["options"] <= bucket["max_options"]:
+            return bucket
+    return table["buckets"][-1]
+
+
+def plan(sch, bound=None):
+    # 特徴量から設定と予想時間を決める (sch は書き換えない。/check からも使う)
+    feats = features(sch, bound)
+    bucket = choose(feats)
+    cfg = sch.config
+    threads = cfg.get("solver_threads") or bucket["threads"]
+    threads = max(1, min(int(threads), os.cpu_count() or 1))
+    limit = cfg.get("solver_time_limit")
+    limit = float(bucket["time_limit"] if limit is None else limit)
+    prediction = predict_seconds(feats)
+    prediction["seconds"] = min(prediction["seconds"], limit)
+    prediction["warn"] = prediction["seconds"] >= WARN_SECONDS
+    return {
+        "threads": threads,
+        "time_limit": limit,
+        "gap": bucket.get("gap"),
+        "predicted": prediction,
+        "features": {k: feats[k] for k in (
+            "staff", "days", "work_days", "patterns", "options",
+            "slot_density", "rookie_ratio", "tightness", "shortage_ratio")},
+        "elapsed_ms": feats["elapsed_ms"],
+    }
+
+
+def tune(sch, bound=None):
+    # plan の設定を sch (time_limit / solver_threads / solver_gap) に反映する
+    result = plan(sch, bound)
+    sch.time_limit = result["time_limit"]
+    sch.solver_threads = result["threads"]
+    sch.solver_gap = result["gap"]
+    print("[Tuning] options={} tightness={} -> threads={} limit={:.0f}s"
+          " predicted={}s ({:.1f}ms)".format(
+              result["features"]["options"], result["features"]["tightness"],
+              result["threads"], result["time_limit"],
+              result["predicted"]["seconds"], result["elapsed_ms"]))
+    return result
@@ -0,0 +1,69 @@
+import os
+import time
+
+# 起動直後(スケールアウト直後)の初回リクエストが重くならないよう、
+# トラフィックを受ける前にソルバーと各種キャッシュを温めておく
+
+IMPORT_BUDGET_MS = float(os.environ.get("RAKUSHIFT_IMPORT_BUDGET_MS", "500"))
+
+STATS = {
+    "import_ms": None,
+    "import_budget_ms": IMPORT_BUDGET_MS,
+    "warmup_ms": None,
+    "pulp_import_ms": None,
+    "cbc_available": None,
+    "first_solve_ms": None,
+}
+
+_WARMUP_STAFF = [
+    {"id": "w1", "name": "warmup1", "role": "manager", "max_days_week": 5},
+    {"id": "w2", "name": "warmup2", "role": "staff", "max_days_week": 5},
+]
+_WARMUP_CONFIG = {
+    "opening_time": "09:00",
+    "closing_time": "13:00",
+    "staff_req": {"min_weekday": 1, "min_weekend": 1,
+                  "min_holiday": 1, "min_manager": 1},
+}
+_WARMUP_DATES = ["2024-01-01", "2024-01-02"]
+
+
+def enabled():
+    return os.environ.get("RAKUSHIFT_WARMUP", "1") not in ("0", "false", "off")
+
+
+def record_import(started):
+    ms = (time.perf_counter() - started) * 1000
+    STATS["import_ms"] = round(ms, 1)
+    if ms > IMPORT_BUDGET_MS:
+        print("[Startup] import {:.0f}ms exceeds budget {:.0f}ms".format(
+            ms, IMPORT_BUDGET_MS))
+    else:
+        print("[Startup] import {:.0f}ms (budget {:.0f}ms)".format(
+            ms, IMPORT_BUDGET_MS))
+
+
+def warm_up():
+    from scheduler import ShiftScheduler, _load_pulp
+
+    t0 = time.perf_counter()
+    pulp = _load_pulp()
+    t1 = time.perf_counter()
+    STATS["pulp_import_ms"] = round((t1 - t0) * 1000, 1)
+
+    # CBC バイナリの探索と初回起動(ページキャッシュへの読み込み)を済ませる
+    STATS["cbc_available"] = bool(pulp.PULP_CBC_CMD(msg=0).available())
+
+    t2 = time.perf_counter()
+    try:
+        sch = ShiftScheduler(_WARMUP_STAFF, _WARMUP_CONFIG, _WARMUP_DATES)
+        sch.pre_check()
+        sch.solve()
+    except Exception as e:
+        print("[Warmup Error] {}".format(e))
+    t3 = time.perf_counter()
+    STATS["first_solve_ms"] = round((t3 - t2) * 1000, 1)
+    STATS["warmup_ms"] = round((t3 - t0) * 1000, 1)
+    print("[Startup] warm-up {:.0f}ms (pulp {:.0f}ms, solve {:.0f}ms)".format(
+        STATS["warmup_ms"], STATS["pulp_import_ms"], STATS["first_solve_ms"]))
+    return STATS
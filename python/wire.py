@@ -0,0 +1,205 @@
+import gzip
+import json
+
+from fastapi import Response
+
+# エンジンAPIの通信形式
+#   application/json                          : 従来どおりのオブジェクト配列
+#   application/vnd.rakushift.columnar+json   : 列指向(辞書 + 整数インデックス配列)
+#   application/msgpack                       : 列指向を MessagePack で
+# 大きなレスポンスは Accept-Encoding に応じて brotli / gzip で圧縮する
+
+JSON = "application/json"
+COLUMNAR = "application/vnd.rakushift.columnar+json"
+MSGPACK = "application/msgpack"
+
+COMPRESS_MIN_BYTES = 1024
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False,
+                      separators=(",", ":")).encode("utf-8")
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _media(value):
+    return (value or "").split(";")[0].strip().lower()
+
+
+def _to_minutes(value):
+    try:
+        h, m = str(value).split(":")[:2]
+        return int(h) * 60 + int(m)
+    except Exception:
+        return 0
+
+
+def _from_minutes(mins):
+    return "{:02d}:{:02d}".format(int(mins) // 60, int(mins) % 60)
+
+
+# ---------- シフト配列 <-> 列指向ブロック ----------
+
+def encode_shifts(shifts):
+    staff_ids, staff_idx = [], {}
+    dates, date_idx = [], {}
+    block = {"staff_ids": staff_ids, "dates": dates, "staff": [], "date": [],
+             "start": [], "end": [], "break": []}
+    overtime = []
+    for s in shifts:
+        sid, d = s["staff_id"], s["date"]
+        if sid not in staff_idx:
+            staff_idx[sid] = len(staff_ids)
+            staff_ids.append(sid)
+        if d not in date_idx:
+            date_idx[d] = len(dates)
+            dates.append(d)
+        block["staff"].append(staff_idx[sid])
+        block["date"].append(date_idx[d])
+        block["start"].append(_to_minutes(s["start_time"]))
+        block["end"].append(_to_minutes(s["end_time"]))
+        block["break"].append(int(s.get("break_minutes") or 0))
+        overtime.append(s.get("overtime_hours", 0))
+    if any(overtime):
+        block["overtime_hours"] = overtime
+    return block
+
+
+def decode_shifts(block, minutes=False):
+    # minutes=True なら start_min / end_min も付けて、エンジンでの時刻の再解析を省く
+    if isinstance(block, list):
+        return block
+    staff_ids = block.get("staff_ids", [])
+    dates = block.get("dates", [])
+    overtime = block.get("overtime_hours")
+    shifts = []
+    for i, si in enumerate(block.get("staff", [])):
+        entry = {
+            "staff_id": staff_ids[si],
+            "date": dates[block["date"][i]],
+            "start_time": _from_minutes(block["start"][i]),
+            "end_time": _from_minutes(block["end"][i]),
+            "break_minutes": block["break"][i],
+        }
+        if minutes:
+            entry["start_min"] = block["start"][i]
+            entry["end_min"] = block["end"][i]
+        if overtime and overtime[i]:
+            entry["overtime"] = True
+            entry["overtime_hours"] = overtime[i]
+        shifts.append(entry)
+    return shifts
+
+
+def decode_table(table):
+    # {"columns": [...], "rows": [[...], ...]} -> [{...}, ...]
+    if isinstance(table, list):
+        return table
+    cols = table.get("columns", [])
+    return [dict(zip(cols, row)) for row in table.get("rows", [])]
+
+
+# ---------- リクエスト ----------
+
+async def read_request(request, model):
+    # 型の検証と変換は schemas のモデルで一度だけ行う。
+    # 通常の JSON は dict を経由せずバイト列から直接検証する (pydantic-core)
+    body = await request.body()
+    media = _media(request.headers.get("content-type"))
+    if media not in (COLUMNAR, MSGPACK):
+        return model.model_validate_json(body) if body else model()
+    if media == MSGPACK:
+        import msgpack
+        data = msgpack.unpackb(body, raw=False)
+    else:
+        data = loads(body) if body else {}
+    if "staff" in data and "staff_list" not in data:
+        data["staff_list"] = decode_table(data.pop("staff"))
+    for key in ("requests",):
+        if key in data:
+            data[key] = decode_table(data[key])
+    for key in ("fixed_shifts", "shifts", "hint_shifts"):
+        if key in data:
+            data[key] = decode_shifts(data[key],
+                                      minutes=key == "fixed_shifts")
+    return model.model_validate(data)
+
+
+# ---------- レスポンス ----------
+
+def respond(request, payload, status_code=200, headers=None):
+    accept = _media(request.headers.get("accept"))
+    if accept in (COLUMNAR, MSGPACK):
+        payload = dict(payload)
+        if isinstance(payload.get("shifts"), list):
+            payload["shifts"] = encode_shifts(payload["shifts"])
+        if payload.get("alternatives"):
+            payload["alternatives"] = [
+                dict(alt, shifts=encode_shifts(alt["shifts"]))
+                for alt in payload["alternatives"]]
+    if accept == MSGPACK:
+        import msgpack
+        body = msgpack.packb(payload, use_bin_type=True)
+        media_type = MSGPACK
+    else:
+        body = dumps(payload)
+        media_type = COLUMNAR if accept == COLUMNAR else JSON
+
+    headers = dict(headers or {})
+    headers["Vary"] = "Accept, Accept-Encoding"
+    if len(body) >= COMPRESS_MIN_BYTES:
+        body, encoding = _compress(
+            body, request.headers.get("accept-encoding", ""))
+        if encoding:
+            headers["Content-Encoding"] = encoding
+    return Response(content=body, status_code=status_code,
+                    media_type=media_type, headers=headers)
+
+
+def _compress(body, accept_encoding):
+    # q の高い方式から使う。同じ q なら br を先に。q=0 は「使わない」
+    weights = _accepted(accept_encoding)
+    other = weights.get("*", 0.0)
+    for encoding in sorted(("br", "gzip"), key=lambda e: -weights.get(e, other)):
+        if weights.get(encoding, other) <= 0:
+            continue
+        if encoding == "br":
+            try:
+                import brotli
+            except ImportError:
+                continue
+            return brotli.compress(body, quality=5), "br"
+        return gzip.compress(body, compresslevel=6), "gzip"
+    return body, None
+
+
+def _accepted(accept_encoding):
+    # "br;q=0, gzip" -> {"br": 0.0, "gzip": 1.0} 。読めない q は 0 とみなす
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name] = q
+    return weights
@@ -13,6 +13,9 @@ DROP TABLE IF EXISTS organizations CASCADE;
 DROP FUNCTION IF EXISTS create_tenant CASCADE;
 DROP FUNCTION IF EXISTS is_subscription_active CASCADE;
 DROP FUNCTION IF EXISTS handle_new_user CASCADE;
+DROP FUNCTION IF EXISTS bump_config_version CASCADE;
+DROP FUNCTION IF EXISTS notify_tenant_change CASCADE;
+DROP FUNCTION IF EXISTS touch_tenant_version CASCADE;
 
 -- 2. テーブル定義
 
@@ -64,7 +67,10 @@ CREATE TABLE config (
     openai_model TEXT,
     gemini_api_key TEXT,
     gemini_model TEXT,
-    llm_provider TEXT DEFAULT 'openai'
+    llm_provider TEXT DEFAULT 'openai',
+
+    -- 計算エンジンのキャッシュ用: config / staff / 承認済み requests の変更で +1
+    data_version BIGINT NOT NULL DEFAULT 0
 );
 
 CREATE TABLE staff (
@@ -205,5 +211,47 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql SECURITY DEFINER;
 
--- 7. 完了通知
+-- 7. 計算エンジンのテナントキャッシュ無効化
+-- config / staff / 承認済み requests が変わったら config.data_version を +1 し、
+-- NOTIFY rakushift_tenant, '<contract_id>' を送る (python/tenants.py が LISTEN)
+CREATE OR REPLACE FUNCTION bump_config_version() RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.data_version = OLD.data_version THEN
+        NEW.data_version := OLD.data_version + 1;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION notify_tenant_change() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('rakushift_tenant', NEW.contract_id);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION touch_tenant_version() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'staff' THEN
+        UPDATE config SET data_version = data_version + 1
+        WHERE contract_id IN (NEW.contract_id, OLD.contract_id);
+    ELSIF NEW.status = 'approved' OR OLD.status = 'approved' THEN
+        -- requests は承認済みのものだけがエンジンの入力になる
+        UPDATE config SET data_version = data_version + 1
+        WHERE organization_id IN (NEW.organization_id, OLD.organization_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE TRIGGER config_version BEFORE UPDATE ON config
+    FOR EACH ROW EXECUTE FUNCTION bump_config_version();
+CREATE TRIGGER config_notify AFTER UPDATE ON config
+    FOR EACH ROW EXECUTE FUNCTION notify_tenant_change();
+CREATE TRIGGER staff_touch AFTER INSERT OR UPDATE OR DELETE ON staff
+    FOR EACH ROW EXECUTE FUNCTION touch_tenant_version();
+CREATE TRIGGER requests_touch AFTER INSERT OR UPDATE OR DELETE ON requests
+    FOR EACH ROW EXECUTE FUNCTION touch_tenant_version();
+
+-- 8. 完了通知
 NOTIFY pgrst, 'reload schema';